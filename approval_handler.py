@@ -1,127 +1,458 @@
-from ticket import Epic, Issue
-from multipledispatch import dispatch
+from contextlib import contextmanager
+from ticket import Epic, Issue, TicketState, to_state
+from ticket_store import KINDS, KIND_EPIC, KIND_ISSUE
+from tracing import traced
 
 # Create a class to handle approval logic for proposed epics and issues.
 
+KIND_NAMES = {kind: name for name, kind in KINDS.items()}
+PENDING_STATES = (TicketState.UPDATE, TicketState.DELETE, TicketState.ADD)
+
+
+class DispatchTable:
+    """
+    Handlers of one operation by ticket class. A class is resolved once through its MRO (so
+    subclasses such as TicketStore views use their base class's handler) and then cached.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.handlers = {}
+        self._resolved = {}
+
+    def register(self, ticket_class):
+        def decorator(handler):
+            self.handlers[ticket_class] = handler
+            self._resolved.clear()
+            return handler
+        return decorator
+
+    def resolve(self, ticket_class):
+        try:
+            return self._resolved[ticket_class]
+        except KeyError:
+            pass
+        for base in ticket_class.__mro__:
+            if base in self.handlers:
+                self._resolved[ticket_class] = self.handlers[base]
+                return self.handlers[base]
+        raise NotImplementedError(f"Could not find signature for {self.name}: <{ticket_class.__name__}>")
+
 class ApprovalHandler:
     """
     A class to handle approval logic for proposed epics and issues.
     """
-    def __init__(self):
-        # Store the current state of the tickets
-        self.tickets = {}
-        self.new_tickets = {}
+    _add_ticket = DispatchTable("add_ticket")
+    _approve_ticket = DispatchTable("approve_ticket")
+    _reject_ticket = DispatchTable("reject_ticket")
+    _modify_ticket = DispatchTable("modify_ticket")
+
+    def __init__(self, store=None):
+        """
+        Args:
+            store (ApprovalStore): Optional persistent backing store (see approval_store.py). The
+                tickets are then loaded from it as they are accessed, and every change is saved to
+                it when the session making the change ends (see session()).
+        """
+        self.store = store
+        # (kind, id) -> ticket, for every ticket the handler holds (with a store: has loaded)
+        self.index = {}
+        # Secondary indexes: (kind, state) -> {id: ticket} and epic id -> {id: issue}. Tickets report
+        # their state and epic changes to the handler, so these stay in sync however the change is made.
+        self.by_state = {(kind, state): {} for kind in KINDS.values() for state in TicketState}
+        self.by_epic = {}
+        # Ids of the issues proposed as new ("ADD") that have not been approved, modified or rejected yet
+        self.new_issue_ids = set()
+        # One bound method shared by every indexed ticket
+        self._observer = self._on_transition
+        # Changes not saved to the store yet: (kind, id) -> ticket, and the (kind, id) removed
+        self._changed = {}
+        self._removed = set()
+        # Changes written into the store's open transaction but not committed yet; they are queued
+        # again if the transaction is rolled back, so memory and disk cannot silently diverge
+        self._flushed_changed = {}
+        self._flushed_removed = set()
+        self._sessions = 0
+
+    @property
+    def tickets(self) -> dict:
+        """
+        The tickets keyed as "epic_<id>" / "issue_<id>", except the new issues still pending.
+        With a store, this loads every stored ticket.
+        """
+        if self.store is not None:
+            self.find()
+        return {
+            f"{KIND_NAMES[kind]}_{ticket_id}": ticket for (kind, ticket_id), ticket in self.index.items()
+            if kind != KIND_ISSUE or ticket_id not in self.new_issue_ids
+        }
+
+    @property
+    def new_tickets(self) -> dict:
+        """
+        The new issues still pending, keyed as "issue_<id>".
+        """
+        if self.store is not None:
+            self._flush()
+            for kind, ticket_id in self.store.select((KIND_ISSUE,), tuple(TicketState), new=True):
+                self._lookup(kind, ticket_id)
+        return {f"issue_{ticket_id}": self.index[KIND_ISSUE, ticket_id] for ticket_id in self.new_issue_ids}
+
+    def _index(self, kind, ticket, changed=True) -> None:
+        # A ticket reports its changes to one observer, so a second handler would leave the first stale
+        if ticket._observer is not None and ticket._observer is not self._observer:
+            raise ValueError(f"{KIND_NAMES[kind].capitalize()} with ID {ticket.id} is held by another ApprovalHandler")
+        self.index[kind, ticket.id] = ticket
+        self.by_state[kind, ticket.state][ticket.id] = ticket
+        if kind == KIND_ISSUE and ticket.epic_id is not None:
+            self.by_epic.setdefault(ticket.epic_id, {})[ticket.id] = ticket
+        ticket._observer = self._observer
+        if self.store is not None:
+            self._removed.discard((kind, ticket.id))
+            if changed:
+                self._changed[kind, ticket.id] = ticket
+
+    def _unindex(self, kind, ticket) -> None:
+        del self.index[kind, ticket.id]
+        del self.by_state[kind, ticket.state][ticket.id]
+        if kind == KIND_ISSUE:
+            self.new_issue_ids.discard(ticket.id)
+            if ticket.epic_id is not None:
+                del self.by_epic[ticket.epic_id][ticket.id]
+        if ticket._observer is self._observer:
+            ticket._observer = None
+        if self.store is not None:
+            self._changed.pop((kind, ticket.id), None)
+            self._removed.add((kind, ticket.id))
+
+    def _on_transition(self, ticket, previous_state, previous_epic_id) -> None:
+        kind = KIND_EPIC if isinstance(ticket, Epic) else KIND_ISSUE
+        # Matched by id, not identity: TicketStore bulk transitions report through a fresh view of
+        # the row, and the indexes keep the object the handler was given
+        ticket = self.index.get((kind, ticket.id))
+        if ticket is None:
+            return
+        if self.store is not None:
+            self._changed[kind, ticket.id] = ticket
+        state = ticket.state
+        if state is not previous_state:
+            del self.by_state[kind, previous_state][ticket.id]
+            self.by_state[kind, state][ticket.id] = ticket
+        if kind == KIND_ISSUE and ticket.epic_id != previous_epic_id:
+            if previous_epic_id is not None:
+                del self.by_epic[previous_epic_id][ticket.id]
+            if ticket.epic_id is not None:
+                self.by_epic.setdefault(ticket.epic_id, {})[ticket.id] = ticket
+
+    def _lookup(self, kind, ticket_id):
+        ticket = self.index.get((kind, ticket_id))
+        if ticket is None and self.store is not None and (kind, ticket_id) not in self._removed:
+            loaded = self.store.load(kind, ticket_id)
+            if loaded is not None:
+                ticket, is_new = loaded
+                self._load(kind, ticket, is_new)
+        return ticket
+
+    def _load(self, kind, ticket, is_new) -> None:
+        # Indexes a ticket read from the store; it is unchanged, so there is nothing to save
+        if is_new:
+            self.new_issue_ids.add(ticket.id)
+        self._index(kind, ticket, changed=False)
+
+    def _exists(self, kind, ticket_id) -> bool:
+        if (kind, ticket_id) in self.index:
+            return True
+        if self.store is None or (kind, ticket_id) in self._removed:
+            return False
+        return self.store.is_new(kind, ticket_id) is not None
+
+    def _holds(self, kind, ticket) -> bool:
+        """
+        Returns whether the handler holds ticket. A stored ticket that is not loaded yet is held
+        through the caller's object from then on.
+        """
+        if (kind, ticket.id) in self.index:
+            return True
+        if self.store is None or (kind, ticket.id) in self._removed:
+            return False
+        is_new = self.store.is_new(kind, ticket.id)
+        if is_new is None:
+            return False
+        self._load(kind, ticket, is_new)
+        return True
+
+    def get(self, kind: str, ticket_id: int) -> Epic | Issue | None:
+        """
+        Returns the ticket of the given kind ("epic" or "issue") and id, or None.
+        """
+        return self._lookup(KINDS[kind], ticket_id)
+
+    # Persistence
+
+    @contextmanager
+    def session(self):
+        """
+        Groups the changes made inside into one transaction of the store, committed when the
+        outermost session ends. Each add/approve/reject/modify/remove call and each bulk
+        approval runs in a session of its own unless one is already open. Changes made directly
+        to the tickets (e.g. propose_update) are saved by the next commit.
+        """
+        self._sessions += 1
+        try:
+            yield self
+        finally:
+            self._sessions -= 1
+            if self._sessions == 0:
+                self.commit()
+
+    def _in_session(self, handler, *args, **kwargs):
+        with self.session():
+            return handler(self, *args, **kwargs)
+
+    def _flush(self) -> None:
+        # Writes the pending changes into the open transaction, so queries of the store see them
+        if self._changed or self._removed:
+            new_issue_ids = self.new_issue_ids
+            try:
+                self.store.write(
+                    [(kind, ticket, kind == KIND_ISSUE and ticket.id in new_issue_ids) for (kind, _), ticket in self._changed.items()],
+                    self._removed,
+                )
+            except Exception as e:
+                self._requeue()
+                raise RuntimeError(f"Saving approval changes failed and the transaction was rolled back; "
+                                   f"{len(self._changed) + len(self._removed)} changes are kept to be saved by the next commit") from e
+            for key in self._removed:
+                self._flushed_changed.pop(key, None)
+            self._flushed_removed -= self._changed.keys()
+            self._flushed_changed.update(self._changed)
+            self._flushed_removed |= self._removed
+            self._changed = {}
+            self._removed = set()
+
+    def _requeue(self) -> None:
+        # The store rolled back its transaction, so the changes flushed into it are pending again.
+        # Pending changes are newer than flushed ones and take precedence.
+        for key, ticket in self._flushed_changed.items():
+            if key not in self._changed and key not in self._removed:
+                self._changed[key] = ticket
+        self._removed |= self._flushed_removed - self._changed.keys()
+        self._flushed_changed = {}
+        self._flushed_removed = set()
+
+    def commit(self) -> None:
+        """
+        Saves every pending change to the store in one transaction. If the transaction fails, it
+        is rolled back, the session's changes stay pending and a RuntimeError is raised.
+        """
+        if self.store is not None:
+            self._flush()
+            try:
+                self.store.commit()
+            except Exception as e:
+                self._requeue()
+                raise RuntimeError(f"Committing approval changes failed and the transaction was rolled back; "
+                                   f"{len(self._changed) + len(self._removed)} changes are kept to be saved by the next commit") from e
+            self._flushed_changed = {}
+            self._flushed_removed = set()
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.commit()
+            self.store.close()
+
+    def find(self, kind: str = None, state=None, epic_id: int = None, predicate=None) -> list:
+        """
+        Returns the tickets matching every given filter, using the secondary indexes.
+
+        Args:
+            kind (str): "epic" or "issue".
+            state (str | TicketState): The ticket state.
+            epic_id (int): The epic the issues belong to.
+            predicate (Callable): Optional test applied to the indexed candidates.
+
+        Returns:
+            list: The matching tickets.
+        """
+        kinds = tuple(KINDS.values()) if kind is None else (KINDS[kind],)
+        states = tuple(TicketState) if state is None else (to_state(state),)
+        if self.store is not None:
+            # The store's indexes cover the tickets that are not loaded yet
+            self._flush()
+            candidates = [self._lookup(k, ticket_id) for k, ticket_id in self.store.select(kinds, states, epic_id)]
+        elif epic_id is not None:
+            # Only issues belong to an epic
+            if KIND_ISSUE not in kinds:
+                return []
+            candidates = [ticket for ticket in self.by_epic.get(epic_id, {}).values() if ticket.state in states]
+        else:
+            candidates = [ticket for k in kinds for s in states for ticket in self.by_state[k, s].values()]
+        if predicate is not None:
+            candidates = [ticket for ticket in candidates if predicate(ticket)]
+        return candidates
+
+    def _pending(self, kind, state, epic_id, predicate) -> list:
+        if state is None:
+            # Approved tickets have no proposal to approve or reject
+            return [
+                ticket for pending_state in PENDING_STATES
+                for ticket in self.find(kind, pending_state, epic_id, predicate)
+            ]
+        return self.find(kind, state, epic_id, predicate)
+
+    @traced("approval.approve_many")
+    def approve_many(self, predicate=None, kind: str = None, state=None, epic_id: int = None) -> int:
+        """
+        Approves the pending proposals of every ticket matching the filters (see find()).
+
+        Returns:
+            int: The number of tickets approved.
+        """
+        with self.session():
+            tickets = self._pending(kind, state, epic_id, predicate)
+            for ticket in tickets:
+                if isinstance(ticket, Issue):
+                    self.new_issue_ids.discard(ticket.id)
+                ticket.accept_proposal()
+        return len(tickets)
+
+    @traced("approval.reject_many")
+    def reject_many(self, predicate=None, kind: str = None, state=None, epic_id: int = None) -> int:
+        """
+        Rejects the pending proposals of every ticket matching the filters (see find()). Rejected
+        new issues are removed from the handler.
+
+        Returns:
+            int: The number of tickets rejected.
+        """
+        with self.session():
+            tickets = self._pending(kind, state, epic_id, predicate)
+            for ticket in tickets:
+                if isinstance(ticket, Issue) and ticket.id in self.new_issue_ids:
+                    self._unindex(KIND_ISSUE, ticket)
+                else:
+                    ticket.reject_proposal()
+        return len(tickets)
+
+    def add_ticket(self, ticket: Epic | Issue):
+        handler = self._add_ticket.resolve(type(ticket))
+        if self.store is None:
+            return handler(self, ticket)
+        return self._in_session(handler, ticket)
 
-    @dispatch(Epic)
-    def add_ticket(self, ticket: Epic):
+    def approve_ticket(self, ticket: Epic | Issue):
+        handler = self._approve_ticket.resolve(type(ticket))
+        if self.store is None:
+            return handler(self, ticket)
+        return self._in_session(handler, ticket)
+
+    def reject_ticket(self, ticket: Epic | Issue):
+        handler = self._reject_ticket.resolve(type(ticket))
+        if self.store is None:
+            return handler(self, ticket)
+        return self._in_session(handler, ticket)
+
+    def modify_ticket(self, ticket: Epic | Issue, *args, **kwargs):
+        """
+        Modifies the proposal of an epic (proposed_content) or an issue (proposed_title, proposed_body).
+        """
+        handler = self._modify_ticket.resolve(type(ticket))
+        if self.store is None:
+            return handler(self, ticket, *args, **kwargs)
+        return self._in_session(handler, ticket, *args, **kwargs)
+
+    @_add_ticket.register(Epic)
+    @traced("approval.add_ticket")
+    def _add_epic(self, ticket: Epic):
         print(f"Adding epic {ticket.id}")
-        if isinstance(ticket, Epic):
-            # Check if the epic is already in the tickets dictionary
-            if f"epic_{ticket.id}" in self.tickets:
-                raise ValueError(f"Epic with ID {ticket.id} already exists in tickets")
-            else:
-                self.tickets[f"epic_{ticket.id}"] = ticket
-
-    @dispatch(Issue)
-    def add_ticket(self, ticket: Issue):
+        # Check if the epic is already in the index
+        if self._exists(KIND_EPIC, ticket.id):
+            raise ValueError(f"Epic with ID {ticket.id} already exists in tickets")
+        self._index(KIND_EPIC, ticket)
+
+    @_add_ticket.register(Issue)
+    @traced("approval.add_ticket")
+    def _add_issue(self, ticket: Issue):
         print(f"Adding issue {ticket.id}")
-        if isinstance(ticket, Issue):
-            # Check if the issue is already in any dictionary
-            if f"issue_{ticket.id}" in self.tickets or f"issue_{ticket.id}" in self.new_tickets:
-                raise ValueError(f"Issue with ID {ticket.id} already exists in tickets or new_tickets")
-            else:
-                if ticket.state == "ADD":
-                    self.new_tickets[f"issue_{ticket.id}"] = ticket
-                else:
-                    self.tickets[f"issue_{ticket.id}"] = ticket
-        
+        # Check if the issue is already in the index
+        if self._exists(KIND_ISSUE, ticket.id):
+            raise ValueError(f"Issue with ID {ticket.id} already exists in tickets or new_tickets")
+        if ticket.state == TicketState.ADD:
+            self.new_issue_ids.add(ticket.id)
+        self._index(KIND_ISSUE, ticket)
+
+    @traced("approval.remove_ticket")
     def remove_ticket(self, ticket: Epic | Issue):
-        if isinstance(ticket, Epic):
-            if f"epic_{ticket.id}" in self.tickets:
-                del self.tickets[f"epic_{ticket.id}"]
-            else:
-                raise ValueError(f"Epic with ID {ticket.id} not found in tickets")
-        elif isinstance(ticket, Issue):
-            if f"issue_{ticket.id}" in self.new_tickets:
-                del self.new_tickets[f"issue_{ticket.id}"]
-            if f"issue_{ticket.id}" in self.tickets:
-                del self.tickets[f"issue_{ticket.id}"]
-            else:
-                raise ValueError(f"Issue with ID {ticket.id} not found in tickets")
-
-    @dispatch(Epic)
-    def approve_ticket(self, ticket: Epic):
-        # Epic tickets will only be in the tickets dictionary
-        # Check if the epic is in the tickets dictionary
-        if f"epic_{ticket.id}" in self.tickets:
+        with self.session():
+            if isinstance(ticket, Epic):
+                if self._holds(KIND_EPIC, ticket):
+                    self._unindex(KIND_EPIC, ticket)
+                else:
+                    raise ValueError(f"Epic with ID {ticket.id} not found in tickets")
+            elif isinstance(ticket, Issue):
+                if self._holds(KIND_ISSUE, ticket):
+                    self._unindex(KIND_ISSUE, ticket)
+                else:
+                    raise ValueError(f"Issue with ID {ticket.id} not found in tickets")
+
+    @_approve_ticket.register(Epic)
+    @traced("approval.approve_ticket")
+    def _approve_epic(self, ticket: Epic):
+        # Check if the epic is in the index
+        if self._holds(KIND_EPIC, ticket):
             ticket.accept_proposal()
         else:
             raise ValueError(f"Epic with ID {ticket.id} not found in tickets")
 
-    @dispatch(Issue)
-    def approve_ticket(self, ticket: Issue):
-        # Existing issue tickets will be in the tickets dictionary
-        # New proposed issue tickets will be in the new_tickets dictionary (with the state "ADD")
-        
-        # Move the new proposed issue ticket from the new_tickets dictionary to the tickets dictionary
-        if f"issue_{ticket.id}" in self.new_tickets:
-            self.tickets[f"issue_{ticket.id}"] = self.new_tickets[f"issue_{ticket.id}"]
-            del self.new_tickets[f"issue_{ticket.id}"]
-        
-        # Check if the issue is in the tickets dictionary
-        if f"issue_{ticket.id}" in self.tickets:
+    @_approve_ticket.register(Issue)
+    @traced("approval.approve_ticket")
+    def _approve_issue(self, ticket: Issue):
+        # A new proposed issue (with the state "ADD") stops being pending once it is approved
+        if self._holds(KIND_ISSUE, ticket):
+            self.new_issue_ids.discard(ticket.id)
             ticket.accept_proposal()
         else:
             raise ValueError(f"Issue with ID {ticket.id} not found in tickets")
-        
-    @dispatch(Epic)
-    def reject_ticket(self, ticket: Epic):
-        # Epic tickets will only be in the tickets dictionary
-        # Check if the epic is in the tickets dictionary
-        if f"epic_{ticket.id}" in self.tickets:
+
+    @_reject_ticket.register(Epic)
+    @traced("approval.reject_ticket")
+    def _reject_epic(self, ticket: Epic):
+        # Check if the epic is in the index
+        if self._holds(KIND_EPIC, ticket):
             ticket.reject_proposal()
         else:
             raise ValueError(f"Epic with ID {ticket.id} not found in tickets")
-        
-    @dispatch(Issue)
-    def reject_ticket(self, ticket: Issue):
-        # Existing issue tickets will be in the tickets dictionary
-        # New proposed issue tickets will be in the new_tickets dictionary (with the state "ADD")
-        
-        # If the issue is in the new_tickets dictionary, delete it
-        if f"issue_{ticket.id}" in self.new_tickets:
-            del self.new_tickets[f"issue_{ticket.id}"]
-        # If the issue is in the tickets dictionary, reject the proposal
-        elif f"issue_{ticket.id}" in self.tickets:
-            ticket.reject_proposal()
-        else:
+
+    @_reject_ticket.register(Issue)
+    @traced("approval.reject_ticket")
+    def _reject_issue(self, ticket: Issue):
+        if not self._holds(KIND_ISSUE, ticket):
             raise ValueError(f"Issue with ID {ticket.id} not found in tickets")
+        # If the issue is a pending new issue, delete it
+        if ticket.id in self.new_issue_ids:
+            self._unindex(KIND_ISSUE, ticket)
+        # If the issue is an existing issue, reject the proposal
+        else:
+            ticket.reject_proposal()
 
-    @dispatch(Epic)
-    def modify_ticket(self, ticket: Epic, proposed_content: str):
-        # Epic tickets will only be in the tickets dictionary
-        # Check if the epic is in the tickets dictionary
-        if f"epic_{ticket.id}" in self.tickets:
+    @_modify_ticket.register(Epic)
+    @traced("approval.modify_ticket")
+    def _modify_epic(self, ticket: Epic, proposed_content: str):
+        # Check if the epic is in the index
+        if self._holds(KIND_EPIC, ticket):
             ticket.modify_proposal(proposed_content)
         else:
             raise ValueError(f"Epic with ID {ticket.id} not found in tickets")
 
-    @dispatch(Issue)
-    def modify_ticket(self, ticket: Issue, proposed_title: str, proposed_body: str):
-        # Existing issue tickets will be in the tickets dictionary
-        # New proposed issue tickets will be in the new_tickets dictionary (with the state "ADD")
-        
-        # If the issue is in the new_tickets dictionary, modify the proposal and move it to the tickets dictionary
-        if f"issue_{ticket.id}" in self.new_tickets:
-            self.tickets[f"issue_{ticket.id}"] = self.new_tickets[f"issue_{ticket.id}"]
-            del self.new_tickets[f"issue_{ticket.id}"]
-
-        # Check if the issue is in the tickets dictionary
-        if f"issue_{ticket.id}" in self.tickets:
+    @_modify_ticket.register(Issue)
+    @traced("approval.modify_ticket")
+    def _modify_issue(self, ticket: Issue, proposed_title: str, proposed_body: str):
+        # A new proposed issue stops being pending once it is modified
+        if self._holds(KIND_ISSUE, ticket):
+            self.new_issue_ids.discard(ticket.id)
             ticket.modify_proposal(proposed_title, proposed_body)
         else:
             raise ValueError(f"Issue with ID {ticket.id} not found in tickets")
-        
+
     def __str__(self):
         return f"""
         --------------------------------
@@ -0,0 +1,199 @@
+import os
+import json
+import sqlite3
+import threading
+from ticket import Epic, Issue
+from ticket_store import KIND_EPIC, KIND_ISSUE
+
+# Persistent backing store for an ApprovalHandler. Every ticket is one row of a SQLite table (in
+# WAL mode), so pending proposals survive a restart. The handler loads tickets lazily, one row by
+# primary key when it is first accessed, and queries by state or epic run against the table's
+# indexes, so opening a large backlog reads nothing up front. The handler collects the tickets
+# changed in an approval session and writes them with executemany in one transaction.
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS tickets (
+        kind INTEGER NOT NULL,
+        id INTEGER NOT NULL,
+        state INTEGER NOT NULL,
+        epic_id INTEGER,
+        current TEXT NOT NULL,
+        proposed TEXT,
+        is_new INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS tickets_by_state ON tickets (kind, state)",
+    "CREATE INDEX IF NOT EXISTS tickets_by_epic ON tickets (epic_id, state)",
+)
+
+# The statements are constant and parameterized, so sqlite3 prepares each one once and reuses it
+_SELECT_TICKET = "SELECT state, epic_id, current, proposed, is_new FROM tickets WHERE kind = ? AND id = ?"
+_SELECT_IS_NEW = "SELECT is_new FROM tickets WHERE kind = ? AND id = ?"
+_UPSERT_TICKET = "INSERT OR REPLACE INTO tickets (kind, id, state, epic_id, current, proposed, is_new) VALUES (?, ?, ?, ?, ?, ?, ?)"
+_DELETE_TICKET = "DELETE FROM tickets WHERE kind = ? AND id = ?"
+
+
+def _dump(values):
+    return None if values is None else json.dumps(values)
+
+def _load(text):
+    return None if text is None else tuple(json.loads(text))
+
+
+class ApprovalStore:
+    """
+    Tickets of an ApprovalHandler saved in a SQLite file.
+    """
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): Path of the SQLite file. Defaults to the APPROVAL_STORE_PATH environment
+                        variable or .agility_cache/approval.sqlite.
+        """
+        self.path = path or os.getenv("APPROVAL_STORE_PATH", ".agility_cache/approval.sqlite")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        # Transactions are managed explicitly, so one session's writes are one transaction
+        self._db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+
+    def load(self, kind, ticket_id):
+        """
+        Reads one ticket.
+
+        Returns:
+            tuple | None: (ticket, is_new), or None if the ticket is not stored.
+        """
+        with self._lock:
+            row = self._db.execute(_SELECT_TICKET, (kind, ticket_id)).fetchone()
+        if row is None:
+            return None
+        state, epic_id, current, proposed, is_new = row
+        if kind == KIND_EPIC:
+            ticket = Epic.restore(ticket_id, state, _load(current), _load(proposed))
+        else:
+            ticket = Issue.restore(ticket_id, state, _load(current), _load(proposed), epic_id)
+        return ticket, bool(is_new)
+
+    def is_new(self, kind, ticket_id):
+        """
+        Returns whether a stored ticket is a pending new issue, or None if it is not stored.
+        """
+        with self._lock:
+            row = self._db.execute(_SELECT_IS_NEW, (kind, ticket_id)).fetchone()
+        return None if row is None else bool(row[0])
+
+    def select(self, kinds, states, epic_id=None, new=None) -> list[tuple]:
+        """
+        Returns the (kind, id) of the stored tickets matching every given filter.
+
+        Args:
+            kinds (tuple[int]): The ticket kinds (KIND_EPIC, KIND_ISSUE).
+            states (tuple[TicketState]): The ticket states.
+            epic_id (int): The epic the issues belong to.
+            new (bool): Only the pending new issues (True) or only the other tickets (False).
+
+        Returns:
+            list[tuple]: The matching keys, ordered by kind and id.
+        """
+        query = f"SELECT kind, id FROM tickets WHERE kind IN ({', '.join('?' * len(kinds))}) AND state IN ({', '.join('?' * len(states))})"
+        params = [*kinds, *map(int, states)]
+        if epic_id is not None:
+            query += " AND epic_id = ?"
+            params.append(epic_id)
+        if new is not None:
+            query += " AND is_new = ?"
+            params.append(int(new))
+        with self._lock:
+            return self._db.execute(query + " ORDER BY kind, id", params).fetchall()
+
+    def write(self, changed, removed) -> None:
+        """
+        Saves changed tickets and deletes removed ones in the current transaction, starting one if
+        needed. Nothing is durable until commit(). If the write fails, the whole transaction
+        (including earlier writes) is rolled back and the error is raised.
+
+        Args:
+            changed (Iterable[tuple]): (kind, ticket, is_new) of the tickets to save.
+            removed (Iterable[tuple]): (kind, id) of the tickets to delete.
+        """
+        rows = [
+            (kind, ticket.id, int(ticket.state), getattr(ticket, "epic_id", None),
+             _dump(ticket._current), _dump(ticket._proposed), int(is_new))
+            for kind, ticket, is_new in changed
+        ]
+        with self._lock:
+            if not self._db.in_transaction:
+                self._db.execute("BEGIN")
+            try:
+                self._db.executemany(_DELETE_TICKET, removed)
+                self._db.executemany(_UPSERT_TICKET, rows)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def commit(self) -> None:
+        """
+        Commits the current transaction. If that fails, the transaction is rolled back and the
+        error is raised.
+        """
+        with self._lock:
+            if self._db.in_transaction:
+                try:
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    if self._db.in_transaction:
+                        self._db.execute("ROLLBACK")
+                    raise
+
+    def close(self) -> None:
+        with self._lock:
+            self.commit()
+            self._db.close()
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+    from approval_handler import ApprovalHandler
+
+    path = os.path.join(tempfile.mkdtemp(), "approval.sqlite")
+    store = ApprovalStore(path)
+    issues = []
+    for index in range(500_000):
+        proposed = (f"Updated {index}", f"Updated body {index}") if index % 3 == 0 else ()
+        issues.append((KIND_ISSUE, Issue.restore(index, "UPDATE" if proposed else "APPROVED", (f"Issue {index}", f"Body {index}"), proposed, index % 1000), False))
+    store.write(issues, ())
+    store.commit()
+    store.close()
+    del issues
+
+    started = time.perf_counter()
+    handler = ApprovalHandler(store=ApprovalStore(path))
+    elapsed = time.perf_counter() - started
+    print(f"Opened a backlog of {len(handler.store)} tickets in {elapsed * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    pending = handler.find(kind="issue", state="UPDATE", epic_id=7)
+    print(f"Loaded {len(pending)} UPDATE issues under epic 7 in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    approved = handler.approve_many(kind="issue", epic_id=7)
+    print(f"Approved {approved} proposals in one transaction in {(time.perf_counter() - started) * 1000:.1f} ms")
+    handler.close()
+
+    handler = ApprovalHandler(store=ApprovalStore(path))
+    print(f"After reopening: {len(handler.find(kind='issue', state='UPDATE', epic_id=7))} UPDATE issues under epic 7")
+    print(handler.get("issue", 2007))
+    handler.close()
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import uuid
+
+# Offline batch submission for bulk generation. Prompts are written into a batch JSONL file,
+# submitted to a batch backend, polled until the batch finishes, and the results are mapped
+# back to the original prompts by custom_id.
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+FINISHED_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def write_batch_file(path, requests) -> None:
+    """
+    Writes (custom_id, body) pairs in the batch input JSONL format.
+    """
+    with open(path, "w", encoding="utf-8") as batch_file:
+        for custom_id, body in requests:
+            batch_file.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body,
+            }, ensure_ascii=False) + "\n")
+
+
+def read_batch_results(lines) -> dict:
+    """
+    Maps custom_id to the response text for each line of a batch output file.
+    Failed requests map to None.
+    """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record["custom_id"]
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            print(f"Warning: Batch request {custom_id} failed: {record.get('error') or response.get('body')}")
+            results[custom_id] = None
+            continue
+        results[custom_id] = response["body"]["choices"][0]["message"]["content"]
+    return results
+
+
+class OpenAIBatchBackend:
+    """
+    Submits batch files through the OpenAI Batch API.
+    """
+    def __init__(self, client=None, completion_window="24h"):
+        if client is None:
+            from clients import get_openai_client
+            client = get_openai_client()
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path) -> str:
+        with open(path, "rb") as batch_file:
+            input_file = self.client.files.create(file=batch_file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id) -> dict:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        if batch.output_file_id:
+            results.update(read_batch_results(self.client.files.content(batch.output_file_id).text.splitlines()))
+        if batch.error_file_id:
+            results.update(read_batch_results(self.client.files.content(batch.error_file_id).text.splitlines()))
+        return results
+
+
+def _default_responder(custom_id, body) -> str:
+    return f"Local batch response for {custom_id}"
+
+
+class LocalBatchBackend:
+    """
+    A file-based stand-in for the batch API, so the batch flow can run and be tested offline.
+    Each request body is answered by responder(custom_id, body) when the batch is first polled.
+    """
+    def __init__(self, directory=".agility_cache/local_batches", responder=_default_responder):
+        self.directory = directory
+        self.responder = responder
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, batch_id, kind) -> str:
+        return os.path.join(self.directory, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, path) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        with open(path, "r", encoding="utf-8") as source, open(self._path(batch_id, "input"), "w", encoding="utf-8") as target:
+            target.write(source.read())
+        return batch_id
+
+    def status(self, batch_id) -> str:
+        output_path = self._path(batch_id, "output")
+        if not os.path.exists(output_path):
+            self._process(batch_id, output_path)
+        return "completed"
+
+    def _process(self, batch_id, output_path) -> None:
+        with open(self._path(batch_id, "input"), "r", encoding="utf-8") as input_file, \
+                open(output_path, "w", encoding="utf-8") as output_file:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                content = self.responder(request["custom_id"], request["body"])
+                output_file.write(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {
+                            "model": request["body"].get("model"),
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                        },
+                    },
+                    "error": None,
+                }, ensure_ascii=False) + "\n")
+
+    def results(self, batch_id) -> dict:
+        with open(self._path(batch_id, "output"), "r", encoding="utf-8") as output_file:
+            return read_batch_results(output_file)
+
+
+def run_batch(backend, requests, directory=".agility_cache/batches", poll_interval=30.0, timeout=None) -> dict:
+    """
+    Writes, submits and polls a batch until it finishes.
+
+    Args:
+        backend: An OpenAIBatchBackend, LocalBatchBackend or any object with submit/status/results.
+        requests (list[tuple[str, dict]]): (custom_id, request body) pairs.
+        directory (str): Where the batch input file is written.
+        poll_interval (float): Seconds between status checks.
+        timeout (float): Optional maximum number of seconds to wait.
+
+    Returns:
+        dict: custom_id -> response text (None for failed requests).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"batch_{uuid.uuid4().hex}.jsonl")
+    write_batch_file(path, requests)
+
+    batch_id = backend.submit(path)
+    started = time.monotonic()
+    while True:
+        status = backend.status(batch_id)
+        if status in FINISHED_STATUSES:
+            break
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"Batch {batch_id} did not finish within {timeout} seconds (status: {status})")
+        time.sleep(poll_interval)
+
+    if status != "completed":
+        raise RuntimeError(f"Batch {batch_id} finished with status {status}")
+    return backend.results(batch_id)
@@ -0,0 +1,509 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import contextlib
+import tracemalloc
+
+# End-to-end benchmark suite for the pipeline, run against the replay backend so no live API
+# calls are made. Each scenario is timed at several ticket counts and reports throughput and
+# p50/p99 latencies. For the concurrent scenarios the latency is that of the request itself; the
+# end-to-end latency, which includes waiting for a concurrency slot, is reported separately.
+# Results can be compared against (or saved as) the checked-in baseline.
+#
+#   python benchmark.py                      # run and compare against benchmark_baseline.json
+#   python benchmark.py --update-baseline    # run and overwrite the baseline
+#   python benchmark.py --compare-parsers    # issue parser microbenchmark against the previous parser
+#   python benchmark.py --ticket-memory      # per-ticket memory against the previous Ticket layout
+#   python benchmark.py --compare-dispatch   # per-call cost of the approval hot path
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import clients
+from replay import ReplayClient, AsyncReplayClient
+from tracing import tracer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_SIZES = (10, 1_000, 100_000)
+# A scenario is flagged when its throughput drops by more than this fraction of the baseline
+REGRESSION_THRESHOLD = 0.4
+
+ISSUE_HEADER = re.compile(r"^Issue (\d+):", re.MULTILINE)
+
+
+def synthetic_responder(model, system_prompt, user_prompt) -> str:
+    """
+    Produces a well-formed response for each prompt type of the pipeline.
+    """
+    if "Current Issues:" in user_prompt:
+        blocks = [
+            f"Issue {issue_id}:\nAction: Update\nProposed Title: Revised issue {issue_id}\nProposed Body:\nRevised body for issue {issue_id}."
+            for issue_id in ISSUE_HEADER.findall(user_prompt)
+        ]
+        blocks.append("New Issue:\nAction: Add\nProposed Title: Front-end integration\nProposed Body:\nWire the new flow into the UI.")
+        blocks.append("Proposal Summary:\nRevised every issue and added one.")
+        return "\n\n".join(blocks)
+    return "Epic:\nDeliver secure multi-factor authentication across all platforms.\n\nSummary:\nDerived from the user prompt."
+
+
+def percentile(values, fraction) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(operations, elapsed, latencies, end_to_end_latencies=None) -> dict:
+    result = {
+        "operations": operations,
+        "seconds": elapsed,
+        "throughput_per_s": operations / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000.0,
+        "p99_ms": percentile(latencies, 0.99) * 1000.0,
+    }
+    if end_to_end_latencies is not None:
+        result["end_to_end_p50_ms"] = percentile(end_to_end_latencies, 0.50) * 1000.0
+        result["end_to_end_p99_ms"] = percentile(end_to_end_latencies, 0.99) * 1000.0
+    return result
+
+
+def _span_latencies(name) -> tuple[list[float], list[float]]:
+    """
+    Returns the request latencies (without the time queued for a concurrency slot) and the
+    end-to-end latencies of the spans called name.
+    """
+    spans = [span for span in tracer.spans() if span.name == name]
+    requests = [span.duration - span.attributes.get("queue_seconds", 0.0) for span in spans]
+    return requests, [span.duration for span in spans]
+
+
+def bench_epic_generation(size) -> dict:
+    import epic_generation
+    requests = [(f"User prompt {i}", f"Project summary {i}") for i in range(size)]
+    tracer.clear()
+    started = time.perf_counter()
+    epic_generation.generate_epics(requests)
+    elapsed = time.perf_counter() - started
+    return summarize(size, elapsed, *_span_latencies("model.aprompt"))
+
+
+def bench_epic_feedback(size) -> dict:
+    import epic_feedback
+    from ticket import Epic
+    requests = [(Epic(epic_content=f"Epic {i}"), f"Feedback {i}", f"Project summary {i}") for i in range(size)]
+    tracer.clear()
+    started = time.perf_counter()
+    epic_feedback.generate_epic_feedback_many(requests)
+    elapsed = time.perf_counter() - started
+    return summarize(size, elapsed, *_span_latencies("model.aprompt"))
+
+
+def bench_issue_feedback(size) -> dict:
+    import issue_feedback
+    from ticket import Issue
+    repetitions = max(3, min(50, 10_000 // size))
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repetitions):
+        issues = [Issue(current_title=f"Issue {i}", current_body=f"Body of issue {i}") for i in range(size)]
+        call_started = time.perf_counter()
+        issue_feedback.generate_proposals_with_feedback("Make every issue more specific.", issues)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return summarize(size * repetitions, elapsed, latencies)
+
+
+def bench_approval(size) -> dict:
+    from approval_handler import ApprovalHandler
+    from ticket import Epic, Issue
+    handler = ApprovalHandler()
+    epic = Epic(epic_content="Benchmark epic")
+    handler.add_ticket(epic)
+    issues = [Issue(current_title=f"Issue {i}", current_body=f"Body {i}", epic_id=epic.id) for i in range(size)]
+
+    latencies = []
+    started = time.perf_counter()
+    for issue in issues:
+        call_started = time.perf_counter()
+        handler.add_ticket(issue)
+        latencies.append(time.perf_counter() - call_started)
+    for index, issue in enumerate(issues):
+        issue.propose_update(f"Updated {index}", f"Updated body {index}")
+        call_started = time.perf_counter()
+        if index % 2:
+            handler.reject_ticket(issue)
+        else:
+            handler.approve_ticket(issue)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return summarize(len(latencies), elapsed, latencies)
+
+
+def bench_approval_bulk(size) -> dict:
+    """
+    Approves or rejects the pending updates of one epic at a time through the indexes, with
+    100 issues per epic. Throughput counts tickets; latencies are per approve_many/reject_many call.
+    """
+    from approval_handler import ApprovalHandler
+    from ticket import Epic, Issue
+    handler = ApprovalHandler()
+    epics = [Epic(epic_content=f"Epic {i}") for i in range(max(1, size // 100))]
+    for epic in epics:
+        handler.add_ticket(epic)
+    for i in range(size):
+        issue = Issue(current_title=f"Issue {i}", current_body=f"Body {i}", epic_id=epics[i % len(epics)].id)
+        handler.add_ticket(issue)
+        issue.propose_update(f"Updated {i}", f"Updated body {i}")
+
+    latencies = []
+    started = time.perf_counter()
+    for index, epic in enumerate(epics):
+        call_started = time.perf_counter()
+        if index % 2:
+            handler.reject_many(kind="issue", state="UPDATE", epic_id=epic.id)
+        else:
+            handler.approve_many(kind="issue", state="UPDATE", epic_id=epic.id)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    assert not handler.find(state="UPDATE")
+    return summarize(size, elapsed, latencies)
+
+
+def synthetic_issue_output(blocks) -> str:
+    """
+    Builds an issue feedback response with the given number of proposal blocks.
+    """
+    parts = []
+    for i in range(blocks):
+        if i % 10 == 9:
+            parts.append(f"New Issue:\nAction: Add\nProposed Title: New issue {i}\nProposed Body:\nDescribe the work for {i}.\nIt spans two lines.")
+        elif i % 10 == 8:
+            parts.append(f"Issue {i}:\nAction: Delete")
+        else:
+            parts.append(f"Issue {i}:\nAction: Update\nProposed Title: Revised issue {i}\nProposed Body:\nRevised body for issue {i}.\nWith acceptance criteria.")
+    parts.append("Proposal Summary:\nRevised every issue.")
+    return "\n\n".join(parts)
+
+
+def legacy_issue_parse(raw_output) -> tuple[dict, list, str]:
+    """
+    The previous IssueParser.parse (blank-line blocks, repeated splits and slices), kept as the
+    reference for the parser microbenchmark.
+    """
+    modifications, new_proposals, proposal_summary = {}, [], ""
+    for block in [block.strip() for block in raw_output.split("\n\n") if block.strip()]:
+        lines = block.splitlines()
+        header = lines[0].strip()
+        if header.startswith("Proposal Summary:"):
+            proposal_summary = "\n".join(line.strip() for line in lines[1:]).strip()
+            continue
+        if not (header.startswith("Issue") or header.startswith("New Issue:")):
+            continue
+        action, title, body_lines = ("Add" if header.startswith("New Issue:") else None), None, []
+        for idx, raw_line in enumerate(lines[1:], start=1):
+            line = raw_line.strip()
+            if line.startswith("Action:"):
+                action = line.split("Action:")[1].strip()
+            elif line.startswith("Proposed Title:"):
+                title = line.split("Proposed Title:")[1].strip()
+            elif line.startswith("Proposed Body:"):
+                text = line[len("Proposed Body:"):].strip()
+                if text:
+                    body_lines.append(text)
+                body_lines.extend([l.strip() for l in lines[idx + 1:]])
+                break
+        proposal = {"action": action, "proposed_title": title, "proposed_body": "\n".join(body_lines).strip()}
+        if header.startswith("New Issue:"):
+            new_proposals.append(proposal)
+        else:
+            modifications[int(header.split()[1].replace(":", ""))] = proposal
+    return modifications, new_proposals, proposal_summary
+
+
+def bench_issue_parser(size) -> dict:
+    from parser import IssueParser
+    from ticket import Issue
+    raw_output = synthetic_issue_output(size)
+    issues = [Issue(current_title=f"Issue {i}", current_body=f"Body {i}") for i in range(size)]
+    repetitions = max(3, min(100, 100_000 // size))
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(repetitions):
+        call_started = time.perf_counter()
+        IssueParser.parse(raw_output, issues[:])
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return summarize(size * repetitions, elapsed, latencies)
+
+
+def legacy_parse_issues(raw_output, issues) -> tuple[list, str]:
+    """
+    The previous path from a response to Issue objects: parse into dicts, then apply them.
+    """
+    from ticket import Issue
+    modifications, new_proposals, proposal_summary = legacy_issue_parse(raw_output)
+    for issue in issues:
+        if issue.get_id() in modifications:
+            modification = modifications[issue.get_id()]
+            action = (modification.get("action") or "").lower()
+            if action == "update":
+                issue.propose_update(modification.get("proposed_title"), modification.get("proposed_body"), state="UPDATE")
+            elif action == "delete":
+                issue.set_state("DELETE")
+    for proposal in new_proposals:
+        new_issue = Issue(current_title=None, current_body=None, state="ADD")
+        new_issue.propose_update(proposal.get("proposed_title"), proposal.get("proposed_body"), state="ADD")
+        issues.append(new_issue)
+    return issues, proposal_summary
+
+
+def compare_issue_parsers(blocks=10_000, rounds=7) -> dict:
+    """
+    Microbenchmark of the single-pass IssueParser against the previous split-based parser on a
+    synthetic response with the given number of blocks. Reports block throughput (best of several
+    rounds) and peak memory allocated, both for parsing into dicts and into Issue objects. The
+    single-pass parser's gain is peak memory; its throughput is on par with the previous parser.
+    """
+    from parser import IssueParser
+    from ticket import Issue
+    issues = [Issue(current_title=f"Issue {i}", current_body=f"Body {i}") for i in range(blocks)]
+    # Refer to the ids the issues actually got
+    raw_output = ISSUE_HEADER.sub(lambda match: f"Issue {int(match.group(1)) + issues[0].get_id()}:", synthetic_issue_output(blocks))
+    assert IssueParser.parse_proposals(raw_output) == legacy_issue_parse(raw_output)
+
+    comparisons = {
+        "dicts": (("legacy", lambda: legacy_issue_parse(raw_output)),
+                  ("single_pass", lambda: IssueParser.parse_proposals(raw_output))),
+        "issues": (("legacy", lambda: legacy_parse_issues(raw_output, issues[:])),
+                   ("single_pass", lambda: IssueParser.parse(raw_output, issues[:]))),
+    }
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for target, parsers in comparisons.items():
+            best = {name: float("inf") for name, _ in parsers}
+            # Alternate the parsers so that noise on the machine affects both alike
+            for _ in range(rounds):
+                for name, parse in parsers:
+                    started = time.perf_counter()
+                    parse()
+                    best[name] = min(best[name], time.perf_counter() - started)
+            for name, parse in parsers:
+                tracemalloc.start()
+                parse()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results[f"{target}/{name}"] = {"blocks_per_s": blocks / best[name], "peak_bytes": peak}
+
+    for key, result in results.items():
+        print(f"{key:>20} {blocks:>8} blocks  {result['blocks_per_s']:>12.0f} blocks/s  "
+              f"peak {result['peak_bytes'] / 1024:>9.1f} KiB", flush=True)
+    return results
+
+
+class LegacyIssue:
+    """
+    The previous Issue layout: an instance __dict__, content dicts and a string state.
+    """
+    def __init__(self, ticket_id, current_title, current_body, state="APPROVED", epic_id=None):
+        self.id = ticket_id
+        self.current_content = {"issue_title": current_title, "issue_body": current_body}
+        self.proposed_content = {}
+        self.state = state
+        self.epic_id = epic_id
+
+
+def _allocated_per_ticket(make, contents) -> float:
+    tracemalloc.start()
+    tickets = [make(title, body) for title, body in contents]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # The list holding the tickets is the same for both layouts
+    return (allocated - sys.getsizeof(tickets)) / len(tickets)
+
+
+def compare_ticket_memory(count=200_000) -> dict:
+    """
+    Measures the bytes allocated per Issue for an imported backlog of count issues, half of them
+    with a pending update, against the previous dict-based layout. The title and body strings are
+    created beforehand, so only the ticket representation itself is measured.
+    """
+    from ticket import Issue
+    contents = [(f"Issue {i}", f"Body of issue {i}") for i in range(count)]
+    # Large ids, as the slotted issues get from the shared counter
+    legacy_ids = iter(range(10**6, 10**6 + count))
+
+    def make_legacy(title, body):
+        issue = LegacyIssue(next(legacy_ids), title, body, epic_id=1)
+        if len(title) % 2:
+            issue.proposed_content = {"issue_title": title, "issue_body": body}
+            issue.state = "UPDATE"
+        return issue
+
+    def make_slotted(title, body):
+        issue = Issue(current_title=title, current_body=body, epic_id=1)
+        if len(title) % 2:
+            issue.propose_update(title, body)
+        return issue
+
+    results = {
+        "legacy": _allocated_per_ticket(make_legacy, contents),
+        "slotted": _allocated_per_ticket(make_slotted, contents),
+    }
+    for name, per_ticket in results.items():
+        print(f"{name:>10} {count:>8} issues  {per_ticket:>8.1f} bytes/ticket", flush=True)
+    print(f"{'saving':>10} {1 - results['slotted'] / results['legacy']:>26.0%}")
+    return results
+
+
+def compare_dispatch(calls=200_000, rounds=5) -> dict:
+    """
+    Measures the per-call cost of ApprovalHandler.approve_ticket (tracing disabled) on an epic
+    without a pending proposal, so the call is dispatch, tracing wrapper and index check only.
+    Compared with calling the resolved handler directly and, if it is installed, with the
+    previous multipledispatch-based dispatch.
+    """
+    from approval_handler import ApprovalHandler
+    from ticket import Epic, Issue
+    handler = ApprovalHandler()
+    epic = Epic(epic_content="Dispatch epic")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        handler.add_ticket(epic)
+
+    candidates = {
+        "table": lambda: handler.approve_ticket(epic),
+        "direct": lambda: handler._approve_epic(epic),
+    }
+    try:
+        from multipledispatch import dispatch
+    except ImportError:
+        dispatch = None
+    if dispatch is not None:
+        class MultipleDispatchHandler(ApprovalHandler):
+            @dispatch(Epic)
+            def approve_ticket(self, ticket):
+                return ApprovalHandler._approve_epic(self, ticket)
+
+            @dispatch(Issue)
+            def approve_ticket(self, ticket):
+                return ApprovalHandler._approve_issue(self, ticket)
+
+        legacy_handler = MultipleDispatchHandler()
+        legacy_handler.index = handler.index
+        candidates["multipledispatch"] = lambda: legacy_handler.approve_ticket(epic)
+
+    best = {name: float("inf") for name in candidates}
+    for _ in range(rounds):
+        for name, call in candidates.items():
+            started = time.perf_counter()
+            for _ in range(calls):
+                call()
+            best[name] = min(best[name], time.perf_counter() - started)
+
+    results = {name: elapsed / calls * 1e9 for name, elapsed in best.items()}
+    for name, per_call in results.items():
+        print(f"{name:>18} {calls:>8} calls  {per_call:>8.0f} ns/call", flush=True)
+    return results
+
+
+SCENARIOS = {
+    "epic_generation": bench_epic_generation,
+    "epic_feedback": bench_epic_feedback,
+    "issue_feedback": bench_issue_feedback,
+    "approval": bench_approval,
+    "approval_bulk": bench_approval_bulk,
+    "issue_parser": bench_issue_parser,
+}
+
+
+def run(sizes, scenarios, latency, latency_jitter, concurrency) -> dict:
+    clients.use_llm_backend(
+        ReplayClient(responder=synthetic_responder, latency=latency, latency_jitter=latency_jitter),
+        AsyncReplayClient(responder=synthetic_responder, latency=latency, latency_jitter=latency_jitter),
+    )
+    import epic_generation, epic_feedback, issue_feedback
+    # Measure the pipeline itself: no response cache, no rate limiting
+    for agent in (epic_generation.epic_generation_agent, epic_feedback.epic_feedback_agent, issue_feedback.issue_feedback_agent):
+        agent.cache = None
+        agent.scheduler = None
+        agent.max_concurrency = concurrency
+
+    # Every LLM call and parse records spans; keep enough to cover the largest run
+    tracer.set_max_spans(4 * max(sizes))
+    tracer.enable()
+    results = {}
+    try:
+        for name in scenarios:
+            for size in sizes:
+                # The pipeline prints progress for every ticket; keep it out of the report
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    result = SCENARIOS[name](size)
+                results[f"{name}/{size}"] = result
+                line = (f"{name:>16} {size:>8}  {result['throughput_per_s']:>12.1f} ops/s  "
+                        f"p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms")
+                if "end_to_end_p50_ms" in result:
+                    line += f"  end-to-end p50 {result['end_to_end_p50_ms']:>9.3f} ms  p99 {result['end_to_end_p99_ms']:>9.3f} ms"
+                print(line, flush=True)
+    finally:
+        tracer.disable()
+        clients.use_llm_backend(None)
+    return results
+
+
+def compare(results, baseline) -> list[str]:
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get("results", {}).get(key)
+        if reference is None or not reference["throughput_per_s"]:
+            continue
+        change = result["throughput_per_s"] / reference["throughput_per_s"] - 1.0
+        if change < -REGRESSION_THRESHOLD:
+            regressions.append(f"{key}: throughput {change:+.0%} vs baseline")
+    return regressions
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Benchmark the agility pipeline against the replay backend.")
+    argument_parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    argument_parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    argument_parser.add_argument("--latency", type=float, default=0.001, help="median synthetic LLM latency in seconds")
+    argument_parser.add_argument("--latency-jitter", type=float, default=0.5, help="log-normal sigma of the synthetic latency")
+    argument_parser.add_argument("--concurrency", type=int, default=64, help="max in-flight requests per agent")
+    argument_parser.add_argument("--update-baseline", action="store_true")
+    argument_parser.add_argument("--compare-parsers", action="store_true",
+                                 help="only compare the issue parser against the previous implementation on 10k blocks")
+    argument_parser.add_argument("--ticket-memory", action="store_true",
+                                 help="only compare per-ticket memory against the previous Ticket layout on 200k issues")
+    argument_parser.add_argument("--compare-dispatch", action="store_true",
+                                 help="only measure the per-call cost of the approval hot path")
+    args = argument_parser.parse_args()
+
+    if args.compare_parsers:
+        compare_issue_parsers()
+        sys.exit(0)
+    if args.ticket_memory:
+        compare_ticket_memory()
+        sys.exit(0)
+    if args.compare_dispatch:
+        compare_dispatch()
+        sys.exit(0)
+
+    results = run(args.sizes, args.scenarios, args.latency, args.latency_jitter, args.concurrency)
+
+    if args.update_baseline:
+        baseline = {
+            "settings": {"latency": args.latency, "latency_jitter": args.latency_jitter, "concurrency": args.concurrency},
+            "results": results,
+        }
+        with open(BASELINE_PATH, "w", encoding="utf-8") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+    elif os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
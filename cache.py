@@ -0,0 +1,214 @@
+import os
+import time
+import asyncio
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Create a response cache so that identical prompts are not sent to the model twice.
+# Responses are kept in an in-memory LRU tier backed by an optional on-disk SQLite tier.
+# The SQLite file is only created when the disk tier is first used, and the async methods run
+# the disk tier in a worker thread so they never block the event loop.
+
+def make_cache_key(model_name, system_prompt, user_prompt, temperature, response_format=None) -> str:
+    """
+    Builds a content-addressed key from everything that determines a completion.
+    """
+    parts = [model_name, system_prompt, user_prompt, temperature]
+    # Only structured requests carry a response format, so plain keys stay unchanged
+    if response_format is not None:
+        parts.append(response_format)
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    A two-tier LRU cache for LLM responses with TTL eviction and hit/miss counters.
+    """
+    def __init__(self, path=None, max_memory_entries=256, max_disk_entries=10000, ttl=7 * 24 * 3600):
+        """
+        Args:
+            path (str): Path of the SQLite file for the disk tier. None keeps the cache in memory only.
+            max_memory_entries (int): Maximum number of responses held in memory.
+            max_disk_entries (int): Maximum number of responses held on disk.
+            ttl (float): Seconds after which a cached response expires. None disables expiry.
+        """
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+
+        # key -> (created_at, response)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+
+        self._db = None
+
+    def _connect(self):
+        # Called with the lock held; opens (and creates) the disk tier on first use
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            self._db.commit()
+        return self._db
+
+    def _expired(self, created_at, now) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _remember(self, key, created_at, response):
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+            if self.path is None:
+                self.misses += 1
+            return None
+
+    def _get_disk(self, key, now):
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                response, created_at = row
+                if not self._expired(created_at, now):
+                    db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                    db.commit()
+                    self._remember(key, created_at, response)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return response
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+            self.misses += 1
+            return None
+
+    def _put_disk(self, key, response, now) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._evict_disk(now)
+            db.commit()
+
+    def get(self, key):
+        """
+        Returns the cached response for key, or None on a miss.
+        """
+        now = time.time()
+        response = self._get_memory(key, now)
+        if response is None and self.path is not None:
+            response = self._get_disk(key, now)
+        return response
+
+    async def aget(self, key):
+        """
+        Async counterpart of get(); the disk tier is read in a worker thread.
+        """
+        now = time.time()
+        response = self._get_memory(key, now)
+        if response is None and self.path is not None:
+            response = await asyncio.to_thread(self._get_disk, key, now)
+        return response
+
+    def put(self, key, response) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+        if self.path is not None:
+            self._put_disk(key, response, now)
+
+    async def aput(self, key, response) -> None:
+        """
+        Async counterpart of put(); the disk tier is written in a worker thread.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+        if self.path is not None:
+            await asyncio.to_thread(self._put_disk, key, response, now)
+
+    def _evict_disk(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_disk_entries:
+            # Drop the least recently used entries first
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self.path is not None and (self._db is not None or os.path.exists(self.path)):
+                self._connect()
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            disk_entries = 0
+            if self.path is not None and (self._db is not None or os.path.exists(self.path)):
+                self._connect()
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+            }
+
+
+_default_cache = None
+
+def get_default_cache() -> ResponseCache:
+    """
+    Returns the process-wide response cache shared by the generation agents.
+    The disk tier location can be set with the LLM_CACHE_PATH environment variable.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(path=os.getenv("LLM_CACHE_PATH", ".agility_cache/responses.sqlite"))
+    return _default_cache
+
+
+if __name__ == "__main__":
+    cache = ResponseCache(max_memory_entries=2)
+    key = make_cache_key("gpt-4o", "system", "user", 0.7)
+    print(cache.get(key))
+    cache.put(key, "cached response")
+    print(cache.get(key))
+    print(cache.stats())
@@ -0,0 +1,217 @@
+import os
+import asyncio
+import weakref
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI
+
+# Process-wide registry of HTTP clients so that every agent and module shares the same
+# connection pools instead of opening (and TLS-handshaking) its own.
+
+load_dotenv()
+
+_config = {
+    "max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", 32)),
+    "max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 16)),
+    "keepalive_expiry": float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60.0)),
+    "timeout": float(os.getenv("HTTP_TIMEOUT", 120.0)),
+    "connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", 10.0)),
+}
+
+_lock = threading.Lock()
+_openai_client = None
+_async_openai_clients = weakref.WeakKeyDictionary()
+_http_session = None
+
+# Optional stand-ins (e.g. replay.ReplayClient) returned instead of the real OpenAI clients
+_backend_client = None
+_backend_async_client = None
+
+
+class ConnectionStats:
+    """
+    Counts requests and newly opened connections for one pool, so connection reuse can be measured.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self._seen = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def record(self, connections) -> None:
+        with self._lock:
+            self.requests += 1
+            for connection in connections:
+                if connection not in self._seen:
+                    self._seen.add(connection)
+                    self.connections_opened += 1
+
+    def as_dict(self) -> dict:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "reused": reused,
+            "reuse_ratio": reused / self.requests if self.requests else 0.0,
+        }
+
+
+_openai_stats = ConnectionStats()
+_async_openai_stats = ConnectionStats()
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request):
+        response = super().handle_request(request)
+        self._stats.record(self._pool.connections)
+        return response
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request):
+        response = await super().handle_async_request(request)
+        self._stats.record(self._pool.connections)
+        return response
+
+
+def configure_clients(**options) -> None:
+    """
+    Updates the pool configuration. Clients created before the call are closed and rebuilt on next use.
+
+    Args:
+        max_connections (int): Maximum number of open connections per pool.
+        max_keepalive_connections (int): Maximum number of idle keep-alive connections per pool.
+        keepalive_expiry (float): Seconds an idle connection is kept open.
+        timeout (float): Read/write timeout in seconds.
+        connect_timeout (float): Connect timeout in seconds.
+    """
+    global _openai_client, _http_session
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"Unknown client options: {', '.join(sorted(unknown))}")
+
+    with _lock:
+        _config.update(options)
+        if _openai_client is not None:
+            _openai_client.close()
+            _openai_client = None
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+        _async_openai_clients.clear()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_config["max_connections"],
+        max_keepalive_connections=_config["max_keepalive_connections"],
+        keepalive_expiry=_config["keepalive_expiry"],
+    )
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(_config["timeout"], connect=_config["connect_timeout"])
+
+
+def use_llm_backend(client, async_client=None) -> None:
+    """
+    Routes every agent and module through client (and async_client) instead of the OpenAI API,
+    e.g. a replay.ReplayClient for offline runs and benchmarks. Pass None to restore the real clients.
+    """
+    global _backend_client, _backend_async_client
+    with _lock:
+        _backend_client = client
+        _backend_async_client = async_client
+
+
+def get_openai_client() -> OpenAI:
+    """
+    Returns the shared synchronous OpenAI client.
+    """
+    global _openai_client
+    if _backend_client is not None:
+        return _backend_client
+    with _lock:
+        if _openai_client is None:
+            http_client = httpx.Client(
+                transport=_CountingTransport(_openai_stats, limits=_limits()),
+                timeout=_timeout(),
+            )
+            _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+        return _openai_client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """
+    Returns the shared asynchronous OpenAI client for the running event loop.
+    Async connections cannot outlive their loop, so one client is kept per loop.
+    """
+    if _backend_async_client is not None:
+        return _backend_async_client
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_openai_clients.get(loop)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                transport=_AsyncCountingTransport(_async_openai_stats, limits=_limits()),
+                timeout=_timeout(),
+            )
+            client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+            _async_openai_clients[loop] = client
+        return client
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the shared requests session used for plain HTTP APIs such as GitHub.
+    """
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=_config["max_keepalive_connections"],
+                pool_maxsize=_config["max_connections"],
+            )
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
+        return _http_session
+
+
+def get_http_timeout() -> tuple[float, float]:
+    """
+    Returns the (connect, read) timeout to pass to requests made with the shared session.
+    """
+    return (_config["connect_timeout"], _config["timeout"])
+
+
+def connection_stats() -> dict:
+    """
+    Reports requests made and connections opened per shared pool.
+    """
+    session_stats = {"requests": 0, "connections_opened": 0}
+    if _http_session is not None:
+        for adapter in set(_http_session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                session_stats["requests"] += pool.num_requests
+                session_stats["connections_opened"] += pool.num_connections
+    reused = max(session_stats["requests"] - session_stats["connections_opened"], 0)
+    session_stats["reused"] = reused
+    session_stats["reuse_ratio"] = reused / session_stats["requests"] if session_stats["requests"] else 0.0
+
+    return {
+        "openai": _openai_stats.as_dict(),
+        "async_openai": _async_openai_stats.as_dict(),
+        "http_session": session_stats,
+    }
@@ -0,0 +1,95 @@
+import sys
+import json
+from collections import deque
+from tokens import estimate_tokens
+
+# Create a bounded store for the prompt/response history of a Model.
+# Entries are evicted oldest-first once the entry or token budget is exceeded.
+
+class ContextHistory:
+    """
+    A bounded, token-budgeted replacement for the context_history list of a Model.
+
+    Each entry keeps the same shape as before:
+        [{"user_prompt": <prompt>}, {"assistant_response": <response>}]
+    """
+    def __init__(self, max_entries=50, max_tokens=200_000, spill_path=None):
+        """
+        Args:
+            max_entries (int): Maximum number of exchanges kept in memory.
+            max_tokens (int): Maximum estimated tokens kept in memory. The newest entry is
+                              always kept, even if it alone exceeds the budget.
+            spill_path (str): Optional JSON lines file that evicted entries are appended to.
+        """
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        self.spill_path = spill_path
+
+        # (context, tokens, bytes)
+        self._entries = deque()
+        self.token_usage = 0
+        self.memory_usage = 0
+        self.evicted = 0
+
+    def _entry_size(self, context) -> tuple[int, int]:
+        tokens = 0
+        size = 0
+        for message in context:
+            for text in message.values():
+                tokens += estimate_tokens(text)
+                size += sys.getsizeof(text)
+        return tokens, size
+
+    def append(self, context) -> None:
+        tokens, size = self._entry_size(context)
+        self._entries.append((context, tokens, size))
+        self.token_usage += tokens
+        self.memory_usage += size
+        self._evict()
+
+    def _evict(self) -> None:
+        spilled = []
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self.token_usage > self.max_tokens
+        ):
+            context, tokens, size = self._entries.popleft()
+            self.token_usage -= tokens
+            self.memory_usage -= size
+            self.evicted += 1
+            spilled.append(context)
+
+        if spilled and self.spill_path is not None:
+            with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                for context in spilled:
+                    spill_file.write(json.dumps(context, ensure_ascii=False) + "\n")
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.token_usage = 0
+        self.memory_usage = 0
+
+    def usage(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "tokens": self.token_usage,
+            "bytes": self.memory_usage,
+            "evicted": self.evicted,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return (context for context, _, _ in self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [context for context, _, _ in list(self._entries)[index]]
+        return self._entries[index][0]
+
+
+if __name__ == "__main__":
+    history = ContextHistory(max_entries=2, max_tokens=10)
+    for i in range(3):
+        history.append([{"user_prompt": f"prompt {i}"}, {"assistant_response": f"response {i}"}])
+    print(history[:], history.usage())
@@ -1,11 +1,22 @@
+import asyncio
 from model import Model
+from cache import get_default_cache
+from router import get_default_router
+from scheduler import get_default_scheduler, PRIORITY_INTERACTIVE
 from parser import EpicParser as parser
 from ticket import Epic
+from schemas import EpicResponse, STRUCTURED_OUTPUT
 
 
 epic_feedback_agent = Model(
     model_name="gpt-4o",
-    system_prompt="You are an experienced project manager working as a scrum master"
+    system_prompt="You are an experienced project manager working as a scrum master",
+    cache=get_default_cache(),
+    scheduler=get_default_scheduler(),
+    # Feedback is reviewed interactively, so it is admitted ahead of bulk generation
+    priority=PRIORITY_INTERACTIVE,
+    router=get_default_router(),
+    task="epic_feedback",
 )
 
 epic_feedback_prompt = """
@@ -26,7 +37,24 @@ epic_feedback_prompt = """
     """
     
 
-def generate_epic_feedback(current_epic, user_feedback, project_summary) -> tuple[Epic, str]:
+def build_epic_feedback_prompt(current_epic, user_feedback, project_summary) -> str:
+    return f"""
+        {epic_feedback_prompt}
+        Here is the current epic:
+        \"\"\"
+        {current_epic.get_current_content()}
+        \"\"\"
+        Here is the user feedback:
+        \"\"\"
+        {user_feedback}
+        \"\"\"
+        Here are the details and current status of the project:
+        \"\"\"
+        {project_summary}
+        \"\"\"
+    """
+
+def generate_epic_feedback(current_epic, user_feedback, project_summary, use_cache=True, structured=STRUCTURED_OUTPUT) -> tuple[Epic, str]:
     """
     Generates a proposed updated epic based on the current epic and user feedback.
     The LLM's output is expected to include the following format:
@@ -42,30 +70,67 @@ def generate_epic_feedback(current_epic, user_feedback, project_summary) -> tupl
          tuple(updated_epic, changes_summary)
          - updated_epic: Epic instance with the updated proposed_content.
          - changes_summary: string description of the changes.
+
+    Pass use_cache=False to sample a fresh response instead of reusing a cached one.
+    With structured=True the epic is requested as JSON (see schemas.py), falling back to the
+    text format if that fails.
     """
-    prompt = f"""
-        {epic_feedback_prompt}
-        Here is the current epic:
-        \"\"\"
-        {current_epic.get_current_content()}
-        \"\"\"
-        Here is the user feedback:
-        \"\"\"
-        {user_feedback}
-        \"\"\"
-        Here are the details and current status of the project:
-        \"\"\"
-        {project_summary}
-        \"\"\"
-    """
+    prompt = build_epic_feedback_prompt(current_epic, user_feedback, project_summary)
     
+    if structured:
+        return epic_feedback_agent.prompt_structured(
+            system_prompt=epic_feedback_prompt,
+            user_prompt=prompt,
+            schema=EpicResponse,
+            parse=lambda response: parser.parse_json(response, current_epic),
+            fallback_parse=lambda response: parser.parse(response, current_epic),
+            use_cache=use_cache
+        )
+
     response = epic_feedback_agent.prompt(
         system_prompt=epic_feedback_prompt,
-        user_prompt=prompt
+        user_prompt=prompt,
+        use_cache=use_cache
     )
 
     return parser.parse(response, current_epic)
 
+def stream_epic_feedback(current_epic, user_feedback, project_summary, use_cache=True):
+    """
+    Streaming variant of generate_epic_feedback.
+
+    Yields:
+        ("epic", updated_epic) as soon as the Epic section of the response closes,
+        then ("summary", changes_summary) once the response is complete.
+    """
+    prompt = build_epic_feedback_prompt(current_epic, user_feedback, project_summary)
+
+    tokens = epic_feedback_agent.prompt_stream(
+        system_prompt=epic_feedback_prompt,
+        user_prompt=prompt,
+        use_cache=use_cache
+    )
+
+    yield from parser.parse_stream(tokens, current_epic)
+
+def generate_epic_feedback_many(requests) -> list[tuple[Epic, str]]:
+    """
+    Generates proposed epic updates for several epics concurrently.
+
+    Args:
+        requests (list[tuple[Epic, str, str]]): (current_epic, user_feedback, project_summary) triples.
+
+    Returns:
+         list of (updated_epic, changes_summary) tuples, in the same order as requests.
+    """
+    prompts = [build_epic_feedback_prompt(*request) for request in requests]
+    responses = asyncio.run(epic_feedback_agent.prompt_many(
+        system_prompt=epic_feedback_prompt,
+        user_prompts=prompts
+    ))
+    return [parser.parse(response, request[0]) for request, response in zip(requests, responses)]
+
+
 if __name__ == "__main__":
     # Create an Epic object representing the current epic.
     current_epic = Epic(epic_content="Develop a secure multi-factor authentication system for all users.")
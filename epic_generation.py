@@ -1,13 +1,23 @@
 import os
+import asyncio
 from model import Model
+from cache import get_default_cache
+from router import get_default_router
+from scheduler import get_default_scheduler, PRIORITY_BULK
 from parser import EpicParser as parser
 from ticket import Epic
+from schemas import EpicResponse, STRUCTURED_OUTPUT
 
 
 epic_generation_agent = Model(
     model_name="gpt-4o",
     system_prompt="You are an experienced project manager working as a scrum master",
     temperature=0.7,
+    cache=get_default_cache(),
+    scheduler=get_default_scheduler(),
+    priority=PRIORITY_BULK,
+    router=get_default_router(),
+    task="epic_generation",
 )
 
 epic_generation_prompt = """
@@ -26,32 +36,77 @@ epic_generation_prompt = """
     \"\"\"
 """
 
-def generate_epic(user_prompt, project_summary) -> tuple[Epic, str]:
+def build_epic_prompt(user_prompt, project_summary) -> str:
+    return f"""
+        {epic_generation_prompt}
+        Here is the user prompt:
+        {user_prompt}
+        Here are the details and current status of the project:
+        {project_summary}
+    """
+
+def generate_epic(user_prompt, project_summary, use_cache=True, structured=STRUCTURED_OUTPUT) -> tuple[Epic, str]:
     """
     Generates an epic statement based on the user's input prompt.
     The LLM is expected to provide:
       - An epic statement.
       - A summary of how the epic was derived, highlighting key points.
 
+    Pass use_cache=False to sample a fresh response instead of reusing a cached one.
+    With structured=True the epic is requested as JSON (see schemas.py), falling back to the
+    text format if that fails.
+
     Returns:
          tuple (epic, summary)
     """
     
-    prompt = f"""
-        {epic_generation_prompt}
-        Here is the user prompt:
-        {user_prompt}
-        Here are the details and current status of the project:
-        {project_summary}
-    """
+    prompt = build_epic_prompt(user_prompt, project_summary)
+    if structured:
+        return epic_generation_agent.prompt_structured(
+            system_prompt=epic_generation_prompt,
+            user_prompt=prompt,
+            schema=EpicResponse,
+            parse=parser.parse_json,
+            fallback_parse=parser.parse,
+            use_cache=use_cache
+        )
+
     response = epic_generation_agent.prompt(
         system_prompt=epic_generation_prompt,
-        user_prompt=prompt
+        user_prompt=prompt,
+        use_cache=use_cache
     )
     
     # Parse the response into epic and summary.
     return parser.parse(response)
 
+def generate_epics(requests, batch_backend=None) -> list[tuple[Epic, str]]:
+    """
+    Generates epics for several projects concurrently.
+
+    Args:
+        requests (list[tuple[str, str]]): (user_prompt, project_summary) pairs.
+        batch_backend: If given, the prompts are sent through this offline batch backend
+                       (see batch.py) instead of as concurrent interactive requests.
+
+    Returns:
+         list of (epic, summary) tuples, in the same order as requests.
+         Requests that failed in batch mode are returned as None.
+    """
+    prompts = [build_epic_prompt(user_prompt, project_summary) for user_prompt, project_summary in requests]
+    if batch_backend is not None:
+        responses = epic_generation_agent.prompt_batch(
+            system_prompt=epic_generation_prompt,
+            user_prompts=prompts,
+            backend=batch_backend
+        )
+    else:
+        responses = asyncio.run(epic_generation_agent.prompt_many(
+            system_prompt=epic_generation_prompt,
+            user_prompts=prompts
+        ))
+    return [parser.parse(response) if response is not None else None for response in responses]
+
 
 if __name__ == "__main__":
     project_summary = (
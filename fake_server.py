@@ -0,0 +1,94 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the chat completions API, used to exercise rate limiting and retries
+# without network access. Point the OpenAI client at it with OPENAI_BASE_URL=<server.base_url>.
+
+class FakeModelServer:
+    """
+    Serves /v1/chat/completions, answering the first rate_limited_requests calls with 429.
+    """
+    def __init__(self, rate_limited_requests=2, retry_after=1, response_text="Epic:\nFake epic\n\nSummary:\nFake summary", port=0):
+        self.rate_limited_requests = rate_limited_requests
+        self.retry_after = retry_after
+        self.response_text = response_text
+        self.requests = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive so client connection reuse behaves as it does against the real API
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    limited = server.rate_limited < server.rate_limited_requests
+                    if limited:
+                        server.rate_limited += 1
+
+                if limited:
+                    payload = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                    self._send(429, payload, {"retry-after": str(server.retry_after)})
+                    return
+
+                prompt_tokens = sum(len(message.get("content", "")) for message in body.get("messages", [])) // 4
+                completion_tokens = len(server.response_text) // 4
+                payload = {
+                    "id": f"chatcmpl-fake-{server.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": server.response_text},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+                self._send(200, payload)
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
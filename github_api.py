@@ -1,10 +1,12 @@
-import requests
 import os
+from tracing import traced
+from clients import get_http_session, get_http_timeout
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+@traced("github_api.create_github_issue")
 def create_github_issue(title, body, repo_owner, repo_name):
     """
     Create a new GitHub issue
@@ -40,7 +42,7 @@ def create_github_issue(title, body, repo_owner, repo_name):
     }
     
     # Create the issue
-    response = requests.post(url, headers=headers, json=data)
+    response = get_http_session().post(url, headers=headers, json=data, timeout=get_http_timeout())
     
     if response.status_code == 201:
         print(f"Issue created successfully! URL: {response.json()['html_url']}")
@@ -1,48 +1,36 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
-from parser import Issue, Parser
+from model import Model
+from cache import get_default_cache
+from router import get_default_router
+from scheduler import get_default_scheduler, PRIORITY_INTERACTIVE
+from parser import Issue, IssueParser
+from schemas import IssueProposalsResponse, STRUCTURED_OUTPUT
+from repair import repair_proposals
+from tokens import estimate_tokens
 
 # Load environment variables from .env file
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+issue_feedback_agent = Model(
+    model_name="gpt-4o",
+    system_prompt="You are an experienced project management assistant.",
+    cache=get_default_cache(),
+    scheduler=get_default_scheduler(),
+    # Feedback is reviewed interactively, so it is admitted ahead of bulk generation
+    priority=PRIORITY_INTERACTIVE,
+    router=get_default_router(),
+    task="issue_feedback",
+)
 
-def generate_proposals_with_feedback(user_feedback, issues):
-    """
-    Given user feedback and a list of current Issue objects, generate LLM-based proposals
-    for modifications to the issues. The LLM is instructed to produce proposals for each issue,
-    indicating for existing issues one of the following actions:
-      - Update: Provide a new title and revised body.
-      - Delete: Recommend that the issue be removed.
-    Additionally, if an issue is missing, the LLM should propose a new issue (using the action 'Add').
-
-    The LLM response is parsed by Parser.parse_issue_feedback, which returns:
-      - modifications: a dict mapping issue IDs (int) to a dict with keys:
-            { "action": "Update" or "Delete",
-              "proposed_title": <value> (if applicable),
-              "proposed_body": <value> (if applicable) }
-      - new_proposals: a list of dicts, each with keys:
-            { "action": "Add",
-              "proposed_title": <value>,
-              "proposed_body": <value> }
-      - proposal_summary: a string summarizing the proposed changes.
-
-    After parsing, the existing Issue objects are updated with the proposed changes. For new issues,
-    new Issue objects are created and appended to the issues list.
-
-    Returns:
-         tuple (issues, proposal_summary)
-         - issues: the updated list of Issue objects (each containing the proposed_action and changes).
-         - proposal_summary: a string summarizing the proposed changes.
-    """
+def build_issue_feedback_prompt(user_feedback, issues) -> str:
     # Build context for the current state of all issues.
     current_issues_context = "\n".join(
-        f"Issue {issue.issue_id}:\nTitle: {issue.issue_title}\nBody: {issue.issue_body}\n"
+        f"Issue {issue.get_id()}:\nTitle: {issue.get_current_content()['issue_title']}\nBody: {issue.get_current_content()['issue_body']}\n"
         for issue in issues
     )
     
-    prompt = f"""
+    return f"""
 You are an experienced project management assistant. Below are the current issues for a project and some user feedback.
 Based solely on the current details and the user feedback, please propose modifications for each issue:
 - For existing issues, propose one of the following actions:
@@ -75,53 +63,117 @@ Current Issues:
 Proposal Summary:
 <Provide a concise summary of the proposed changes.>
     """
-    
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are an experienced project management assistant."},
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.7,
-    )
-    proposals_text = response.choices[0].message.content
-    
+
+def complete_feedback_prompt(prompt, **kwargs) -> str:
+    return issue_feedback_agent.prompt(issue_feedback_agent.system_prompt, prompt, **kwargs)
+
+def complete_repair_prompt(prompt) -> str:
+    # Repairs only rewrite proposals into the expected format, so they take the router's reformat route
+    return complete_feedback_prompt(prompt, task="reformat")
+
+def _parse_text_proposals(proposals_text, issues, failed):
     print("Proposals Text:")
     print(proposals_text)
     print("--------------------------------")
     # Parse the LLM response using the centralized parser.
-    modifications, new_proposals, proposal_summary = Parser.parse_issue_feedback(proposals_text)
+    return proposals_text, IssueParser.parse(proposals_text, issues, failed)
 
-    # Update existing Issue objects with the proposed modifications.
-    for issue in issues:
-        if issue.issue_id in modifications:
-            mod = modifications[issue.issue_id]
-            issue.proposed_action = mod.get("action")
-            if mod.get("action", "").lower() == "update":
-                issue.proposed_issue_title = mod.get("proposed_title")
-                issue.proposed_issue_body = mod.get("proposed_body")
-
-    # Create new Issue objects for each proposed new issue.
-    max_id = max((issue.issue_id for issue in issues), default=0)
-    for proposal in new_proposals:
-        max_id += 1
-        new_issue = Issue(
-            issue_id=max_id,
-            issue_title=proposal.get("proposed_title"),
-            issue_body=proposal.get("proposed_body"),
-            proposed_action=proposal.get("action")
+def generate_proposals_with_feedback(user_feedback, issues, structured=STRUCTURED_OUTPUT, repair=True):
+    """
+    Given user feedback and a list of current Issue objects, generate LLM-based proposals
+    for modifications to the issues. The LLM is instructed to produce proposals for each issue,
+    indicating for existing issues one of the following actions:
+      - Update: Provide a new title and revised body.
+      - Delete: Recommend that the issue be removed.
+    Additionally, if an issue is missing, the LLM should propose a new issue (using the action 'Add').
+
+    The LLM response is parsed by IssueParser.parse, which records each Update or Delete proposal
+    on the matching Issue object and creates a new Issue object in the "ADD" state for each proposed
+    new issue, appended to the issues list.
+
+    With structured=True the proposals are requested as JSON (see schemas.py) and parsed by
+    IssueParser.parse_json, falling back to the text format if that fails.
+
+    With repair=True, proposals skipped as incomplete are sent back to the model in a short
+    re-prompt of their own (see repair.py) and the fixed proposals are merged into the result.
+
+    Returns:
+         tuple (issues, proposal_summary)
+         - issues: the updated list of Issue objects (each containing the proposed_action and changes).
+         - proposal_summary: a string summarizing the proposed changes.
+    """
+    prompt = build_issue_feedback_prompt(user_feedback, issues)
+    # Incomplete proposal blocks, collected for the repair re-prompt
+    failed = [] if repair else None
+
+    if structured:
+        proposals_text, (issues, proposal_summary) = issue_feedback_agent.prompt_structured(
+            system_prompt=issue_feedback_agent.system_prompt,
+            user_prompt=prompt,
+            schema=IssueProposalsResponse,
+            parse=lambda response: (response, IssueParser.parse_json(response, issues, failed)),
+            fallback_parse=lambda response: _parse_text_proposals(response, issues, failed),
         )
-        issues.append(new_issue)
-    
+    else:
+        proposals_text, (issues, proposal_summary) = _parse_text_proposals(complete_feedback_prompt(prompt), issues, failed)
+
+    if failed:
+        events, _ = repair_proposals(
+            failed, issues, user_feedback, complete_repair_prompt,
+            regeneration_tokens=estimate_tokens(prompt) + estimate_tokens(proposals_text),
+        )
+        issues.extend(issue for kind, issue in events if kind == "new_issue")
+
     return issues, proposal_summary
 
+def stream_proposals_with_feedback(user_feedback, issues, repair=True):
+    """
+    Streaming variant of generate_proposals_with_feedback. The completion is parsed while it
+    arrives, so each proposal is available as soon as its block closes instead of after the
+    whole response. With repair=True, incomplete proposals are repaired once the stream ends.
+
+    Yields:
+        tuple: one of
+              - ("issue", issue): an existing Issue with a proposal applied, or a new Issue in the "ADD" state
+              - ("summary", proposal_summary)
+    """
+    prompt = build_issue_feedback_prompt(user_feedback, issues)
+
+    tokens = issue_feedback_agent.prompt_stream(issue_feedback_agent.system_prompt, prompt)
+    received = []
+    failed = [] if repair else None
+
+    summary = None
+    for kind, payload in IssueParser.parse_stream((received.append(token) or token for token in tokens), issues, failed):
+        if kind == "summary":
+            # Held back so that repaired proposals still arrive before the summary
+            summary = payload
+            continue
+        if kind == "new_issue":
+            issues.append(payload)
+            kind = "issue"
+        yield kind, payload
+
+    if failed:
+        events, _ = repair_proposals(
+            failed, issues, user_feedback, complete_repair_prompt,
+            regeneration_tokens=estimate_tokens(prompt) + estimate_tokens("".join(received)),
+        )
+        for kind, payload in events:
+            if kind == "new_issue":
+                issues.append(payload)
+            yield "issue", payload
+
+    if summary is not None:
+        yield "summary", summary
+
 
 if __name__ == "__main__":
     # Example usage:
     issues = [
-        Issue(issue_id=1, issue_title="Implement user authentication", issue_body="Create endpoints for login, logout, and registration."),
-        Issue(issue_id=2, issue_title="Integrate third-party OAuth providers", issue_body="Support sign-in with providers like Google and Facebook."),
-        Issue(issue_id=3, issue_title="Unwanted Issue", issue_body="This issue should be removed as it is not actionable.")
+        Issue(current_title="Implement user authentication", current_body="Create endpoints for login, logout, and registration."),
+        Issue(current_title="Integrate third-party OAuth providers", current_body="Support sign-in with providers like Google and Facebook."),
+        Issue(current_title="Unwanted Issue", current_body="This issue should be removed as it is not actionable.")
     ]
     
     print("Initial Issues:")
@@ -129,9 +181,9 @@ if __name__ == "__main__":
         print(issue)
     
     user_feedback = (
-        "The issues are too generic. For Issue 1, focus on backend authentication logic. "
-        "For Issue 2, be explicit about the configuration for multiple OAuth providers. "
-        "Please remove Issue 3 and consider adding an issue for front-end integration."
+        f"The issues are too generic. For Issue {issues[0].get_id()}, focus on backend authentication logic. "
+        f"For Issue {issues[1].get_id()}, be explicit about the configuration for multiple OAuth providers. "
+        f"Please remove Issue {issues[2].get_id()} and consider adding an issue for front-end integration."
     )
     
     issues, proposal_summary = generate_proposals_with_feedback(user_feedback, issues)
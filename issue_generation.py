@@ -1,12 +1,28 @@
 import os
+import asyncio
+import openai
 from dotenv import load_dotenv
-from openai import OpenAI
-import pathspec # For parsing .gitignore files
+from model import Model
+from cache import get_default_cache
+from parser import IssueParser
+from repository import read_repository, get_repository_snapshot, shard_repository
+from retrieval import get_repository_index, count_terms
+from router import get_default_router
+from scheduler import get_default_scheduler, PRIORITY_BULK
 
 # Load environment variables from .env file
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+issue_generation_agent = Model(
+    model_name="gpt-4o",
+    system_prompt="You are an experienced project management assistant.",
+    temperature=0.7,
+    cache=get_default_cache(),
+    scheduler=get_default_scheduler(),
+    priority=PRIORITY_BULK,
+    router=get_default_router(),
+    task="issue_generation",
+)
 
 
 # # Set OpenAI API key from environment variable
@@ -14,51 +30,16 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 # if not openai_api_key:
     # raise ValueError("OPENAI_API_KEY not found in the .env file. Please set it.")
 
-def read_repository(repo_path, extensions=(".py", ".js", ".java", ".ts")):
-    """
-    Recursively reads files from the given repository path, excluding files and directories 
-    that match the patterns in the .gitignore file, and concatenates their contents
-    into a single string with file path headers. Only files with specified extensions are included.
-    """
-    # Load .gitignore patterns if available.
-    gitignore_path = os.path.join(repo_path, ".gitignore")
-    spec = None
-    if os.path.exists(gitignore_path):
-        try:
-            with open(gitignore_path, "r", encoding="utf-8") as git_file:
-                gitignore_lines = git_file.read().splitlines()
-                spec = pathspec.PathSpec.from_lines("gitwildmatch", gitignore_lines)
-        except Exception as e:
-            print(f"Error reading .gitignore: {e}")
-
-    content_list = []
-    for dirpath, _, filenames in os.walk(repo_path):
-        for filename in filenames:
-            full_path = os.path.join(dirpath, filename)
-            # Get the path relative to repo_path so we can match against .gitignore patterns
-            relative_path = os.path.relpath(full_path, repo_path)
-
-            # Exclude files that match .gitignore patterns if available.
-            if spec and spec.match_file(relative_path):
-                continue
-
-            # Only include files with the specified extensions.
-            if filename.endswith(extensions):
-                try:
-                    with open(full_path, "r", encoding="utf-8") as f:
-                        file_contents = f.read()
-                        # Append a header with the relative file path.
-                        content_list.append(f"--- File: {relative_path} ---\n{file_contents}\n")
-                except Exception as e:
-                    print(f"Error reading {full_path}: {e}")
-    return "\n".join(content_list)
-
-def generate_issues(epic, repository_context):
-    """
-    Generate issues by sending the epic and the entire repository context to an LLM.
-    The prompt instructs the LLM to break down the epic into a list of well-defined development issues.
-    """
-    prompt = f"""
+# Tokens of repository context packed into an issue generation prompt
+CONTEXT_TOKEN_BUDGET = 60_000
+# Map-reduce defaults: tokens of repository context per shard, and shards in flight at once
+SHARD_TOKEN_BUDGET = 60_000
+SHARD_CONCURRENCY = 8
+# Issues from different shards whose titles overlap at least this much are merged
+DUPLICATE_TITLE_SIMILARITY = 0.6
+
+def build_issue_generation_prompt(epic, repository_context) -> str:
+    return f"""
 You are a seasoned software project planner. Given the epic below and the complete context of the project's repository,
 please break down the epic into a list of well-defined development issues. Each issue should include:
 - A short title
@@ -73,20 +54,183 @@ Repository Context:
 
 Please list each issue in a structured format.
 """
-    response = client.chat.completions.create(model="gpt-4o",
-    messages=[
-        {"role": "system", "content": "You are an experienced project management assistant."},
-        {"role": "user", "content": prompt},
-    ],
-    temperature=0.7)
-    return response.choices[0].message.content
+
+def generate_issues(epic, repository_context, use_cache=True):
+    """
+    Generate issues by sending the epic and the entire repository context to an LLM.
+    The prompt instructs the LLM to break down the epic into a list of well-defined development issues.
+    Identical inputs are answered from the response cache unless use_cache is False.
+    """
+    return issue_generation_agent.prompt(
+        system_prompt=issue_generation_agent.system_prompt,
+        user_prompt=build_issue_generation_prompt(epic, repository_context),
+        use_cache=use_cache
+    )
+
+def build_repository_context(epic, repo_path, token_budget=CONTEXT_TOKEN_BUDGET, context_mode="full") -> str:
+    """
+    Returns the files (or, for large files, the chunks) of the repository most relevant to the epic,
+    packed under token_budget, instead of the whole repository. With context_mode "skeleton", only
+    the signatures, docstrings and imports of those files are included.
+    """
+    return get_repository_index(repo_path).pack(epic, token_budget, context_mode)
+
+def generate_issues_for_repository(epic, repo_path, token_budget=CONTEXT_TOKEN_BUDGET, context_mode="full", use_cache=True):
+    """
+    Generate issues for the epic using only the parts of the repository retrieved for it.
+    """
+    context = build_repository_context(epic, repo_path, token_budget, context_mode)
+    return generate_issues(epic, context, use_cache=use_cache)
+
+def build_shard_prompt(epic, shard_context) -> str:
+    # The shard's position is deliberately left out so unchanged shards keep hitting the cache
+    return f"""
+You are a seasoned software project planner. Given the epic below and one part of the project's repository,
+list the development issues needed to implement the epic that concern the files in this part.
+Only propose issues that this part of the repository is relevant to; other parts are handled separately.
+
+Epic:
+\"\"\"{epic}\"\"\"
+
+Repository Part:
+\"\"\"{shard_context}\"\"\"
+
+Format each issue as follows, with a blank line between issues:
+New Issue:
+Proposed Title: <short title>
+Proposed Body:
+<detailed description, including the relevant file paths>
+"""
+
+def _title_terms(title) -> set:
+    return set(count_terms(title))
+
+def reduce_issue_lists(partial_outputs) -> list[dict]:
+    """
+    Merges the partial issue lists of the shards: issues with overlapping titles are merged into
+    one (keeping the most detailed body), and the result is ranked by the number of shards that
+    proposed the issue, then by first appearance.
+
+    Returns:
+        list[dict]: The merged issues with keys "proposed_title", "proposed_body" and "support".
+    """
+    merged = []
+    for output in partial_outputs:
+        if not output:
+            continue
+        _, proposals, _ = IssueParser.parse_proposals(output)
+        for proposal in proposals:
+            terms = _title_terms(proposal["proposed_title"])
+            for issue in merged:
+                union = terms | issue["terms"]
+                if union and len(terms & issue["terms"]) / len(union) >= DUPLICATE_TITLE_SIMILARITY:
+                    issue["support"] += 1
+                    if len(proposal["proposed_body"]) > len(issue["proposed_body"]):
+                        issue["proposed_body"] = proposal["proposed_body"]
+                    break
+            else:
+                merged.append({
+                    "proposed_title": proposal["proposed_title"],
+                    "proposed_body": proposal["proposed_body"],
+                    "support": 1,
+                    "terms": terms,
+                })
+
+    ranked = sorted(enumerate(merged), key=lambda item: (-item[1]["support"], item[0]))
+    return [{key: value for key, value in issue.items() if key != "terms"} for _, issue in ranked]
+
+def format_issue_list(issues) -> str:
+    return "\n\n".join(
+        f"New Issue:\nProposed Title: {issue['proposed_title']}\nProposed Body:\n{issue['proposed_body']}"
+        for issue in issues
+    )
+
+async def _map_shards(epic, shards, max_concurrency, use_cache):
+    # Bounds the shards in flight for this call; the agent's own max_concurrency still applies
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(shard):
+        async with semaphore:
+            try:
+                return await issue_generation_agent.aprompt(
+                    system_prompt=issue_generation_agent.system_prompt,
+                    user_prompt=build_shard_prompt(epic, shard),
+                    update_context=False,
+                    use_cache=use_cache
+                )
+            except openai.APIError as e:
+                # The API gave up on this shard (after the scheduler's retries); the others still count
+                print(f"Error generating issues for a repository shard: {e}")
+                return e
+
+    results = await asyncio.gather(*[run(shard) for shard in shards])
+    errors = [result for result in results if isinstance(result, openai.APIError)]
+    if errors and len(errors) == len(results):
+        raise RuntimeError(f"Issue generation failed for all {len(results)} repository shards") from errors[-1]
+    return [None if isinstance(result, openai.APIError) else result for result in results]
+
+def generate_issues_map_reduce(epic, repo_path, shard_token_budget=SHARD_TOKEN_BUDGET,
+                               max_concurrency=SHARD_CONCURRENCY, context_mode="full", use_cache=True):
+    """
+    Generate issues for repositories larger than the context window. The repository snapshot is
+    split into token-bounded shards, partial issue lists are generated per shard in parallel, and
+    the partial lists are merged, deduplicated and ranked into the final list.
+
+    Each shard prompt is cached on its content, so a rerun after a few files changed only sends
+    the shards containing those files.
+
+    Args:
+        epic (str): The epic to break down.
+        repo_path (str): Root of the repository.
+        shard_token_budget (int): Maximum tokens of repository context per shard.
+        max_concurrency (int): Maximum number of shards in flight at once.
+        context_mode (str): "full" for file contents, "skeleton" for signatures and docstrings only.
+        use_cache (bool): Whether cached shard results may be reused.
+
+    Returns:
+        str: The merged issues, one "New Issue:" block per issue, most widely proposed first.
+
+    Raises:
+        RuntimeError: If the API call failed for every shard. A shard whose call fails is otherwise
+                      skipped; errors other than API errors propagate.
+    """
+    snapshot = get_repository_snapshot(repo_path)
+    snapshot.refresh()
+    shards = shard_repository(snapshot, shard_token_budget, context_mode)
+    partial_outputs = asyncio.run(_map_shards(epic, shards, max_concurrency, use_cache))
+    return format_issue_list(reduce_issue_lists(partial_outputs))
+
+def generate_issues_many(epics, repository_context, batch_backend=None):
+    """
+    Generates issues for several epics against the same repository context.
+
+    Args:
+        epics (list[str]): The epics to break down.
+        repository_context (str): The repository context shared by every epic.
+        batch_backend: If given, the prompts are sent through this offline batch backend
+                       (see batch.py) instead of as concurrent interactive requests.
+
+    Returns:
+        list[str]: The generated issues for each epic, in order (None for failed batch requests).
+    """
+    prompts = [build_issue_generation_prompt(epic, repository_context) for epic in epics]
+    if batch_backend is not None:
+        return issue_generation_agent.prompt_batch(
+            system_prompt=issue_generation_agent.system_prompt,
+            user_prompts=prompts,
+            backend=batch_backend
+        )
+    return asyncio.run(issue_generation_agent.prompt_many(
+        system_prompt=issue_generation_agent.system_prompt,
+        user_prompts=prompts
+    ))
 
 if __name__ == "__main__":
     repo_path = "/Users/aarjavjain/Desktop/Dev/aienginehackathon/agility"
-    repository_context = read_repository(repo_path)
 
     # Example epic prompt
     epic = "Implement a feature that integrates user authentication with third-party OAuth."
+    repository_context = build_repository_context(epic, repo_path)
 
     issues = generate_issues(epic, repository_context)
     print("Generated Issues:\n", issues) 
\ No newline at end of file
@@ -1,41 +1,395 @@
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import time
+import asyncio
+import openai
+from clients import get_openai_client, get_async_openai_client
+from cache import make_cache_key
+from context_history import ContextHistory
+from scheduler import PRIORITY_BULK
+from tokens import estimate_tokens
+from tracing import tracer
+from batch import run_batch, OpenAIBatchBackend
+from schemas import response_format as schema_response_format, structured_prompt
 
 # Create a model class from which objects can be created to interact with the model.
 # Model objects allows for easy switching between different models.
 
 class Model:
-    def __init__(self, model_name, system_prompt, temperature=0.7):
+    def __init__(self, model_name, system_prompt, temperature=0.7, max_concurrency=8, cache=None,
+                 max_context_entries=50, max_context_tokens=200_000, context_spill_path=None,
+                 scheduler=None, priority=PRIORITY_BULK, expected_completion_tokens=1024,
+                 router=None, task=None):
         self.model_name = model_name
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.system_prompt = system_prompt
         self.temperature = temperature
 
-        self.context_history = []
+        # Maximum number of requests in flight at once on the async path
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
 
+        # Optional ResponseCache consulted before calling the model
+        self.cache = cache
 
-    def prompt(self, system_prompt, user_prompt, temperature=None, update_temperature=False, update_context=True):
+        # Optional RequestScheduler that admits, orders and retries requests
+        self.scheduler = scheduler
+        self.priority = priority
+        # Completion size assumed when charging the tokens/min budget before a request is sent
+        self.expected_completion_tokens = expected_completion_tokens
+
+        # Optional ModelRouter that picks the model by task and prompt size and hedges slow requests
+        self.router = router
+        self.task = task
+
+        # Bounded history of prompts and responses, evicted oldest-first
+        self.context_history = ContextHistory(
+            max_entries=max_context_entries,
+            max_tokens=max_context_tokens,
+            spill_path=context_spill_path,
+        )
+
+    # Clients come from the process-wide registry so all agents share one connection pool
+    @property
+    def client(self):
+        return get_openai_client()
+
+    @property
+    def async_client(self):
+        return get_async_openai_client()
+
+    def _resolve_temperature(self, temperature, update_temperature):
         if temperature is None:
             temperature = self.temperature
         if update_temperature:
             self.temperature = temperature
+        return temperature
 
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=temperature,
-        )
+    def _build_messages(self, system_prompt, user_prompt):
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
 
+    def _record_context(self, user_prompt, response_text):
         context = [
             {"user_prompt" : user_prompt},
-            {"assistant_response" : response.choices[0].message.content},
+            {"assistant_response" : response_text},
         ]
+        self.context_history.append(context)
+
+    def _cache_lookup(self, system_prompt, user_prompt, temperature, use_cache, response_format=None):
+        if self.cache is None:
+            return None, None
+        key = make_cache_key(self.model_name, system_prompt, user_prompt, temperature, response_format)
+        # Bypassed calls skip the lookup but still refresh the stored response
+        if not use_cache:
+            return key, None
+        return key, self.cache.get(key)
+
+    async def _acache_lookup(self, system_prompt, user_prompt, temperature, use_cache, response_format=None):
+        """
+        Async counterpart of _cache_lookup(); the disk tier is not read on the event loop.
+        """
+        if self.cache is None:
+            return None, None
+        key = make_cache_key(self.model_name, system_prompt, user_prompt, temperature, response_format)
+        if not use_cache:
+            return key, None
+        return key, await self.cache.aget(key)
+
+    def _estimate_request_tokens(self, system_prompt, user_prompt) -> int:
+        return estimate_tokens(system_prompt) + estimate_tokens(user_prompt) + self.expected_completion_tokens
+
+    def _send(self, model_name, messages, temperature, priority, tokens, **kwargs):
+        """
+        Sends one chat completion request to model_name, through the scheduler when one is
+        configured. With a router, only the network call of the admitted request is hedged.
+        """
+        priority = self.priority if priority is None else priority
+        # The scheduler owns retries, so the client's built-in retries are turned off
+        client = self.client if self.scheduler is None else self.client.with_options(max_retries=0)
+        call = lambda: client.chat.completions.create(
+            model=model_name, messages=messages, temperature=temperature, **kwargs
+        )
+        if self.router is not None and not kwargs.get("stream"):
+            admit_hedge = None if self.scheduler is None else (lambda: self.scheduler.try_admit(tokens, priority))
+            request = lambda: self.router.hedged(call, model_name, admit_hedge)
+        else:
+            request = call
+
+        if self.scheduler is None:
+            return request()
+        response = self.scheduler.run(request, tokens, priority)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.scheduler.record_usage(tokens, usage.total_tokens)
+        return response
+
+    async def _asend(self, model_name, messages, temperature, priority, tokens, **kwargs):
+        """
+        Async counterpart of _send().
+        """
+        priority = self.priority if priority is None else priority
+        client = self.async_client if self.scheduler is None else self.async_client.with_options(max_retries=0)
+        call = lambda: client.chat.completions.create(
+            model=model_name, messages=messages, temperature=temperature, **kwargs
+        )
+        if self.router is not None:
+            admit_hedge = None if self.scheduler is None else (lambda: self.scheduler.try_admit(tokens, priority))
+            request = lambda: self.router.ahedged(call, model_name, admit_hedge)
+        else:
+            request = call
+
+        if self.scheduler is None:
+            return await request()
+        response = await self.scheduler.arun(request, tokens, priority)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.scheduler.record_usage(tokens, usage.total_tokens)
+        return response
+
+    def _complete(self, system_prompt, user_prompt, temperature, priority=None, task=None, **kwargs):
+        """
+        Sends a chat completion request, routed (with fallback) by the router when one is configured.
+        """
+        messages = self._build_messages(system_prompt, user_prompt)
+        tokens = self._estimate_request_tokens(system_prompt, user_prompt)
+        send = lambda model_name: self._send(model_name, messages, temperature, priority, tokens, **kwargs)
+        if self.router is None:
+            return send(self.model_name)
+
+        prompt_tokens = tokens - self.expected_completion_tokens
+        task = self.task if task is None else task
+        if kwargs.get("stream"):
+            # Streams are routed but not hedged or retried on another model
+            return send(self.router.select(self.model_name, task, prompt_tokens)[0])
+        return self.router.complete(send, self.model_name, task, prompt_tokens)
+
+    async def _acomplete(self, system_prompt, user_prompt, temperature, priority=None, task=None, **kwargs):
+        """
+        Async counterpart of _complete().
+        """
+        messages = self._build_messages(system_prompt, user_prompt)
+        tokens = self._estimate_request_tokens(system_prompt, user_prompt)
+        send = lambda model_name: self._asend(model_name, messages, temperature, priority, tokens, **kwargs)
+        if self.router is None:
+            return await send(self.model_name)
+
+        prompt_tokens = tokens - self.expected_completion_tokens
+        task = self.task if task is None else task
+        return await self.router.acomplete(send, self.model_name, task, prompt_tokens)
+
+    def _trace_usage(self, span, response) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            # The router may have answered from a different model than the agent's own
+            model_name = getattr(response, "model", None) or self.model_name
+            span.record_usage(model_name, usage.prompt_tokens, usage.completion_tokens)
+
+    def _get_semaphore(self):
+        # asyncio primitives are bound to the loop they are first used on, so a new
+        # semaphore is created whenever the model is used from a different event loop.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def prompt(self, system_prompt, user_prompt, temperature=None, update_temperature=False, update_context=True, use_cache=True, priority=None, task=None,
+               response_format=None):
+        temperature = self._resolve_temperature(temperature, update_temperature)
+
+        with tracer.span("model.prompt", model=self.model_name) as span:
+            cache_key, response_text = self._cache_lookup(system_prompt, user_prompt, temperature, use_cache, response_format)
+            span.set(cached=response_text is not None)
+            if response_text is None:
+                kwargs = {} if response_format is None else {"response_format": response_format}
+                response = self._complete(system_prompt, user_prompt, temperature, priority, task, **kwargs)
+                self._trace_usage(span, response)
+                response_text = response.choices[0].message.content
+                if cache_key is not None:
+                    self.cache.put(cache_key, response_text)
+
+        if update_context:
+            self._record_context(user_prompt, response_text)
+
+        return response_text
+
+    def prompt_stream(self, system_prompt, user_prompt, temperature=None, update_temperature=False, update_context=True, use_cache=True, priority=None, task=None):
+        """
+        Streaming counterpart of prompt(). Yields the response text chunk by chunk as it
+        arrives; the full response is cached and recorded once the stream completes.
+        """
+        temperature = self._resolve_temperature(temperature, update_temperature)
+
+        with tracer.span("model.prompt_stream", model=self.model_name) as span:
+            cache_key, response_text = self._cache_lookup(system_prompt, user_prompt, temperature, use_cache)
+            span.set(cached=response_text is not None)
+            if response_text is not None:
+                yield response_text
+            else:
+                chunks = []
+                stream = self._complete(system_prompt, user_prompt, temperature, priority, task, stream=True)
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        chunks.append(token)
+                        yield token
+                response_text = "".join(chunks)
+                # Streamed responses carry no usage block, so the token counts are estimated
+                span.record_usage(
+                    self.model_name,
+                    estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+                    estimate_tokens(response_text),
+                )
+                if cache_key is not None:
+                    self.cache.put(cache_key, response_text)
+
+        if update_context:
+            self._record_context(user_prompt, response_text)
+
+    async def aprompt(self, system_prompt, user_prompt, temperature=None, update_temperature=False, update_context=True, use_cache=True, priority=None, task=None,
+                      response_format=None):
+        """
+        Async counterpart of prompt(). At most max_concurrency calls are in flight at once.
+        """
+        temperature = self._resolve_temperature(temperature, update_temperature)
+
+        with tracer.span("model.aprompt", model=self.model_name) as span:
+            cache_key, response_text = await self._acache_lookup(system_prompt, user_prompt, temperature, use_cache, response_format)
+            span.set(cached=response_text is not None)
+            if response_text is None:
+                kwargs = {} if response_format is None else {"response_format": response_format}
+                queued = time.perf_counter()
+                async with self._get_semaphore():
+                    # Time spent waiting for a concurrency slot, so request latency can be told apart from queueing
+                    span.set(queue_seconds=time.perf_counter() - queued)
+                    response = await self._acomplete(system_prompt, user_prompt, temperature, priority, task, **kwargs)
+                self._trace_usage(span, response)
+                response_text = response.choices[0].message.content
+                if cache_key is not None:
+                    await self.cache.aput(cache_key, response_text)
+
+        if update_context:
+            self._record_context(user_prompt, response_text)
+
+        return response_text
+
+    def prompt_structured(self, system_prompt, user_prompt, schema, parse, fallback_parse, **kwargs):
+        """
+        Requests a JSON response matching schema and decodes it with parse. If the request is
+        rejected (e.g. the model does not support structured outputs) or the response does not
+        validate, the prompt is sent again in its text format and decoded with fallback_parse.
+
+        Args:
+            system_prompt (str): The system prompt.
+            user_prompt (str): The user prompt, written for the text format.
+            schema (type[pydantic.BaseModel]): The response schema (see schemas.py).
+            parse (Callable): Decodes the JSON response; raises ValueError if it does not validate.
+            fallback_parse (Callable): Decodes the text response.
+            **kwargs: Passed on to prompt().
+
+        Returns:
+            The result of parse, or of fallback_parse if structured output failed.
+        """
+        try:
+            response_text = self.prompt(
+                system_prompt, structured_prompt(user_prompt), response_format=schema_response_format(schema), **kwargs
+            )
+            return parse(response_text)
+        except (openai.BadRequestError, ValueError) as e:
+            print(f"Warning: Structured {schema.__name__} response failed ({e}). Falling back to the text format.")
+        return fallback_parse(self.prompt(system_prompt, user_prompt, **kwargs))
+
+    async def aprompt_structured(self, system_prompt, user_prompt, schema, parse, fallback_parse, **kwargs):
+        """
+        Async counterpart of prompt_structured().
+        """
+        try:
+            response_text = await self.aprompt(
+                system_prompt, structured_prompt(user_prompt), response_format=schema_response_format(schema), **kwargs
+            )
+            return parse(response_text)
+        except (openai.BadRequestError, ValueError) as e:
+            print(f"Warning: Structured {schema.__name__} response failed ({e}). Falling back to the text format.")
+        return fallback_parse(await self.aprompt(system_prompt, user_prompt, **kwargs))
+
+    async def prompt_many(self, system_prompt, user_prompts, temperature=None, update_context=True, use_cache=True, priority=None, task=None):
+        """
+        Sends a batch of user prompts concurrently, bounded by max_concurrency.
+
+        Args:
+            system_prompt (str): The system prompt shared by every request.
+            user_prompts (list[str]): The user prompts to send.
+            temperature (float): Optional temperature override for the batch.
+            update_context (bool): Whether to record the exchanges in context_history.
+            use_cache (bool): Whether cached responses may be returned instead of fresh samples.
+            priority (int): Optional scheduler priority override for the batch.
+            task (str): Optional task type used by the router to pick a model.
+
+        Returns:
+            list[str]: The responses, in the same order as user_prompts.
+        """
+        responses = await asyncio.gather(*[
+            self.aprompt(system_prompt, user_prompt, temperature=temperature, update_context=False, use_cache=use_cache, priority=priority, task=task)
+            for user_prompt in user_prompts
+        ])
+
+        # Record the context after the batch so the history keeps the input order
+        if update_context:
+            for user_prompt, response_text in zip(user_prompts, responses):
+                self._record_context(user_prompt, response_text)
+
+        return list(responses)
+
+    def prompt_batch(self, system_prompt, user_prompts, temperature=None, update_context=True, use_cache=True,
+                     backend=None, poll_interval=30.0, timeout=None):
+        """
+        Sends a list of user prompts through the offline batch backend and waits for the results.
+        Trades latency for throughput and cost, for bulk jobs such as nightly regeneration.
+
+        Args:
+            system_prompt (str): The system prompt shared by every request.
+            user_prompts (list[str]): The user prompts to send.
+            temperature (float): Optional temperature override for the batch.
+            update_context (bool): Whether to record the exchanges in context_history.
+            use_cache (bool): Whether cached responses may be returned instead of fresh samples.
+            backend: Batch backend to submit to; defaults to the OpenAI Batch API.
+            poll_interval (float): Seconds between batch status checks.
+            timeout (float): Optional maximum number of seconds to wait for the batch.
+
+        Returns:
+            list[str]: The responses, in the same order as user_prompts (None for failed requests).
+        """
+        temperature = self._resolve_temperature(temperature, False)
+        if backend is None:
+            backend = OpenAIBatchBackend(self.client)
+
+        responses = [None] * len(user_prompts)
+        cache_keys = [None] * len(user_prompts)
+        requests = []
+        for index, user_prompt in enumerate(user_prompts):
+            cache_keys[index], responses[index] = self._cache_lookup(system_prompt, user_prompt, temperature, use_cache)
+            if responses[index] is None:
+                requests.append((f"request-{index}", {
+                    "model": self.model_name,
+                    "messages": self._build_messages(system_prompt, user_prompt),
+                    "temperature": temperature,
+                }))
+
+        if requests:
+            with tracer.span("model.prompt_batch", model=self.model_name, requests=len(requests)):
+                results = run_batch(backend, requests, poll_interval=poll_interval, timeout=timeout)
+            for custom_id, _ in requests:
+                index = int(custom_id.split("-")[1])
+                responses[index] = results.get(custom_id)
+                if responses[index] is not None and cache_keys[index] is not None:
+                    self.cache.put(cache_keys[index], responses[index])
 
         if update_context:
-            self.context_history.append(context)
+            for user_prompt, response_text in zip(user_prompts, responses):
+                if response_text is not None:
+                    self._record_context(user_prompt, response_text)
 
-        return response.choices[0].message.content
\ No newline at end of file
+        return responses
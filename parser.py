@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from ticket import Epic, Issue
 from typing import Optional
+from tracing import traced
+from schemas import EpicResponse, IssueProposalsResponse
 
 class Parser(ABC):
     @abstractmethod
@@ -11,7 +13,25 @@ class Parser(ABC):
         pass
 
 
+def iter_lines(tokens):
+    """
+    Reassembles a stream of text chunks into complete lines (without the trailing newline).
+    The final partial line, if any, is yielded once the stream ends.
+    """
+    buffer = ""
+    for token in tokens:
+        buffer += token
+        # A long line arriving in many chunks is split once, not once per chunk
+        if "\n" not in token:
+            continue
+        *lines, buffer = buffer.split("\n")
+        yield from lines
+    if buffer:
+        yield buffer
+
+
 class EpicParser(Parser):
+    @traced("parser.epic")
     def parse(raw_output, epic: Optional[Epic] = None) -> tuple[Epic, str]:
         """
         Parses the LLM output for epic feedback.
@@ -25,11 +45,27 @@ class EpicParser(Parser):
                    - updated_epic: An Epic object with 'proposed_content' updated.
                    - changes_summary: A string containing the summary of changes.
         """
+        events = dict(EpicParser.parse_stream(raw_output.splitlines(keepends=True), epic))
+        return events["epic"], events["summary"]
+
+    def parse_stream(tokens, epic: Optional[Epic] = None):
+        """
+        Incrementally parses a streamed LLM output for epic feedback.
+
+        Args:
+            tokens (Iterable[str]): Text chunks as they arrive from the model.
+            epic (Optional[Epic]): The original epic object, if available.
+
+        Yields:
+            tuple: ("epic", updated_epic) as soon as the Epic section closes,
+                   followed by ("summary", changes_summary) once the stream ends.
+        """
         epic_lines = []
         summary_lines = []
         mode = None
+        epic_emitted = False
 
-        for line in raw_output.splitlines():
+        for line in iter_lines(tokens):
             if line.startswith("Epic:"):
                 mode = "epic"
                 text = line[len("Epic:"):].strip()
@@ -40,27 +76,207 @@ class EpicParser(Parser):
                 text = line[len("Summary:"):].strip()
                 if text:
                     summary_lines.append(text)
+                # The epic section is complete once the summary starts
+                if not epic_emitted:
+                    epic = EpicParser._build_epic(epic_lines, epic)
+                    epic_emitted = True
+                    yield "epic", epic
             elif mode == "epic":
                 epic_lines.append(line.strip())
             elif mode == "summary":
                 summary_lines.append(line.strip())
 
+        if not epic_emitted:
+            yield "epic", EpicParser._build_epic(epic_lines, epic)
+        yield "summary", "\n".join(summary_lines).strip()
+
+    @traced("parser.epic_json")
+    def parse_json(raw_output, epic: Optional[Epic] = None) -> tuple[Epic, str]:
+        """
+        Parses a structured (JSON) LLM output for an epic, see schemas.EpicResponse.
+
+        Raises:
+            ValueError: If the output does not match the schema. The epic is left untouched.
+
+        Returns:
+            tuple: (updated_epic, changes_summary), as parse() does.
+        """
+        response = EpicResponse.model_validate_json(raw_output)
+        return EpicParser._build_epic([response.epic], epic), response.summary.strip()
+
+    def _build_epic(epic_lines, epic: Optional[Epic]) -> Epic:
         proposed_epic_text = "\n".join(epic_lines).strip()
-        changes_summary = "\n".join(summary_lines).strip()
 
         # If the existing epic is not provided, create a new Epic object.
         if epic is None:
             epic = Epic(epic_content=proposed_epic_text)
         else:
             epic.propose_update(proposed_epic_text)
+        return epic
+
+class ProposalBlock:
+    """
+    One block of an issue feedback response: a proposal for an existing issue ("issue"),
+    a new issue ("new") or the proposal summary ("summary").
+    """
+    __slots__ = ("kind", "issue_id", "action", "title", "body", "lines")
+
+    def __init__(self, kind, issue_id, lines):
+        self.kind = kind
+        self.issue_id = issue_id
+        self.action = "Add" if kind == "new" else None
+        self.title = None
+        self.body = ""
+        # The raw lines of the block, header included
+        self.lines = lines
+
+    @property
+    def text(self) -> str:
+        # Joined on demand, as only the repair of incomplete blocks needs the raw text
+        return "\n".join(self.lines).rstrip()
+
+    def as_dict(self) -> dict:
+        return {"action": self.action, "proposed_title": self.title, "proposed_body": self.body}
+
+    def as_text(self) -> str:
+        """
+        Renders the block in the text format of the issue feedback prompt.
+        """
+        if self.kind == "summary":
+            return f"{SUMMARY_PREFIX}\n{self.body}"
+        header = NEW_ISSUE_PREFIX if self.kind == "new" else f"{ISSUE_PREFIX} {self.issue_id}:"
+        lines = [header, f"{ACTION_PREFIX} {self.action or ''}"]
+        if self.title is not None:
+            lines.append(f"{TITLE_PREFIX} {self.title}")
+        if self.body or self.kind == "new" or (self.action or "").lower() == "update":
+            lines.append(f"{BODY_PREFIX}\n{self.body}")
+        return "\n".join(lines)
+
+
+ISSUE_PREFIX = "Issue"
+NEW_ISSUE_PREFIX = "New Issue:"
+SUMMARY_PREFIX = "Proposal Summary:"
+ACTION_PREFIX = "Action:"
+TITLE_PREFIX = "Proposed Title:"
+BODY_PREFIX = "Proposed Body:"
+# Header and field lines are "<name>: <value>"; their kinds by name. "Issue <ID>" is read separately.
+LINE_KINDS = {
+    NEW_ISSUE_PREFIX[:-1]: "new",
+    SUMMARY_PREFIX[:-1]: "summary",
+    ACTION_PREFIX[:-1]: "action",
+    TITLE_PREFIX[:-1]: "title",
+    BODY_PREFIX[:-1]: "body",
+}
+# Size of the chunks a complete output is read in
+OUTPUT_CHUNK = 1 << 16
+# The first characters of a (possibly indented) header line; body lines starting otherwise skip the header check
+HEADER_STARTS = frozenset("INP \t\r\f\v")
 
-        return epic, changes_summary
 
-# TODO: Update IssueParser to use Issue Objects and follow the same pattern as EpicParser
 class IssueParser(Parser):
-    def parse(raw_output) -> tuple[dict, list, str]:
+    @traced("parser.issue")
+    def parse(raw_output, issues: Optional[list[Issue]] = None, failed: Optional[list] = None) -> tuple[list[Issue], str]:
         """
-        Parses the LLM output for issue feedback.
+        Parses the LLM output for issue feedback into Issue objects.
+
+        Args:
+            raw_output (str): The raw text output produced by the LLM.
+            issues (Optional[list[Issue]]): The current issues the proposals refer to, if available.
+            failed (Optional[list]): If given, the incomplete ProposalBlocks that were skipped are
+                appended to it, e.g. to repair them (see repair.py).
+
+        Returns:
+            tuple: (issues, proposal_summary)
+                   - issues: the given issues with "Update"/"Delete" proposals applied, followed by
+                     a new Issue in the "ADD" state for each proposed new issue.
+                   - proposal_summary: a string containing the summary.
+        """
+        return IssueParser._collect(IssueParser.iter_blocks(raw_output), issues, failed)
+
+    def parse_stream(tokens, issues: Optional[list[Issue]] = None, failed: Optional[list] = None):
+        """
+        Incrementally parses a streamed LLM output for issue feedback. Each block is emitted as
+        soon as the next block starts (or the stream ends), so blank lines inside a proposed body
+        are kept.
+
+        Args:
+            tokens (Iterable[str]): Text chunks as they arrive from the model.
+            issues (Optional[list[Issue]]): The current issues the proposals refer to, if available.
+                New issues are not appended to this list; the caller receives them as events.
+            failed (Optional[list]): If given, the incomplete ProposalBlocks that were skipped are
+                appended to it.
+
+        Yields:
+            tuple: one of
+                  - ("issue", issue): an existing Issue with an Update or Delete proposal applied
+                  - ("new_issue", issue): a new Issue in the "ADD" state
+                  - ("summary", proposal_summary)
+        """
+        yield from IssueParser._apply(IssueParser._iter_streamed_blocks(tokens), issues, failed)
+
+    @traced("parser.issue_json")
+    def parse_json(raw_output, issues: Optional[list[Issue]] = None, failed: Optional[list] = None) -> tuple[list[Issue], str]:
+        """
+        Parses a structured (JSON) LLM output for issue feedback, see schemas.IssueProposalsResponse.
+        Proposals are applied as in parse(), including the warnings for incomplete ones.
+
+        Raises:
+            ValueError: If the output does not match the schema. No issue is touched.
+
+        Returns:
+            tuple: (issues, proposal_summary), as parse() does.
+        """
+        response = IssueProposalsResponse.model_validate_json(raw_output)
+        blocks = []
+        for proposal in response.proposals:
+            is_new = proposal.action == "Add"
+            block = ProposalBlock("new" if is_new else "issue", None if is_new else proposal.issue_id, [])
+            block.action = proposal.action
+            block.title = (proposal.proposed_title or "").strip() or None
+            block.body = (proposal.proposed_body or "").strip()
+            block.lines = block.as_text().split("\n")
+            blocks.append(block)
+        blocks.append(ProposalBlock("summary", None, []))
+        blocks[-1].body = response.summary.strip()
+        return IssueParser._collect(blocks, issues, failed)
+
+    def _collect(blocks, issues, failed=None):
+        issues = [] if issues is None else issues
+        proposal_summary = ""
+        for kind, payload in IssueParser._apply(blocks, issues, failed):
+            if kind == "summary":
+                proposal_summary = payload
+            elif kind == "new_issue":
+                issues.append(payload)
+        return issues, proposal_summary
+
+    def _apply(blocks, issues, failed=None):
+        issues_by_id = {issue.get_id(): issue for issue in issues or ()}
+        for block in blocks:
+            if not IssueParser.is_complete(block):
+                if failed is not None:
+                    failed.append(block)
+                continue
+            if block.kind == "summary":
+                yield "summary", block.body
+            elif block.kind == "new":
+                new_issue = Issue(current_title=None, current_body=None, state="ADD")
+                new_issue.propose_update(block.title, block.body, state="ADD")
+                yield "new_issue", new_issue
+            elif block.issue_id in issues_by_id:
+                issue = issues_by_id[block.issue_id]
+                action = (block.action or "").lower()
+                if action == "update":
+                    issue.propose_update(block.title, block.body, state="UPDATE")
+                elif action == "delete":
+                    issue.set_state("DELETE")
+                else:
+                    continue
+                yield "issue", issue
+
+    def parse_proposals(raw_output) -> tuple[dict, list, str]:
+        """
+        Parses the LLM output for issue feedback into plain dicts, without touching any Issue.
 
         Returns:
             tuple: (modifications, new_proposals, proposal_summary)
@@ -70,97 +286,127 @@ class IssueParser(Parser):
                           "proposed_body": <value> (if applicable) }
                   - new_proposals: list of dicts, each with keys:
                         { "action": "Add",
-                          "proposed_title": <value>, 
+                          "proposed_title": <value>,
                           "proposed_body": <value> }
                   - proposal_summary: a string containing the summary.
         """
         modifications = {}
         new_proposals = []
         proposal_summary = ""
+        for block in IssueParser.iter_blocks(raw_output):
+            if not IssueParser.is_complete(block):
+                continue
+            if block.kind == "summary":
+                proposal_summary = block.body
+            elif block.kind == "new":
+                new_proposals.append(block.as_dict())
+            elif block.action is not None:
+                # A header without an Action line proposes nothing, as in _apply
+                modifications[block.issue_id] = block.as_dict()
+        return modifications, new_proposals, proposal_summary
 
-        # Split the output into blocks by double newlines.
-        blocks = [block.strip() for block in raw_output.split("\n\n") if block.strip()]
+    def iter_blocks(raw_output):
+        """
+        Splits the output into ProposalBlocks in a single pass over its lines (see _iter_line_blocks).
+        The output is read in chunks like a stream, so it is never split into one list of lines.
 
-        for block in blocks:
-            lines = block.splitlines()
-            if not lines:
-                continue
+        Yields:
+            ProposalBlock: each block in order; text before the first header is skipped.
+        """
+        chunks = (raw_output[start:start + OUTPUT_CHUNK] for start in range(0, len(raw_output), OUTPUT_CHUNK))
+        return IssueParser._iter_line_blocks(iter_lines(chunks))
 
-            header = lines[0].strip()
+    def _iter_streamed_blocks(tokens):
+        return IssueParser._iter_line_blocks(iter_lines(tokens))
 
-            # Handle the proposal summary block.
-            if header.startswith("Proposal Summary:"):
-                summary_lines = [line.strip() for line in lines[1:]]
-                proposal_summary = "\n".join(summary_lines).strip()
-                continue
+    def _iter_line_blocks(lines):
+        """
+        The block tokenizer shared by the batch and stream paths: a state machine fed one line at
+        a time. A header line ("Issue <ID>:", "New Issue:" or "Proposal Summary:") closes the
+        current block and opens the next; before "Proposed Body:" the Action and Proposed Title
+        lines are read as fields, and from there on every line belongs to the body, blank lines
+        included. Once a body has started, a header only counts after a blank line, so a body line
+        such as "Issue 2: must land first." stays in the body. The summary is the last block: every
+        line after "Proposal Summary:" belongs to it. Body lines are kept verbatim; only blank lines
+        around the body are dropped.
 
-            if header.startswith("Issue"):
-                # Parse an update or deletion proposal for an existing issue.
-                try:
-                    # Expected header format: "Issue <ID>:"
-                    issue_id = int(header.split()[1].replace(":", ""))
-                except Exception as e:
-                    print(f"Error parsing issue id in proposal: {e}")
+        Yields:
+            ProposalBlock: each block as soon as the next header (or the end of lines) is reached.
+        """
+        block = None
+        # Once the body has started: the index of its first line in block.lines, and its inline text
+        body_start = None
+        inline = ""
+        in_summary = False
+        for line in lines:
+            if body_start is not None and (
+                not line or line[0] not in HEADER_STARTS or in_summary or block.lines[-1].strip()
+            ):
+                block.lines.append(line)
+                continue
+            name, colon, value = line.strip().partition(":")
+            kind = LINE_KINDS.get(name) if colon else None
+            if kind == "new" or kind == "summary" or (kind is None and colon and name.startswith(ISSUE_PREFIX)):
+                header = IssueParser._read_header(kind, name, line)
+                if header is not None:
+                    if block is not None:
+                        yield IssueParser._close_block(block, body_start, inline)
+                    block = header
+                    if kind == "summary":
+                        # The summary may start inline, right after the prefix
+                        body_start, inline = 1, value.strip()
+                        in_summary = True
+                    else:
+                        body_start = None
                     continue
+            if block is None:
+                continue
+            block.lines.append(line)
+            if body_start is not None:
+                continue
+            if kind == "body":
+                # The body may start inline, right after the prefix
+                body_start, inline = len(block.lines), value.strip()
+            elif kind == "action":
+                block.action = value.strip()
+            elif kind == "title":
+                block.title = value.strip()
+        if block is not None:
+            yield IssueParser._close_block(block, body_start, inline)
 
-                action = None
-                proposed_title = None
-                proposed_body_lines = []
-
-                for idx, raw_line in enumerate(lines[1:], start=1):
-                    line = raw_line.strip()
-                    if line.startswith("Action:"):
-                        action = line.split("Action:")[1].strip()
-                    elif line.startswith("Proposed Title:"):
-                        proposed_title = line.split("Proposed Title:")[1].strip()
-                    elif line.startswith("Proposed Body:"):
-                        # Updated logic to check inline text as well as subsequent lines.
-                        text = line[len("Proposed Body:"):].strip()
-                        if text:
-                            proposed_body_lines.append(text)
-                        # Append any remaining lines in this block.
-                        proposed_body_lines.extend([l.strip() for l in lines[idx+1:]])
-                        break
-
-                proposed_body = "\n".join(proposed_body_lines).strip()
-
-                # For update action, both title and body are required.
-                if action and action.lower() == "update":
-                    if not proposed_title or not proposed_body:
-                        print(f"Warning: Incomplete update proposal for Issue {issue_id}. Skipping.")
-                        continue
-
-                modifications[issue_id] = {
-                    "action": action,
-                    "proposed_title": proposed_title,
-                    "proposed_body": proposed_body,
-                }
-
-            elif header.startswith("New Issue:"):
-                # For new issues, we include an action of "Add".
-                action = "Add"
-                proposed_title = None
-                proposed_body_lines = []
-
-                for idx, raw_line in enumerate(lines[1:], start=1):
-                    line = raw_line.strip()
-                    if line.startswith("Proposed Title:"):
-                        proposed_title = line.split("Proposed Title:")[1].strip()
-                    elif line.startswith("Proposed Body:"):
-                        text = line[len("Proposed Body:"):].strip()
-                        if text:
-                            proposed_body_lines.append(text)
-                        proposed_body_lines.extend([l.strip() for l in lines[idx+1:]])
-                        break
-
-                proposed_body = "\n".join(proposed_body_lines).strip()
-                if not proposed_title or not proposed_body:
-                    print("Warning: Incomplete new issue proposal. Skipping.")
-                else:
-                    new_proposals.append({
-                        "action": action,
-                        "proposed_title": proposed_title,
-                        "proposed_body": proposed_body
-                    })
+    def _read_header(kind, name, line) -> Optional[ProposalBlock]:
+        if kind is not None:
+            return ProposalBlock(kind, None, [line])
+        try:
+            # "Issue <ID>" or "Issue #<ID>"
+            issue_id = int(name[len(ISSUE_PREFIX):].replace("#", "", 1))
+        except ValueError:
+            # e.g. "Issues to consider:" in a body
+            return None
+        return ProposalBlock("issue", issue_id, [line])
+
+    def _close_block(block, body_start, inline) -> ProposalBlock:
+        if body_start is None:
+            return block
+        lines = block.lines
+        start = body_start
+        if not inline:
+            while start < len(lines) and not lines[start].strip():
+                start += 1
+        body = "\n".join(lines[start:]).rstrip()
+        block.body = f"{inline}\n{body}".rstrip() if inline else body
+        return block
 
-        return modifications, new_proposals, proposal_summary
\ No newline at end of file
+    def is_complete(block) -> bool:
+        """
+        Checks that a block has everything its action needs, printing a warning if it does not.
+        """
+        if block.kind == "issue":
+            # For update action, both title and body are required.
+            if block.action and block.action.lower() == "update" and (not block.title or not block.body):
+                print(f"Warning: Incomplete update proposal for Issue {block.issue_id}. Skipping.")
+                return False
+        elif block.kind == "new" and (not block.title or not block.body):
+            print("Warning: Incomplete new issue proposal. Skipping.")
+            return False
+        return True
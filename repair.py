@@ -0,0 +1,134 @@
+import threading
+from parser import IssueParser
+from tokens import estimate_tokens
+from tracing import tracer
+
+# Targeted repair of malformed issue proposals. Blocks that IssueParser skips as incomplete are
+# sent back to the model in a short re-prompt on their own, and the fixed proposals are merged
+# into the original result, instead of regenerating every proposal with the full prompt.
+
+repair_prompt = """
+You are an experienced project management assistant. Some of the proposals you made for the
+issues below were incomplete and could not be applied:
+- An Update needs both a Proposed Title and a Proposed Body.
+- A New Issue needs an Action of Add, a Proposed Title and a Proposed Body.
+Rewrite only these proposals so that each one is complete, keeping their intent. Use exactly the
+format they are written in, separate them with a blank line and do not add a Proposal Summary.
+"""
+
+
+class RepairStats:
+    """
+    Counts repair re-prompts and the tokens they used, compared with regenerating the full response.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.repairs = 0
+        self.blocks_failed = 0
+        self.blocks_repaired = 0
+        self.repair_tokens = 0
+        self.regeneration_tokens = 0
+
+    def record(self, blocks_failed, blocks_repaired, repair_tokens, regeneration_tokens) -> None:
+        with self._lock:
+            self.repairs += 1
+            self.blocks_failed += blocks_failed
+            self.blocks_repaired += blocks_repaired
+            self.repair_tokens += repair_tokens
+            self.regeneration_tokens += regeneration_tokens
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "repairs": self.repairs,
+                "blocks_failed": self.blocks_failed,
+                "blocks_repaired": self.blocks_repaired,
+                "repair_tokens": self.repair_tokens,
+                "regeneration_tokens": self.regeneration_tokens,
+                # Estimated tokens a full regeneration would have used beyond the repairs
+                "tokens_saved": self.regeneration_tokens - self.repair_tokens,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.repairs = self.blocks_failed = self.blocks_repaired = 0
+            self.repair_tokens = self.regeneration_tokens = 0
+
+
+repair_stats = RepairStats()
+
+
+def build_repair_prompt(failed, issues, user_feedback) -> str:
+    """
+    Builds the re-prompt for the failed blocks, with the current content of the issues they refer to.
+    """
+    issues_by_id = {issue.get_id(): issue for issue in issues}
+    referenced = [issues_by_id[block.issue_id] for block in failed if block.issue_id in issues_by_id]
+    current_issues_context = "\n".join(
+        f"Issue {issue.get_id()}:\nTitle: {issue.get_current_content()['issue_title']}\nBody: {issue.get_current_content()['issue_body']}\n"
+        for issue in referenced
+    )
+    incomplete_proposals = "\n\n".join(block.text.strip() for block in failed)
+    return f"""
+{repair_prompt}
+User Feedback:
+\"\"\"{user_feedback}\"\"\"
+
+Current Issues:
+\"\"\"{current_issues_context}\"\"\"
+
+Incomplete Proposals:
+\"\"\"{incomplete_proposals}\"\"\"
+"""
+
+
+def repair_proposals(failed, issues, user_feedback, complete, regeneration_tokens) -> tuple[list, list]:
+    """
+    Re-prompts the model for the failed proposal blocks only and applies the fixed proposals.
+
+    Args:
+        failed (list[ProposalBlock]): The blocks IssueParser skipped as incomplete.
+        issues (list[Issue]): The current issues; Update and Delete repairs are applied to them.
+        user_feedback (str): The feedback the proposals were generated for.
+        complete (Callable[[str], str]): Sends a prompt and returns the response text.
+        regeneration_tokens (int): Estimated tokens of the original prompt and response, i.e. what
+            regenerating every proposal would cost.
+
+    Returns:
+        tuple: (events, still_failed)
+              - events: ("issue", issue) for repaired existing issues and ("new_issue", issue) for
+                repaired new issues, which are not appended to issues.
+              - still_failed: the blocks that are still incomplete after the repair.
+    """
+    if not failed:
+        return [], []
+
+    with tracer.span("repair.issue_proposals", blocks_failed=len(failed)) as span:
+        prompt = build_repair_prompt(failed, issues, user_feedback)
+        response_text = complete(prompt)
+
+        # Only accept proposals for the blocks that were sent, so the repair cannot touch other issues
+        failed_ids = {block.issue_id for block in failed if block.kind == "issue"}
+        new_slots = sum(1 for block in failed if block.kind == "new")
+        blocks = []
+        for block in IssueParser.iter_blocks(response_text):
+            if block.kind == "issue" and block.issue_id in failed_ids:
+                failed_ids.discard(block.issue_id)
+                blocks.append(block)
+            elif block.kind == "new" and new_slots:
+                new_slots -= 1
+                blocks.append(block)
+
+        still_failed = []
+        events = list(IssueParser._apply(blocks, issues, still_failed))
+        # Blocks the model left out of its answer are still failed
+        still_failed.extend(block for block in failed if block.kind == "issue" and block.issue_id in failed_ids)
+        failed_new = [block for block in failed if block.kind == "new"]
+        still_failed.extend(failed_new[len(failed_new) - new_slots:])
+
+        repair_tokens = estimate_tokens(prompt) + estimate_tokens(response_text)
+        repaired = len(failed) - len(still_failed)
+        repair_stats.record(len(failed), repaired, repair_tokens, regeneration_tokens)
+        span.set(blocks_repaired=repaired, repair_tokens=repair_tokens, tokens_saved=regeneration_tokens - repair_tokens)
+
+    return events, still_failed
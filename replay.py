@@ -0,0 +1,151 @@
+import json
+import time
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+from cache import make_cache_key
+from tokens import estimate_tokens
+
+# A deterministic record/replay stand-in for the OpenAI client. In "record" mode, calls are
+# forwarded to a real client and the responses are appended to a cassette file; in "replay"
+# mode, responses are served from the cassette (or a synthetic responder) with configurable
+# synthetic latency, so the pipeline can be run and benchmarked without live API calls.
+# Install it for every module with clients.use_llm_backend(ReplayClient(...)).
+
+STREAM_CHUNK_SIZE = 16
+
+
+def _split_messages(messages) -> tuple[str, str]:
+    system_prompt = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    user_prompt = "\n".join(m["content"] for m in messages if m["role"] != "system")
+    return system_prompt, user_prompt
+
+
+def _completion(model, text, prompt_tokens) -> SimpleNamespace:
+    completion_tokens = estimate_tokens(text)
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, finish_reason="stop", message=SimpleNamespace(role="assistant", content=text))],
+        usage=SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        ),
+    )
+
+
+def _stream_chunks(text):
+    for start in range(0, len(text), STREAM_CHUNK_SIZE):
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=text[start:start + STREAM_CHUNK_SIZE]))])
+
+
+class ReplayClient:
+    """
+    Mimics client.chat.completions.create() of the synchronous OpenAI client.
+    """
+    def __init__(self, cassette_path=None, mode="replay", client=None, responder=None,
+                 latency=0.0, latency_jitter=0.0, seed=0):
+        """
+        Args:
+            cassette_path (str): JSON lines file holding recorded responses.
+            mode (str): "record" to call client and store responses, "replay" to serve stored ones.
+            client: The real client used in record mode.
+            responder (Callable): Optional responder(model, system_prompt, user_prompt) used in replay
+                                  mode for prompts that are not in the cassette.
+            latency (float): Median synthetic latency in seconds added to each replayed call.
+            latency_jitter (float): Log-normal sigma applied to the latency (0 for a fixed latency).
+            seed (int): Seed for the latency generator, so runs are repeatable.
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown replay mode: {mode}")
+        if mode == "record" and client is None:
+            raise ValueError("Record mode needs a client to forward requests to")
+
+        self.cassette_path = cassette_path
+        self.mode = mode
+        self.upstream = client
+        self.responder = responder
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+        self.responses = {}
+        if cassette_path is not None and mode == "replay":
+            self.load(cassette_path)
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def load(self, cassette_path) -> None:
+        with open(cassette_path, "r", encoding="utf-8") as cassette:
+            for line in cassette:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[record["key"]] = record["response"]
+
+    def with_options(self, **options):
+        return self
+
+    def _next_latency(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        with self._lock:
+            if self.latency_jitter > 0:
+                return self.latency * self._random.lognormvariate(0.0, self.latency_jitter)
+            return self.latency
+
+    def _lookup(self, model, messages, temperature) -> str:
+        system_prompt, user_prompt = _split_messages(messages)
+        key = make_cache_key(model, system_prompt, user_prompt, temperature)
+        text = self.responses.get(key)
+        if text is None:
+            if self.responder is None:
+                raise KeyError(f"No recorded response for model {model} (key {key[:12]})")
+            text = self.responder(model, system_prompt, user_prompt)
+        return text
+
+    def _record(self, model, messages, temperature, text) -> None:
+        system_prompt, user_prompt = _split_messages(messages)
+        key = make_cache_key(model, system_prompt, user_prompt, temperature)
+        with self._lock:
+            self.responses[key] = text
+            if self.cassette_path is not None:
+                with open(self.cassette_path, "a", encoding="utf-8") as cassette:
+                    cassette.write(json.dumps({"key": key, "model": model, "response": text}, ensure_ascii=False) + "\n")
+
+    def create(self, model, messages, temperature=None, stream=False, **kwargs):
+        self.calls += 1
+        if self.mode == "record":
+            response = self.upstream.chat.completions.create(model=model, messages=messages, temperature=temperature, **kwargs)
+            text = response.choices[0].message.content
+            self._record(model, messages, temperature, text)
+        else:
+            text = self._lookup(model, messages, temperature)
+            delay = self._next_latency()
+            if delay:
+                time.sleep(delay)
+
+        if stream:
+            return _stream_chunks(text)
+        return _completion(model, text, sum(estimate_tokens(m["content"]) for m in messages))
+
+
+class AsyncReplayClient(ReplayClient):
+    """
+    Mimics client.chat.completions.create() of the asynchronous OpenAI client.
+    Synthetic latency is awaited, so concurrent replayed calls overlap like real ones.
+    """
+    async def create(self, model, messages, temperature=None, stream=False, **kwargs):
+        self.calls += 1
+        if self.mode == "record":
+            response = await self.upstream.chat.completions.create(model=model, messages=messages, temperature=temperature, **kwargs)
+            text = response.choices[0].message.content
+            self._record(model, messages, temperature, text)
+        else:
+            text = self._lookup(model, messages, temperature)
+            delay = self._next_latency()
+            if delay:
+                await asyncio.sleep(delay)
+        return _completion(model, text, sum(estimate_tokens(m["content"]) for m in messages))
@@ -0,0 +1,438 @@
+import os
+import mmap
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pathspec # For parsing .gitignore files
+from tracing import traced
+from skeleton import summarize_source, skeleton_key
+from tokens import estimate_tokens, CHARS_PER_TOKEN
+
+# Helpers for collecting the repository context that is sent to the LLM.
+
+DEFAULT_EXTENSIONS = (".py", ".js", ".java", ".ts")
+# Directories that are never useful as context, whether or not they are listed in a .gitignore
+ALWAYS_SKIPPED_DIRECTORIES = {".git", ".hg", ".svn", "node_modules", ".venv", "venv", "__pycache__"}
+MAX_FILE_SIZE = 1_000_000
+# Bytes inspected when deciding whether a file is binary
+BINARY_SNIFF_SIZE = 8192
+# Files at least this large are memory-mapped instead of read into a buffer
+MMAP_THRESHOLD = 256 * 1024
+# How file contents are put into the context: the raw text, or signatures and docstrings only
+CONTEXT_MODES = ("full", "skeleton")
+
+
+def _load_gitignore(directory):
+    """
+    Returns the PathSpec of the .gitignore in directory, or None if there is none.
+    """
+    gitignore_path = os.path.join(directory, ".gitignore")
+    if not os.path.isfile(gitignore_path):
+        return None
+    try:
+        with open(gitignore_path, "r", encoding="utf-8") as git_file:
+            return pathspec.PathSpec.from_lines("gitwildmatch", git_file.read().splitlines())
+    except Exception as e:
+        print(f"Error reading {gitignore_path}: {e}")
+        return None
+
+
+def _is_ignored(specs, relative_path, is_directory=False) -> bool:
+    """
+    Checks relative_path against the .gitignore specs of its ancestors, from the repository root
+    down. As in git, a deeper .gitignore can override (or negate) a shallower one.
+    """
+    ignored = False
+    for base, spec in specs:
+        path = os.path.relpath(relative_path, base) if base else relative_path
+        path = path.replace(os.sep, "/")
+        if is_directory:
+            path += "/"
+        include = spec.check_file(path).include
+        if include is not None:
+            ignored = include
+    return ignored
+
+
+def list_repository_files(repo_path, extensions=DEFAULT_EXTENSIONS, max_file_size=MAX_FILE_SIZE) -> list[tuple[str, str]]:
+    """
+    Walks the repository and returns (relative_path, full_path) pairs for every file with one of
+    the given extensions, in a stable sorted order. Ignored directories are pruned during the walk
+    rather than filtered per file, nested .gitignore files are honored, and files larger than
+    max_file_size bytes are skipped.
+    """
+    files = []
+    # .gitignore specs that apply to each directory, as (base relative path, spec) pairs
+    specs_by_directory = {}
+
+    for dirpath, dirnames, filenames in os.walk(repo_path):
+        relative_dir = os.path.relpath(dirpath, repo_path)
+        if relative_dir == ".":
+            relative_dir = ""
+
+        parent_specs = specs_by_directory.pop(dirpath, [])
+        spec = _load_gitignore(dirpath)
+        specs = parent_specs + [(relative_dir, spec)] if spec else parent_specs
+
+        # Prune in place so os.walk never descends into ignored directories.
+        kept = []
+        for dirname in sorted(dirnames):
+            if dirname in ALWAYS_SKIPPED_DIRECTORIES:
+                continue
+            if _is_ignored(specs, os.path.join(relative_dir, dirname), is_directory=True):
+                continue
+            kept.append(dirname)
+            specs_by_directory[os.path.join(dirpath, dirname)] = specs
+        dirnames[:] = kept
+
+        for filename in sorted(filenames):
+            if not filename.endswith(extensions):
+                continue
+            relative_path = os.path.join(relative_dir, filename)
+            if _is_ignored(specs, relative_path):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            try:
+                if os.path.getsize(full_path) > max_file_size:
+                    continue
+            except OSError as e:
+                print(f"Error reading {full_path}: {e}")
+                continue
+            files.append((relative_path, full_path))
+    return files
+
+
+def read_text_file(full_path):
+    """
+    Reads a UTF-8 text file, returning None for binary or unreadable files.
+    """
+    try:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        if b"\0" in data[:BINARY_SNIFF_SIZE]:
+            return None
+        return data.decode("utf-8")
+    except Exception as e:
+        print(f"Error reading {full_path}: {e}")
+        return None
+
+
+def _decode(data, full_path):
+    try:
+        return str(data, "utf-8")
+    except UnicodeDecodeError as e:
+        print(f"Error reading {full_path}: {e}")
+        return None
+
+
+def read_and_hash_file(full_path, size=None) -> tuple[str, str | None]:
+    """
+    Returns the SHA-256 of the file and its UTF-8 text (None for binary or undecodable files).
+    Large files are memory-mapped so they are hashed and decoded without an intermediate copy.
+    """
+    if size is None:
+        size = os.path.getsize(full_path)
+    with open(full_path, "rb") as f:
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest = hashlib.sha256(data).hexdigest()
+                if data.find(b"\0", 0, BINARY_SNIFF_SIZE) != -1:
+                    return digest, None
+                return digest, _decode(data, full_path)
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if b"\0" in data[:BINARY_SNIFF_SIZE]:
+        return digest, None
+    return digest, _decode(data, full_path)
+
+
+def format_file(relative_path, text) -> str:
+    return f"--- File: {relative_path} ---\n{text}\n"
+
+
+class FileEntry:
+    """
+    The snapshot of one repository file. text is None for binary or undecodable files.
+    """
+    __slots__ = ("path", "size", "mtime_ns", "hash", "text")
+
+    def __init__(self, path, size, mtime_ns, hash, text):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.hash = hash
+        self.text = text
+
+
+class RepositorySnapshot:
+    """
+    A persistent index of the repository files: (path, size, mtime, hash, text) per file.
+    refresh() only re-reads files whose size or mtime changed since the last run and reports
+    which files changed, so later stages can work incrementally.
+    """
+    def __init__(self, repo_path, path=None, extensions=DEFAULT_EXTENSIONS, max_file_size=MAX_FILE_SIZE, max_workers=8):
+        """
+        Args:
+            repo_path (str): Root of the repository.
+            path (str): Path of the SQLite file the index is kept in. None keeps it in memory only.
+            extensions (tuple[str]): File extensions to include.
+            max_file_size (int): Files larger than this many bytes are skipped.
+            max_workers (int): Threads used to read changed files.
+        """
+        self.repo_path = repo_path
+        self.path = path
+        self.extensions = tuple(extensions)
+        self.max_file_size = max_file_size
+        self.max_workers = max_workers
+
+        # relative path -> FileEntry, in walk order after each refresh
+        self.files = {}
+        # Paths added or modified, and paths removed, by the last refresh
+        self.changed = set()
+        self.removed = set()
+        # skeleton key -> skeleton, see skeleton.skeleton_key
+        self._skeletons = {}
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                "hash TEXT NOT NULL, text TEXT)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS skeletons (key TEXT PRIMARY KEY, skeleton TEXT NOT NULL)")
+            self._db.commit()
+            for row in self._db.execute("SELECT path, size, mtime_ns, hash, text FROM files"):
+                self.files[row[0]] = FileEntry(*row)
+
+    def _read_entry(self, item):
+        relative_path, full_path, size, mtime_ns = item
+        try:
+            digest, text = read_and_hash_file(full_path, size)
+        except Exception as e:
+            print(f"Error reading {full_path}: {e}")
+            return None
+        return FileEntry(relative_path, size, mtime_ns, digest, text)
+
+    def refresh(self) -> set[str]:
+        """
+        Brings the snapshot up to date with the working tree.
+
+        Returns:
+            set[str]: Relative paths of the files added or modified since the previous refresh.
+        """
+        with self._lock:
+            previous = self.files
+            current = {}
+            stale = []
+            for relative_path, full_path in list_repository_files(self.repo_path, self.extensions, self.max_file_size):
+                try:
+                    stat = os.stat(full_path)
+                except OSError as e:
+                    print(f"Error reading {full_path}: {e}")
+                    continue
+                entry = previous.get(relative_path)
+                if entry is not None and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+                    current[relative_path] = entry
+                else:
+                    # Keep the walk order; the slot is filled once the file has been read
+                    current[relative_path] = None
+                    stale.append((relative_path, full_path, stat.st_size, stat.st_mtime_ns))
+
+            changed = set()
+            updated = []
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for entry in executor.map(self._read_entry, stale):
+                    if entry is None:
+                        continue
+                    old = previous.get(entry.path)
+                    # A touched but unmodified file only needs its stat refreshed
+                    if old is None or old.hash != entry.hash:
+                        changed.add(entry.path)
+                    current[entry.path] = entry
+                    updated.append(entry)
+
+            self.files = {path: entry for path, entry in current.items() if entry is not None}
+            self.removed = set(previous) - set(self.files)
+            self.changed = changed
+
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, hash, text) VALUES (?, ?, ?, ?, ?)",
+                    [(entry.path, entry.size, entry.mtime_ns, entry.hash, entry.text) for entry in updated],
+                )
+                self._db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in self.removed])
+                self._db.commit()
+            return changed
+
+    def skeletons(self, paths=None) -> dict[str, str]:
+        """
+        Returns the code skeleton of each of the given paths (default: every text file). Skeletons
+        are cached by content hash, so only new or modified files are summarized.
+        """
+        if paths is None:
+            paths = self.files
+        result = {}
+        computed = []
+        with self._lock:
+            for relative_path in paths:
+                entry = self.files.get(relative_path)
+                if entry is None or entry.text is None:
+                    continue
+                key = skeleton_key(relative_path, entry.hash)
+                skeleton = self._skeletons.get(key)
+                if skeleton is None and self._db is not None:
+                    row = self._db.execute("SELECT skeleton FROM skeletons WHERE key = ?", (key,)).fetchone()
+                    skeleton = row[0] if row else None
+                if skeleton is None:
+                    skeleton = summarize_source(relative_path, entry.text)
+                    computed.append((key, skeleton))
+                self._skeletons[key] = skeleton
+                result[relative_path] = skeleton
+            if computed and self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO skeletons (key, skeleton) VALUES (?, ?)", computed)
+                self._db.commit()
+        return result
+
+    def render(self, paths=None, context_mode="full") -> str:
+        """
+        Concatenates the text (or, with context_mode "skeleton", the code skeleton) of the given
+        paths (default: every file) with file path headers, in the same format as read_repository.
+        """
+        if context_mode not in CONTEXT_MODES:
+            raise ValueError(f"Unknown context mode: {context_mode}")
+        if paths is None:
+            paths = self.files
+        if context_mode == "skeleton":
+            return "\n".join(format_file(path, skeleton) for path, skeleton in self.skeletons(paths).items())
+        content_list = []
+        for relative_path in paths:
+            entry = self.files.get(relative_path)
+            if entry is not None and entry.text is not None:
+                content_list.append(format_file(relative_path, entry.text))
+        return "\n".join(content_list)
+
+
+def _split_text(text, token_budget) -> list[str]:
+    """
+    Splits text on line boundaries into pieces of at most token_budget tokens (estimated).
+    """
+    limit = token_budget * CHARS_PER_TOKEN
+    pieces = []
+    current = []
+    size = 0
+    for line in text.splitlines(keepends=True):
+        if current and size + len(line) > limit:
+            pieces.append("".join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line)
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def shard_repository(snapshot, token_budget, context_mode="full") -> list[str]:
+    """
+    Splits the snapshot into repository contexts of at most token_budget tokens each, in walk
+    order so related files stay together. Files larger than the budget are split into parts.
+
+    A shard is closed early, once it is at least half full, after any file whose path hash
+    selects it as a boundary. Shard boundaries therefore depend on the paths rather than only
+    on running sizes, so editing or adding one file leaves the other shards (and their cached
+    results) unchanged in most cases.
+    """
+    if context_mode not in CONTEXT_MODES:
+        raise ValueError(f"Unknown context mode: {context_mode}")
+    if context_mode == "skeleton":
+        texts = snapshot.skeletons()
+    else:
+        texts = {path: entry.text for path, entry in snapshot.files.items() if entry.text is not None}
+
+    shards = []
+    current = []
+    used = 0
+    for path, text in texts.items():
+        parts = [text]
+        if estimate_tokens(text) > token_budget:
+            parts = _split_text(text, token_budget)
+        for index, part in enumerate(parts):
+            header = path if len(parts) == 1 else f"{path} (part {index + 1} of {len(parts)})"
+            block = format_file(header, part)
+            cost = estimate_tokens(block)
+            if current and used + cost > token_budget:
+                shards.append("\n".join(current))
+                current = []
+                used = 0
+            current.append(block)
+            used += cost
+        boundary = int(hashlib.sha256(path.encode("utf-8")).hexdigest()[:8], 16) % 4 == 0
+        if boundary and used >= token_budget // 2:
+            shards.append("\n".join(current))
+            current = []
+            used = 0
+    if current:
+        shards.append("\n".join(current))
+    return shards
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def get_repository_snapshot(repo_path, extensions=DEFAULT_EXTENSIONS, max_file_size=MAX_FILE_SIZE) -> RepositorySnapshot:
+    """
+    Returns the process-wide snapshot of repo_path, persisted under the directory set by the
+    REPOSITORY_SNAPSHOT_DIR environment variable (default .agility_cache/snapshots).
+    """
+    key = (os.path.abspath(repo_path), tuple(extensions), max_file_size)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:16]
+            directory = os.getenv("REPOSITORY_SNAPSHOT_DIR", ".agility_cache/snapshots")
+            snapshot = RepositorySnapshot(repo_path, os.path.join(directory, f"{name}.sqlite"), extensions, max_file_size)
+            _snapshots[key] = snapshot
+        return snapshot
+
+
+@traced("issue_generation.read_repository")
+def read_repository(repo_path, extensions=DEFAULT_EXTENSIONS, max_file_size=MAX_FILE_SIZE, max_workers=8, use_snapshot=True,
+                    context_mode="full"):
+    """
+    Recursively reads files from the given repository path, excluding files and directories
+    that match the patterns in the .gitignore files, and concatenates their contents
+    into a single string with file path headers. Only files with specified extensions are included.
+    Files are read on a thread pool; the output order is the sorted walk order.
+    Unless use_snapshot is False, only files changed since the previous run are re-read
+    (see RepositorySnapshot). With context_mode "skeleton", each file is replaced by its
+    signatures, docstrings and imports (see skeleton.py).
+    """
+    if context_mode not in CONTEXT_MODES:
+        raise ValueError(f"Unknown context mode: {context_mode}")
+    if use_snapshot:
+        snapshot = get_repository_snapshot(repo_path, extensions, max_file_size)
+        snapshot.max_workers = max_workers
+        snapshot.refresh()
+        return snapshot.render(context_mode=context_mode)
+
+    files = list_repository_files(repo_path, extensions, max_file_size)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        contents = executor.map(read_text_file, [full_path for _, full_path in files])
+
+        content_list = []
+        for (relative_path, _), file_contents in zip(files, contents):
+            if file_contents is None:
+                continue
+            if context_mode == "skeleton":
+                file_contents = summarize_source(relative_path, file_contents)
+            # Append a header with the relative file path.
+            content_list.append(format_file(relative_path, file_contents))
+    return "\n".join(content_list)
@@ -0,0 +1,230 @@
+import re
+import math
+import heapq
+import threading
+from collections import Counter
+from repository import get_repository_snapshot, format_file
+from tokens import estimate_tokens
+from tracing import traced
+
+# Local lexical retrieval over the repository snapshot, so that only the files relevant to an
+# epic are packed into the prompt instead of the whole repository. Files are split into line
+# chunks and scored with BM25; no network or embedding model is involved.
+
+# Lines per chunk
+CHUNK_LINES = 60
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Splits camelCase / PascalCase identifiers into their words
+CAMEL_PART = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or that the this to was were will with "
+    "self none true false return def class import if else elif for while try except not".split()
+)
+
+
+def _is_compound(identifier) -> bool:
+    # snake_case, camelCase, PascalCase and ACRONYMWords all split into more than one part
+    return "_" in identifier.strip("_") or not (identifier.islower() or identifier.isupper() or identifier[1:].islower())
+
+
+def count_terms(text) -> Counter:
+    """
+    Counts the lowercase terms of text. Identifiers are indexed by their snake_case and camelCase
+    parts, and compound identifiers also whole, so that "parse_stream" and "IssueParser" match
+    "parser" and "stream".
+    """
+    terms = Counter()
+    # Count with the C-level Counter first so the Python loops only see distinct words
+    for part, count in Counter(CAMEL_PART.findall(text)).items():
+        if len(part) > 1:
+            terms[part.lower()] += count
+    for identifier, count in Counter(IDENTIFIER.findall(text)).items():
+        if _is_compound(identifier):
+            terms[identifier.lower()] += count
+    for stopword in STOPWORDS.intersection(terms):
+        del terms[stopword]
+    return terms
+
+
+def tokenize(text) -> list[str]:
+    return list(count_terms(text))
+
+
+class Chunk:
+    __slots__ = ("path", "start_line", "end_line", "text", "length", "term_counts")
+
+    def __init__(self, path, start_line, end_line, text):
+        self.path = path
+        self.start_line = start_line
+        self.end_line = end_line
+        self.text = text
+        self.term_counts = count_terms(text)
+        self.length = sum(self.term_counts.values())
+
+
+def split_chunks(path, text, chunk_lines=CHUNK_LINES) -> list[Chunk]:
+    lines = text.splitlines(keepends=True)
+    return [
+        Chunk(path, start + 1, min(start + chunk_lines, len(lines)), "".join(lines[start:start + chunk_lines]))
+        for start in range(0, len(lines), chunk_lines)
+    ]
+
+
+class RepositoryIndex:
+    """
+    A BM25 index over the chunks of a RepositorySnapshot. update() re-indexes only the files whose
+    content hash differs from the one they were indexed at, and drops the removed files.
+    """
+    def __init__(self, snapshot, chunk_lines=CHUNK_LINES):
+        self.snapshot = snapshot
+        self.chunk_lines = chunk_lines
+        # chunk id -> Chunk
+        self.chunks = {}
+        # path -> chunk ids of that file
+        self.chunks_by_path = {}
+        # path -> hash of the content the file was indexed at. The snapshot is shared (and refreshed
+        # by other readers), so its changed set cannot tell what this index has not seen yet.
+        self.indexed_hashes = {}
+        # term -> {chunk id: term frequency}
+        self.postings = {}
+        self.total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _remove_path(self, path):
+        for chunk_id in self.chunks_by_path.pop(path, ()):
+            chunk = self.chunks.pop(chunk_id)
+            self.total_length -= chunk.length
+            for term in chunk.term_counts:
+                posting = self.postings[term]
+                del posting[chunk_id]
+                if not posting:
+                    del self.postings[term]
+
+    def _add_path(self, path, text):
+        chunk_ids = []
+        for chunk in split_chunks(path, text, self.chunk_lines):
+            chunk_id = self._next_id
+            self._next_id += 1
+            self.chunks[chunk_id] = chunk
+            self.total_length += chunk.length
+            for term, count in chunk.term_counts.items():
+                self.postings.setdefault(term, {})[chunk_id] = count
+            chunk_ids.append(chunk_id)
+        self.chunks_by_path[path] = chunk_ids
+
+    @traced("retrieval.update")
+    def update(self) -> None:
+        """
+        Refreshes the snapshot and re-indexes the files that changed since the last update.
+        """
+        with self._lock:
+            self.snapshot.refresh()
+            current = self.snapshot.files
+            indexed_hashes = self.indexed_hashes
+            stale = [path for path, entry in current.items() if indexed_hashes.get(path) != entry.hash]
+            for path in indexed_hashes.keys() - current.keys():
+                self._remove_path(path)
+                del indexed_hashes[path]
+            for path in stale:
+                entry = current[path]
+                self._remove_path(path)
+                if entry.text:
+                    self._add_path(path, entry.text)
+                indexed_hashes[path] = entry.hash
+
+    def search(self, query, limit=50) -> list[tuple[float, Chunk]]:
+        """
+        Returns up to limit (score, chunk) pairs ranked by BM25 relevance to query.
+        """
+        with self._lock:
+            if not self.chunks:
+                return []
+            count = len(self.chunks)
+            average_length = self.total_length / count
+            scores = {}
+            for term in set(tokenize(query)):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1.0 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, frequency in posting.items():
+                    length = self.chunks[chunk_id].length
+                    score = idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + score
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return [(score, self.chunks[chunk_id]) for chunk_id, score in best]
+
+    @traced("retrieval.pack")
+    def pack(self, query, token_budget=60_000, context_mode="full") -> str:
+        """
+        Builds a repository context of the chunks most relevant to query that fits in token_budget.
+        Whole files are used when they fit; otherwise only their best-ranked chunks are included.
+        Files are ordered by their best chunk's score and chunks by line number.
+        With context_mode "skeleton", the skeletons of the best-ranked files are packed instead.
+        """
+        ranked = self.search(query, limit=max(50, token_budget // 100))
+        if context_mode == "skeleton":
+            paths = list(dict.fromkeys(chunk.path for _, chunk in ranked))
+            content_list = []
+            used = 0
+            for path, skeleton in self.snapshot.skeletons(paths).items():
+                cost = estimate_tokens(skeleton)
+                if used + cost <= token_budget:
+                    content_list.append(format_file(path, skeleton))
+                    used += cost
+            return "\n".join(content_list)
+        selected = {}
+        used = 0
+        for _, chunk in ranked:
+            if chunk.path in selected and selected[chunk.path] is None:
+                continue
+            entry = self.snapshot.files.get(chunk.path)
+            # Prefer the whole file the first time it is hit, if it fits
+            if chunk.path not in selected and entry is not None and entry.text:
+                cost = estimate_tokens(entry.text)
+                if used + cost <= token_budget:
+                    selected[chunk.path] = None
+                    used += cost
+                    continue
+            cost = estimate_tokens(chunk.text)
+            if used + cost > token_budget:
+                continue
+            selected.setdefault(chunk.path, []).append(chunk)
+            used += cost
+
+        content_list = []
+        for path, chunks in selected.items():
+            if chunks is None:
+                content_list.append(format_file(path, self.snapshot.files[path].text))
+                continue
+            for chunk in sorted(chunks, key=lambda chunk: chunk.start_line):
+                content_list.append(format_file(f"{path} (lines {chunk.start_line}-{chunk.end_line})", chunk.text))
+        return "\n".join(content_list)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_repository_index(repo_path) -> RepositoryIndex:
+    """
+    Returns the process-wide index of repo_path, brought up to date with the working tree.
+    """
+    snapshot = get_repository_snapshot(repo_path)
+    with _indexes_lock:
+        index = _indexes.get(id(snapshot))
+        if index is None:
+            index = RepositoryIndex(snapshot)
+            _indexes[id(snapshot)] = index
+    index.update()
+    return index
+
+
+if __name__ == "__main__":
+    index = get_repository_index(".")
+    for score, chunk in index.search("parse issue proposals from the model response", limit=5):
+        print(f"{score:6.2f}  {chunk.path}:{chunk.start_line}-{chunk.end_line}")
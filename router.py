@@ -0,0 +1,268 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Route requests to a model by task type and prompt size, with fallback to the next model in
+# the chain on failure, and hedge slow requests: if a request has not answered within the
+# model's recent latency percentile, a duplicate is sent and whichever answers first wins.
+# Only the network call is hedged and timed: a request is admitted by the scheduler before it is
+# sent, and a hedge is only sent if the scheduler can admit it immediately, so hedges never
+# compete for scarce rate-limit budget and the latency histograms never learn queueing time.
+
+class LatencyHistogram:
+    """
+    Keeps a sliding window of recent latencies for one model.
+    """
+    def __init__(self, window=1000, refresh_every=32):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        # Percentiles are read on every request, so the sorted window is only rebuilt
+        # after refresh_every new samples
+        self.refresh_every = refresh_every
+        self._sorted = []
+        self._sorted_at = 0
+
+    def record(self, seconds) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, fraction) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            if not self._sorted or self.count - self._sorted_at >= self.refresh_every:
+                self._sorted = sorted(self._samples)
+                self._sorted_at = self.count
+            ordered = self._sorted
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class Route:
+    """
+    Sends matching requests to model_name. A route matches when the task is one of task_types
+    (if given) and the prompt is at most max_prompt_tokens (if given).
+    """
+    def __init__(self, model_name, task_types=None, max_prompt_tokens=None):
+        self.model_name = model_name
+        self.task_types = tuple(task_types) if task_types else None
+        self.max_prompt_tokens = max_prompt_tokens
+
+    def matches(self, task, prompt_tokens) -> bool:
+        if self.task_types is not None and task not in self.task_types:
+            return False
+        if self.max_prompt_tokens is not None and prompt_tokens > self.max_prompt_tokens:
+            return False
+        return True
+
+
+class ModelRouter:
+    """
+    Chooses a model per request and hedges requests that run past the adaptive hedge delay.
+    """
+    def __init__(self, routes=(), hedge_percentile=0.95, initial_hedge_delay=10.0,
+                 min_hedge_delay=0.5, max_hedge_delay=60.0, min_samples=20, max_workers=32):
+        """
+        Args:
+            routes (list[Route]): Routes tried in order; the first match is used.
+            hedge_percentile (float): Latency percentile after which a hedge is sent. None disables hedging.
+            initial_hedge_delay (float): Hedge delay used until min_samples latencies are recorded.
+            min_hedge_delay (float): Lower bound on the hedge delay in seconds.
+            max_hedge_delay (float): Upper bound on the hedge delay in seconds.
+            min_samples (int): Latencies needed before the percentile is trusted.
+            max_workers (int): Threads used to run hedged synchronous requests.
+        """
+        self.routes = list(routes)
+        self.hedge_percentile = hedge_percentile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.min_samples = min_samples
+        self.histograms = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge") if hedge_percentile else None
+        self._lock = threading.Lock()
+
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        # Hedges not sent because the scheduler had no budget to admit them right away
+        self.hedges_skipped = 0
+        self.fallbacks = 0
+
+    def select(self, default_model, task=None, prompt_tokens=0) -> list[str]:
+        """
+        Returns the models to try in order: the first matching route, then default_model as fallback.
+        """
+        chain = [route.model_name for route in self.routes if route.matches(task, prompt_tokens)][:1]
+        if default_model not in chain:
+            chain.append(default_model)
+        return chain
+
+    def histogram(self, model_name) -> LatencyHistogram:
+        with self._lock:
+            if model_name not in self.histograms:
+                self.histograms[model_name] = LatencyHistogram()
+            return self.histograms[model_name]
+
+    def hedge_delay(self, model_name) -> float | None:
+        if not self.hedge_percentile:
+            return None
+        histogram = self.histogram(model_name)
+        if len(histogram) < self.min_samples:
+            return self.initial_hedge_delay
+        delay = histogram.percentile(self.hedge_percentile)
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, delay))
+
+    def _timed(self, call, model_name):
+        started = time.perf_counter()
+        result = call()
+        self.histogram(model_name).record(time.perf_counter() - started)
+        return result
+
+    def _admit_hedge(self, admit_hedge) -> bool:
+        if admit_hedge is None or admit_hedge():
+            with self._lock:
+                self.hedges_sent += 1
+            return True
+        with self._lock:
+            self.hedges_skipped += 1
+        return False
+
+    def hedged(self, call, model_name, admit_hedge=None):
+        """
+        Runs call(), the network call of one admitted request to model_name, and races a
+        duplicate against it if it runs past the hedge delay.
+
+        Args:
+            call (Callable): Sends the request and returns the response.
+            model_name (str): The model the request is sent to; its latency histogram is updated.
+            admit_hedge (Callable[[], bool]): Admits the duplicate without waiting, e.g.
+                RequestScheduler.try_admit; if it returns False no hedge is sent.
+        """
+        delay = self.hedge_delay(model_name)
+        if delay is None:
+            return self._timed(call, model_name)
+
+        primary = self._executor.submit(self._timed, call, model_name)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._admit_hedge(admit_hedge):
+            return primary.result()
+
+        # The primary is slow: race a duplicate against it. The loser cannot be aborted
+        # on the synchronous client, so it finishes in the background and is discarded.
+        hedge = self._executor.submit(self._timed, call, model_name)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self._lock:
+                            self.hedges_won += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def ahedged(self, call, model_name, admit_hedge=None):
+        """
+        Async counterpart of hedged(); call is a coroutine function. The losing request is cancelled.
+        """
+        async def timed():
+            started = time.perf_counter()
+            result = await call()
+            self.histogram(model_name).record(time.perf_counter() - started)
+            return result
+
+        delay = self.hedge_delay(model_name)
+        if delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        pending = {primary}
+        error = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._admit_hedge(admit_hedge):
+                return await primary
+
+            hedge = asyncio.ensure_future(timed())
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            with self._lock:
+                                self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def complete(self, send, default_model, task=None, prompt_tokens=0):
+        """
+        Runs send(model_name) on the routed model, falling back to the next model in the chain if
+        a model fails. send is expected to hedge its network call through hedged().
+        """
+        chain = self.select(default_model, task, prompt_tokens)
+        for index, model_name in enumerate(chain):
+            try:
+                return send(model_name)
+            except Exception:
+                if index == len(chain) - 1:
+                    raise
+                with self._lock:
+                    self.fallbacks += 1
+
+    async def acomplete(self, send, default_model, task=None, prompt_tokens=0):
+        """
+        Async counterpart of complete(); send is a coroutine function.
+        """
+        chain = self.select(default_model, task, prompt_tokens)
+        for index, model_name in enumerate(chain):
+            try:
+                return await send(model_name)
+            except Exception:
+                if index == len(chain) - 1:
+                    raise
+                with self._lock:
+                    self.fallbacks += 1
+
+    def stats(self) -> dict:
+        return {
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "hedges_skipped": self.hedges_skipped,
+            "fallbacks": self.fallbacks,
+            "latency": {model_name: histogram.snapshot() for model_name, histogram in self.histograms.items()},
+        }
+
+
+_default_router = None
+
+def get_default_router() -> ModelRouter:
+    """
+    Returns the process-wide router shared by the agents. Reformat requests (the repair
+    re-prompts of incomplete issue proposals, see repair.py) go to the small model; everything
+    else stays on the agent's own model.
+    """
+    global _default_router
+    if _default_router is None:
+        _default_router = ModelRouter(routes=[Route("gpt-4o-mini", task_types=("reformat",))])
+    return _default_router
@@ -0,0 +1,260 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from email.utils import parsedate_to_datetime
+
+# Create a scheduler that sits in front of the model API. Requests are admitted through
+# token buckets for requests/min and tokens/min, ordered by priority while they wait,
+# and retried with jittered exponential backoff on rate limits and transient errors.
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at rate_per_minute, holding at most capacity tokens.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, now) -> float:
+        """
+        Seconds until amount tokens are available (0 if they are available now).
+        """
+        self._refill(now)
+        # Requests larger than the bucket are admitted once the bucket is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount) -> None:
+        """
+        Charges (positive) or refunds (negative) tokens once the real cost of a request is known.
+        """
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RequestScheduler:
+    """
+    Admits model requests under requests/min and tokens/min budgets, by priority, with retries.
+    """
+    def __init__(self, requests_per_minute=500, tokens_per_minute=30_000, max_retries=6,
+                 base_delay=1.0, max_delay=60.0):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        # Set from Retry-After hints so that every waiting request backs off, not just the failed one
+        self._paused_until = 0.0
+
+        self.admitted = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _wait_time(self, tokens) -> float:
+        now = time.monotonic()
+        return max(
+            self._paused_until - now,
+            self.request_bucket.wait_time(1, now),
+            self.token_bucket.wait_time(tokens, now),
+        )
+
+    def admit(self, tokens, priority=PRIORITY_BULK) -> None:
+        """
+        Blocks until the request may be sent. Waiting requests are admitted in priority order,
+        then in arrival order.
+        """
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == ticket:
+                        timeout = self._wait_time(tokens)
+                        if timeout <= 0:
+                            heapq.heappop(self._waiting)
+                            self.request_bucket.consume(1)
+                            self.token_bucket.consume(tokens)
+                            self.admitted += 1
+                            self._condition.notify_all()
+                            return
+                    self._condition.wait(timeout)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                raise
+
+    def try_admit(self, tokens, priority=PRIORITY_BULK) -> bool:
+        """
+        Admits a request only if it can be sent right now, without waiting and without overtaking
+        a waiting request. Used for optional requests such as hedges.
+
+        Returns:
+            bool: Whether the request was admitted.
+        """
+        with self._condition:
+            if self._waiting or self._wait_time(tokens) > 0:
+                return False
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            self.admitted += 1
+            return True
+
+    def record_usage(self, estimated_tokens, actual_tokens) -> None:
+        """
+        Corrects the tokens/min bucket once the real token usage of a request is known.
+        """
+        if actual_tokens is None:
+            return
+        with self._condition:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def _retry_after(self, error):
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000.0
+            except ValueError:
+                pass
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    return None
+        return None
+
+    def _retry_delay(self, error, attempt):
+        """
+        Returns how long to wait before retrying after error, or None if it should not be retried.
+        """
+        status_code = getattr(error, "status_code", None)
+        if status_code is None:
+            # Connection errors and timeouts carry no status code
+            if not isinstance(error, (ConnectionError, TimeoutError)) and \
+                    type(error).__name__ not in ("APIConnectionError", "APITimeoutError"):
+                return None
+        elif status_code not in RETRYABLE_STATUS_CODES:
+            return None
+
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self._retry_after(error)
+        if status_code == 429:
+            self.rate_limited += 1
+        if retry_after is not None:
+            with self._condition:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            return retry_after + random.uniform(0, self.base_delay)
+        return backoff
+
+    def run(self, request, tokens, priority=PRIORITY_BULK):
+        """
+        Calls request() once admitted, retrying transient failures.
+
+        Args:
+            request (Callable): Performs the API call and returns its result.
+            tokens (int): Estimated tokens the request will consume.
+            priority (int): Admission priority, lower runs first.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.admit(tokens, priority)
+            try:
+                return request()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                time.sleep(delay)
+
+    async def arun(self, request, tokens, priority=PRIORITY_BULK):
+        """
+        Async counterpart of run(); request is a coroutine function.
+        """
+        for attempt in range(self.max_retries + 1):
+            # Admission blocks on a condition variable, so wait for it off the event loop
+            await asyncio.to_thread(self.admit, tokens, priority)
+            try:
+                return await request()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "waiting": len(self._waiting),
+        }
+
+
+_default_scheduler = None
+
+def get_default_scheduler() -> RequestScheduler:
+    """
+    Returns the process-wide scheduler shared by the agents. Limits can be set with the
+    LLM_REQUESTS_PER_MINUTE and LLM_TOKENS_PER_MINUTE environment variables.
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = RequestScheduler(
+            requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", 500)),
+            tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", 30_000)),
+        )
+    return _default_scheduler
+
+
+if __name__ == "__main__":
+    # Exercise the retry path against a local server that rate limits the first two requests
+    from fake_server import FakeModelServer
+
+    with FakeModelServer(rate_limited_requests=2, retry_after=1) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+        from model import Model
+        agent = Model(
+            model_name="gpt-4o",
+            system_prompt="You are an experienced project manager working as a scrum master",
+            scheduler=RequestScheduler(requests_per_minute=60, tokens_per_minute=100_000, base_delay=0.1),
+        )
+        print(agent.prompt(agent.system_prompt, "Generate an epic"))
+        print(f"Scheduler: {agent.scheduler.stats()}")
+        print(f"Server requests: {server.requests}, rate limited: {server.rate_limited}")
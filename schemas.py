@@ -0,0 +1,66 @@
+import os
+from typing import Literal, Optional
+from pydantic import BaseModel, ConfigDict
+
+# JSON schemas for structured-output responses. With a schema attached to the request the model
+# answers with JSON that the parsers validate in one step (see EpicParser.parse_json and
+# IssueParser.parse_json), instead of scraping free text that may drift from the format.
+
+# Whether the agents request structured outputs by default (LLM_STRUCTURED_OUTPUT=1)
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "").lower() in ("1", "true", "yes")
+
+STRUCTURED_OUTPUT_NOTE = (
+    "Respond only with a JSON object that matches the provided response schema, "
+    "instead of the text format described above."
+)
+
+
+class EpicResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    epic: str
+    summary: str
+
+
+class IssueProposal(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    # The ID of the existing issue, or null for a new issue
+    issue_id: Optional[int]
+    action: Literal["Update", "Delete", "Add"]
+    proposed_title: Optional[str]
+    proposed_body: Optional[str]
+
+
+class IssueProposalsResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    proposals: list[IssueProposal]
+    summary: str
+
+
+_formats = {}
+
+def response_format(schema) -> dict:
+    """
+    Returns the response_format request parameter that asks for JSON matching the given
+    pydantic model, in strict mode.
+    """
+    if schema not in _formats:
+        _formats[schema] = {
+            "type": "json_schema",
+            "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema(), "strict": True},
+        }
+    return _formats[schema]
+
+
+def structured_prompt(prompt) -> str:
+    """
+    Appends the instruction to answer in JSON to a prompt written for the text format.
+    """
+    return f"{prompt}\n{STRUCTURED_OUTPUT_NOTE}\n"
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(response_format(IssueProposalsResponse), indent=2))
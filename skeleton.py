@@ -0,0 +1,160 @@
+import ast
+import os
+
+# Code skeletons: module, class and function signatures with their docstrings and imports, but
+# without function bodies. Planning issues rarely needs the bodies, so sending skeletons instead
+# of raw files cuts the repository context by an order of magnitude.
+
+# Lines of a docstring kept in the skeleton
+DOCSTRING_LINES = 3
+# Keywords that open a block whose members belong in the skeleton (rather than a function body)
+CONTAINER_KEYWORDS = ("class ", "interface ", "enum ", "namespace ", "module ", "record ")
+
+
+def _docstring(node, indent) -> list[str]:
+    docstring = ast.get_docstring(node)
+    if not docstring:
+        return []
+    # The first paragraph, at most DOCSTRING_LINES lines
+    lines = docstring.strip().split("\n\n")[0].splitlines()[:DOCSTRING_LINES]
+    if len(lines) == 1:
+        return [f'{indent}"""{lines[0]}"""']
+    return [f'{indent}"""{lines[0]}'] + [f"{indent}{line}" for line in lines[1:]] + [f'{indent}"""']
+
+
+def _python_nodes(nodes, indent) -> list[str]:
+    lines = []
+    for node in nodes:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            lines.append(f"{indent}{ast.unparse(node)}")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            lines.extend(f"{indent}@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+            prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+            returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+            lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}:")
+            lines.extend(_docstring(node, indent + "    "))
+            lines.append(f"{indent}    ...")
+        elif isinstance(node, ast.ClassDef):
+            lines.extend(f"{indent}@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+            bases = [ast.unparse(base) for base in node.bases] + [ast.unparse(keyword) for keyword in node.keywords]
+            lines.append(f"{indent}class {node.name}({', '.join(bases)}):" if bases else f"{indent}class {node.name}:")
+            lines.extend(_docstring(node, indent + "    "))
+            members = _python_nodes(node.body, indent + "    ")
+            lines.extend(members or [f"{indent}    ..."])
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and not indent:
+            # Module-level constants and globals, without long values
+            source = ast.unparse(node)
+            lines.append(source if len(source) <= 120 else source[:117] + "...")
+    return lines
+
+
+def python_skeleton(text) -> str:
+    """
+    Returns the skeleton of Python source, or None if it does not parse.
+    """
+    try:
+        module = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+    return "\n".join(_docstring(module, "") + _python_nodes(module.body, ""))
+
+
+def _code_lines(text):
+    """
+    Yields (line, depth, low, end) for each line of C-like source: the brace depth at the start of
+    the line, the lowest depth reached on it and the depth at its end, ignoring braces in strings
+    and comments.
+    """
+    depth = 0
+    quote = None
+    block_comment = False
+    for line in text.splitlines():
+        start_depth = low = depth
+        index = 0
+        while index < len(line):
+            char = line[index]
+            pair = line[index:index + 2]
+            if block_comment:
+                if pair == "*/":
+                    block_comment = False
+                    index += 1
+            elif quote:
+                if char == "\\":
+                    index += 1
+                elif char == quote:
+                    quote = None
+            elif pair == "//":
+                break
+            elif pair == "/*":
+                block_comment = True
+                index += 1
+            elif char in "\"'`":
+                quote = char
+            elif char == "{":
+                depth += 1
+            elif char == "}" and depth > 0:
+                depth -= 1
+                low = min(low, depth)
+            index += 1
+        # Only template literals may span lines
+        if quote != "`":
+            quote = None
+        yield line, start_depth, low, depth
+
+
+def brace_skeleton(text) -> str:
+    """
+    Returns the skeleton of JavaScript, TypeScript or Java source: top-level statements and the
+    members of classes, interfaces and enums, with function bodies replaced by "{ ... }".
+    """
+    lines = []
+    # For each open block: whether its members are part of the skeleton
+    containers = []
+    for line, depth, low, end in _code_lines(text):
+        closed = containers[low:]
+        del containers[low:]
+        visible = all(containers)
+        opens = end > low
+        is_container = opens and any(keyword in f" {line.strip()}" for keyword in CONTAINER_KEYWORDS)
+        if opens:
+            containers.extend([visible and is_container] * (end - low))
+
+        stripped = line.strip()
+        if not visible or not stripped:
+            continue
+        if opens and not is_container:
+            lines.append(line.rstrip() + " ... }")
+        elif not stripped.strip("});, "):
+            # A bare closing brace is kept only where it closes a class-like block
+            if closed and all(closed):
+                lines.append(line.rstrip())
+        else:
+            lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
+def skeleton_key(path, file_hash) -> str:
+    """
+    Key under which the skeleton of a file is cached. The extension selects the summarizer, so
+    it is part of the key along with the content hash.
+    """
+    return f"{os.path.splitext(path)[1]}:{file_hash}"
+
+
+def summarize_source(path, text) -> str:
+    """
+    Returns the skeleton of a source file, falling back to the full text for unknown file types
+    and Python files that do not parse.
+    """
+    extension = os.path.splitext(path)[1]
+    if extension == ".py":
+        skeleton = python_skeleton(text)
+        return text if skeleton is None else skeleton
+    if extension in (".js", ".jsx", ".ts", ".tsx", ".java"):
+        return brace_skeleton(text)
+    return text
+
+
+if __name__ == "__main__":
+    with open(__file__, "r", encoding="utf-8") as f:
+        print(python_skeleton(f.read()))
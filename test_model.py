@@ -0,0 +1,28 @@
+import os
+import asyncio
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import clients
+from model import Model
+from replay import ReplayClient, AsyncReplayClient
+from tracing import tracer
+
+
+def _echo(model, system_prompt, user_prompt) -> str:
+    return f"echo: {user_prompt}"
+
+
+def test_prompt_many_with_tracing_disabled():
+    # With tracing off, spans are the shared no-op span, which has no start time
+    was_enabled = tracer.enabled
+    tracer.disable()
+    clients.use_llm_backend(ReplayClient(responder=_echo), AsyncReplayClient(responder=_echo))
+    try:
+        agent = Model(model_name="gpt-4o", system_prompt="You are a test assistant.", max_concurrency=2)
+        responses = asyncio.run(agent.prompt_many(agent.system_prompt, ["one", "two", "three"]))
+    finally:
+        clients.use_llm_backend(None)
+        if was_enabled:
+            tracer.enable()
+    assert responses == ["echo: one", "echo: two", "echo: three"]
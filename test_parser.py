@@ -0,0 +1,46 @@
+from parser import IssueParser, iter_lines
+from ticket import Issue
+
+RESPONSE = """Issue 1:
+Action: Update
+Proposed Title: Backend authentication
+Proposed Body:
+Implement the login endpoint.
+Issue 2: must land first.
+
+  - keep the session store
+
+Issue 2:
+Action: Delete
+
+Proposal Summary:
+Issue 1: reworded.
+Issue 2: removed.
+"""
+
+
+def test_header_inside_body_stays_in_body():
+    modifications, new_proposals, summary = IssueParser.parse_proposals(RESPONSE)
+    assert list(modifications) == [1, 2]
+    assert modifications[1]["proposed_body"] == (
+        "Implement the login endpoint.\nIssue 2: must land first.\n\n  - keep the session store"
+    )
+    assert modifications[2]["action"] == "Delete"
+    assert new_proposals == []
+
+
+def test_summary_is_terminal():
+    blocks = list(IssueParser.iter_blocks(RESPONSE))
+    assert [block.kind for block in blocks] == ["issue", "issue", "summary"]
+    assert blocks[-1].body == "Issue 1: reworded.\nIssue 2: removed."
+
+
+def test_stream_matches_batch():
+    issues = [Issue("Auth", "Login"), Issue("Old", "Unused")]
+    response = RESPONSE.replace("Issue 1", f"Issue {issues[0].id}").replace("Issue 2", f"Issue {issues[1].id}")
+    tokens = [response[start:start + 7] for start in range(0, len(response), 7)]
+    events = list(IssueParser.parse_stream(tokens, issues))
+    assert [kind for kind, _ in events] == ["issue", "issue", "summary"]
+    assert events[0][1].get_proposed_content()["issue_body"].startswith("Implement the login endpoint.\nIssue ")
+    assert events[1][1].get_state().name == "DELETE"
+    assert list(iter_lines(tokens)) == response.split("\n")[:-1]
@@ -1,31 +1,174 @@
 # Abstract base class for tickets.
+import sys
 from abc import ABC, abstractmethod
+from enum import IntEnum
+from ticket_ids import get_default_id_allocator
+from ticket_history import TicketHistory
+
+class TicketState(IntEnum):
+    APPROVED = 0
+    UPDATE = 1
+    DELETE = 2
+    ADD = 3
+
+    @classmethod
+    def _missing_(cls, value):
+        # Accept the state names used before the enum, e.g. TicketState("ADD")
+        if isinstance(value, str) and value in cls.__members__:
+            return cls.__members__[value]
+        return None
+
+    # States are not equal to their names (that would break hashing, as a state already equals its
+    # value); names are converted with to_state() where they enter, e.g. set_state("ADD")
+    def __str__(self) -> str:
+        return self.name
+
+
+# State names and values to members; a dict lookup is much cheaper than TicketState("UPDATE")
+_STATES = {**TicketState.__members__, **{state.value: state for state in TicketState}}
+
+def to_state(state) -> TicketState:
+    """
+    Returns the TicketState for a state name (e.g. "ADD"), value or member.
+    """
+    try:
+        return _STATES[state]
+    except KeyError:
+        raise ValueError(f"Unknown ticket state: {state}") from None
+
+
+def allocate_ticket_id() -> int:
+    """
+    Returns a ticket id that is unique across threads and processes (see ticket_ids.py).
+    """
+    return get_default_id_allocator().allocate()
+
+
+# Tickets are held in large numbers (imported backlogs), so they are slotted, keep their state as
+# a small enum and store content as a tuple of values in the order of the class's _fields. The
+# content dicts returned by get_current_content / get_proposed_content are built on access.
+# Changes to the current content are recorded in a TicketHistory, created on the first change.
 
 class Ticket(ABC):
-    _next_id = 0
+    __slots__ = ("id", "_state", "_current", "_proposed", "_history", "_observer")
+    # Content keys, in the order their values are stored
+    _fields = ()
 
-    def __init__(self, current_content: dict, state: str = "APPROVED"):
-        self.id = Ticket._next_id
-        Ticket._next_id += 1
-        self.current_content = current_content
-        self.proposed_content = {}
-        self.state = state
+    def __init__(self, current_content: dict | tuple, state: str = "APPROVED"):
+        self.id = allocate_ticket_id()
+        # Either a dict or a tuple of values in _fields order
+        self._current = current_content if type(current_content) is tuple else self._pack(current_content)
+        # An empty tuple is an empty proposal ({}), None means the proposal was resolved
+        self._proposed = ()
+        self._state = to_state(state)
+        self._history = None
+        # Called as observer(ticket, previous_state, previous_epic_id) after a state, epic or content change
+        self._observer = None
+
+    def _pack(self, content):
+        if content is None:
+            return None
+        return tuple(map(content.get, self._fields)) if content else ()
+
+    def _unpack(self, values):
+        if values is None:
+            return None
+        return dict(zip(self._fields, values))
+
+    def _transition(self, state) -> None:
+        previous = self._state
+        self._state = state
+        if self._observer is not None:
+            self._observer(self, previous, getattr(self, "epic_id", None))
+
+    def _revise(self, content, action) -> None:
+        """
+        Replaces the current content, recording the change as a new revision.
+        """
+        self._current = self.get_history().append(content, action)
+        if self._observer is not None:
+            self._observer(self, self._state, getattr(self, "epic_id", None))
+
+    @classmethod
+    def restore(cls, ticket_id, state, current, proposed) -> "Ticket":
+        """
+        Rebuilds a saved ticket with its id (no new id is allocated).
+
+        Args:
+            ticket_id (int): The ticket's id.
+            state (str | int | TicketState): The ticket's state.
+            current (tuple): The current content, in _fields order.
+            proposed (tuple): The proposed content; () for no proposal, None for a resolved one.
+        """
+        ticket = cls.__new__(cls)
+        ticket.id = ticket_id
+        ticket._state = to_state(state)
+        ticket._current = current
+        ticket._proposed = proposed
+        ticket._history = None
+        ticket._observer = None
+        return ticket
+
+    @property
+    def state(self) -> TicketState:
+        return self._state
+
+    @state.setter
+    def state(self, state) -> None:
+        self._transition(to_state(state))
+
+    @property
+    def current_content(self) -> dict:
+        return self._unpack(self._current)
+
+    @current_content.setter
+    def current_content(self, current_content: dict) -> None:
+        self._revise(self._pack(current_content), "set")
+
+    @property
+    def proposed_content(self) -> dict:
+        return self._unpack(self._proposed)
+
+    @proposed_content.setter
+    def proposed_content(self, proposed_content: dict) -> None:
+        self._proposed = self._pack(proposed_content)
 
     def get_id(self):
         return self.id
-    
+
     def get_state(self):
-        pass
+        return self._state
 
-    def set_state(self, state: str):
-        self.state = state
+    def set_state(self, state: str | TicketState):
+        self._transition(to_state(state))
 
     def get_current_content(self):
         return self.current_content
-    
+
     def get_proposed_content(self):
         return self.proposed_content
-    
+
+    def get_history(self) -> TicketHistory:
+        """
+        Returns the revision history of the current content, starting with the content the ticket
+        had before its first change.
+        """
+        if self._history is None:
+            self._history = TicketHistory(self._fields, self._current)
+        return self._history
+
+    def get_revision(self, number: int = -1) -> dict:
+        """
+        Returns the current content as of a revision; negative numbers count from the latest.
+        """
+        return self.get_history().as_dict(number)
+
+    def diff_revisions(self, old: int, new: int = -1) -> dict:
+        """
+        Returns a unified line diff of the fields that differ between two revisions.
+        """
+        return self.get_history().diff(old, new)
+
     # Setter methods
     def set_current_content(self, current_content: str):
         self.current_content = current_content
@@ -51,41 +194,43 @@ class Ticket(ABC):
 
 
 class Epic(Ticket):
-    _valid_states = ["APPROVED", "UPDATE"]
+    __slots__ = ()
+    _fields = (sys.intern("epic_content"),)
+    _valid_states = [TicketState.APPROVED, TicketState.UPDATE]
     def __init__(self, epic_content: str, state: str = "APPROVED"):
-        super().__init__({"epic_content": epic_content}, state)
+        super().__init__((epic_content,), state)
 
     def get_current_content(self) -> dict:
         return self.current_content
-    
+
     def get_proposed_content(self) -> dict:
         return self.proposed_content
 
     def set_current_content(self, epic_content: str) -> None:
-        self.current_content = {"epic_content": epic_content}
+        self._revise((epic_content,), "set")
 
     def set_proposed_content(self, proposed_content: str) -> None:
-        self.proposed_content = {"epic_content": proposed_content}
+        self._proposed = (proposed_content,)
 
     def propose_update(self, proposed_content: str) -> None:
-        self.state = "UPDATE"
+        self._transition(TicketState.UPDATE)
         self.set_proposed_content(proposed_content)
-        
+
     def accept_proposal(self) -> None:
-        if self.state == "UPDATE":
-            self.state = "APPROVED"
-            self.current_content = self.proposed_content
-            self.proposed_content = None
+        if self._state is TicketState.UPDATE:
+            self._transition(TicketState.APPROVED)
+            self._revise(self._proposed, "accept")
+            self._proposed = None
 
     def reject_proposal(self) -> None:
-        if self.state == "UPDATE":
-            self.state = "APPROVED"
-            self.proposed_content = None
+        if self._state is TicketState.UPDATE:
+            self._transition(TicketState.APPROVED)
+            self._proposed = None
 
     def modify_proposal(self, proposed_content: str) -> None:
-        self.current_content = {"epic_content": proposed_content}
-        self.proposed_content = None
-        self.state = "APPROVED"
+        self._revise((proposed_content,), "modify")
+        self._proposed = None
+        self._transition(TicketState.APPROVED)
 
     def __str__(self) -> str:
         return f"""
@@ -97,60 +242,80 @@ class Epic(Ticket):
 
 
 class Issue(Ticket):
-    _valid_states = ["APPROVED", "UPDATE", "DELETE", "ADD"]
+    __slots__ = ("_epic_id",)
+    _fields = (sys.intern("issue_title"), sys.intern("issue_body"))
+    _valid_states = [TicketState.APPROVED, TicketState.UPDATE, TicketState.DELETE, TicketState.ADD]
     def __init__(self, current_title: str, current_body: str, state: str = "APPROVED", epic_id: int = None):
-        super().__init__({"issue_title": current_title, "issue_body": current_body}, state)
+        super().__init__((current_title, current_body), state)
         # Link to the epic that this issue belongs to
-        self.epic_id = epic_id
+        self._epic_id = epic_id
 
     def get_current_content(self) -> dict:
         return self.current_content
-    
+
     def get_proposed_content(self) -> dict:
         return self.proposed_content
-    
+
+    @classmethod
+    def restore(cls, ticket_id, state, current, proposed, epic_id=None) -> "Issue":
+        ticket = super().restore(ticket_id, state, current, proposed)
+        ticket._epic_id = epic_id
+        return ticket
+
+    @property
+    def epic_id(self) -> int | None:
+        return self._epic_id
+
+    @epic_id.setter
+    def epic_id(self, epic_id: int | None) -> None:
+        # Assigning the epic reports the move to the observer, like set_epic_id
+        previous = self._epic_id
+        self._epic_id = epic_id
+        if self._observer is not None and epic_id != previous:
+            self._observer(self, self._state, previous)
+
     def get_epic_id(self) -> int | None:
         return self.epic_id
 
     def set_current_content(self, current_title: str, current_body: str) -> None:
-        self.current_content = {"issue_title": current_title, "issue_body": current_body}
+        self._revise((current_title, current_body), "set")
 
     def set_proposed_content(self, proposed_title: str, proposed_body: str) -> None:
-        self.proposed_content = {"issue_title": proposed_title, "issue_body": proposed_body}
+        self._proposed = (proposed_title, proposed_body)
 
     def propose_update(self, proposed_title: str, proposed_body: str, state: str = "UPDATE") -> None:
-        self.state = state
+        self._transition(to_state(state))
         self.set_proposed_content(proposed_title, proposed_body)
-    
+
     def set_epic_id(self, epic_id: int) -> None:
         self.epic_id = epic_id
 
     def accept_proposal(self) -> None:
-        match self.state:
-            case "UPDATE":
-                self.state = "APPROVED"
-                self.current_content = self.proposed_content
-                self.proposed_content = None
-            case "ADD":
-                self.state = "APPROVED"
-                self.current_content = self.proposed_content
-                self.proposed_content = None
-            case "DELETE":
+        match self._state:
+            case TicketState.UPDATE:
+                self._transition(TicketState.APPROVED)
+                self._revise(self._proposed, "accept")
+                self._proposed = None
+            case TicketState.ADD:
+                self._transition(TicketState.APPROVED)
+                self._revise(self._proposed, "accept")
+                self._proposed = None
+            case TicketState.DELETE:
                 # delete the issue object completely
                 pass
-            case "APPROVED":
+            case TicketState.APPROVED:
                 raise ValueError("Cannot accept a proposal for an approved issue")
 
     def reject_proposal(self) -> None:
-        if self.state == "APPROVED":
+        if self._state is TicketState.APPROVED:
             raise ValueError("Cannot reject a proposal for an approved issue")
-        self.state = "APPROVED"
-        self.proposed_content = None
+        self._transition(TicketState.APPROVED)
+        self._proposed = None
 
     def modify_proposal(self, proposed_title: str, proposed_body: str) -> None:
-        self.current_content = {"issue_title": proposed_title, "issue_body": proposed_body}
-        self.proposed_content = None
-        self.state = "APPROVED"
+        self._revise((proposed_title, proposed_body), "modify")
+        self._proposed = None
+        self._transition(TicketState.APPROVED)
 
     def __str__(self) -> str:
         return f"""
@@ -159,4 +324,4 @@ class Issue(Ticket):
         Current Content: {self.current_content}
         Proposed Content: {self.proposed_content}
         State: {self.state}
-        """
\ No newline at end of file
+        """
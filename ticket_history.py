@@ -0,0 +1,75 @@
+import time
+import difflib
+
+# Revision history of a ticket's content. Each revision is a tuple of field values in the
+# ticket's _fields order; a field that did not change refers to the same string object as the
+# previous revision, so a revision costs one small tuple plus the fields that actually changed.
+# Every revision is stored whole, so any of them is a list index away and nothing is replayed.
+
+
+class TicketHistory:
+    """
+    The revisions of one ticket, oldest first. Revision 0 is the content the ticket had when its
+    history started.
+    """
+    __slots__ = ("fields", "revisions")
+
+    def __init__(self, fields, content, action="create"):
+        self.fields = fields
+        # (content, action, timestamp) per revision
+        self.revisions = [(content, action, time.time())]
+
+    def __len__(self) -> int:
+        return len(self.revisions)
+
+    def append(self, content, action) -> tuple:
+        """
+        Records content as a new revision, sharing the values of unchanged fields with the
+        previous revision, and returns the stored content.
+        """
+        previous = self.revisions[-1][0]
+        if content and previous and len(content) == len(previous):
+            content = tuple(old if old == new else new for old, new in zip(previous, content))
+        self.revisions.append((content, action, time.time()))
+        return content
+
+    def latest(self) -> tuple:
+        return self.revisions[-1][0]
+
+    def get(self, number) -> tuple:
+        """
+        Returns the content of a revision; negative numbers count from the latest.
+        """
+        return self.revisions[number][0]
+
+    def as_dict(self, number) -> dict:
+        content = self.get(number)
+        return None if content is None else dict(zip(self.fields, content))
+
+    def log(self) -> list[dict]:
+        return [
+            {"revision": number, "action": action, "timestamp": timestamp}
+            for number, (_, action, timestamp) in enumerate(self.revisions)
+        ]
+
+    def diff(self, old, new) -> dict:
+        """
+        Returns a unified line diff of every field that differs between revisions old and new.
+
+        Returns:
+            dict: field name -> list of diff lines; unchanged fields are left out.
+        """
+        old_content = self.get(old) or ()
+        new_content = self.get(new) or ()
+        changes = {}
+        for index, field in enumerate(self.fields):
+            old_value = old_content[index] if index < len(old_content) else None
+            new_value = new_content[index] if index < len(new_content) else None
+            # Shared values are skipped without comparing them
+            if old_value is new_value or old_value == new_value:
+                continue
+            changes[field] = list(difflib.unified_diff(
+                (old_value or "").splitlines(), (new_value or "").splitlines(),
+                f"{field}@{old}", f"{field}@{new}", lineterm="",
+            ))
+        return changes
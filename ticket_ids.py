@@ -0,0 +1,150 @@
+import os
+import sqlite3
+import weakref
+import threading
+
+# Ticket id allocation that is safe across threads and processes. Each process leases a block of
+# ids from a counter in a shared SQLite file and hands them out from memory, so tickets created by
+# parallel workers never collide when their results are merged into one ApprovalHandler.
+
+# Ids leased from the shared counter at a time
+BLOCK_SIZE = 1024
+
+# Default counter file, in the user's cache directory: it does not depend on the working directory
+# (workers started from different directories share one counter) and stays out of the source tree
+DEFAULT_PATH = os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "agility", "ticket_ids.sqlite"
+)
+
+_allocators = weakref.WeakSet()
+
+
+class IdAllocator:
+    """
+    Hands out unique ticket ids from blocks leased from a file-backed counter.
+    """
+    def __init__(self, path=None, block_size=BLOCK_SIZE):
+        """
+        Args:
+            path (str): Path of the SQLite counter file shared by the processes. None keeps the
+                        counter in this process only (unique across threads, not processes), as
+                        does a path that cannot be opened for writing (a warning is printed).
+            block_size (int): Number of ids leased at a time.
+        """
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1")
+        self.path = path
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._db = None
+        self._next_block = 0
+        # next() on a range iterator is atomic under the GIL, so the hot path takes no lock
+        self._block = iter(())
+        _allocators.add(self)
+
+    def _connect(self):
+        if self._db is None:
+            # The file is created on the first lease, not when the allocator is made
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Transactions are managed explicitly, so the lease is one atomic read-modify-write
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            try:
+                # Leases commit without waiting for an fsync; they are still atomic across processes
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("CREATE TABLE IF NOT EXISTS counter (next_id INTEGER NOT NULL)")
+            except sqlite3.Error:
+                db.close()
+                raise
+            self._db = db
+        return self._db
+
+    def _lease(self) -> range:
+        if self.path is None:
+            start = self._next_block
+            self._next_block += self.block_size
+            return range(start, start + self.block_size)
+
+        try:
+            db = self._connect()
+        except (OSError, sqlite3.Error) as e:
+            # e.g. a read-only home or install directory: tickets can still be made in this process
+            print(f"Warning: cannot open the ticket id counter {self.path} ({e}); "
+                  "ids are only unique within this process. Set TICKET_ID_PATH to a writable file.")
+            self.path = None
+            return self._lease()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT next_id FROM counter").fetchone()
+            start = 0 if row is None else row[0]
+            if row is None:
+                db.execute("INSERT INTO counter (next_id) VALUES (?)", (start + self.block_size,))
+            else:
+                db.execute("UPDATE counter SET next_id = ?", (start + self.block_size,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return range(start, start + self.block_size)
+
+    def allocate(self) -> int:
+        """
+        Returns a new unique id.
+        """
+        try:
+            return next(self._block)
+        except StopIteration:
+            pass
+        with self._lock:
+            # Another thread may have leased a new block meanwhile
+            for ticket_id in self._block:
+                return ticket_id
+            self._block = iter(self._lease())
+            return next(self._block)
+
+    def _after_fork(self) -> None:
+        # The child must not hand out the rest of the parent's block, nor share its connection
+        self._lock = threading.Lock()
+        self._db = None
+        self._block = iter(())
+
+
+def _reset_allocators_after_fork():
+    for allocator in list(_allocators):
+        allocator._after_fork()
+
+os.register_at_fork(after_in_child=_reset_allocators_after_fork)
+
+
+_default_allocator = None
+_default_allocator_lock = threading.Lock()
+
+def get_default_id_allocator() -> IdAllocator:
+    """
+    Returns the process-wide ticket id allocator. The counter file can be set with the
+    TICKET_ID_PATH environment variable (default DEFAULT_PATH, in the user's cache directory);
+    an empty TICKET_ID_PATH keeps the counter in this process only.
+    """
+    global _default_allocator
+    if _default_allocator is None:
+        with _default_allocator_lock:
+            if _default_allocator is None:
+                path = os.getenv("TICKET_ID_PATH", DEFAULT_PATH)
+                _default_allocator = IdAllocator(path=path or None)
+    return _default_allocator
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ProcessPoolExecutor
+    # Lease a block in the parent first, so the forked workers must not reuse it
+    get_default_id_allocator().allocate()
+
+    def allocate_many(count):
+        return [get_default_id_allocator().allocate() for _ in range(count)]
+
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        batches = list(pool.map(allocate_many, [5000] * 8))
+    ids = [ticket_id for batch in batches for ticket_id in batch] + allocate_many(5000)
+    print(f"{len(ids)} ids from 9 batches, {len(set(ids))} unique")
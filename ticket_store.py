@@ -0,0 +1,371 @@
+from array import array
+from ticket import Epic, Issue, TicketState, to_state, allocate_ticket_id
+from ticket_history import TicketHistory
+
+# A columnar store for large backlogs. Each ticket is a row in parallel arrays (id, kind, state,
+# epic id and references into a string table for its content), and the rows of every
+# (kind, state) pair and of every epic are kept in index sets, so filters and counts are set
+# operations instead of walks over Python objects. Epic and Issue objects are available as views
+# over a row: every Ticket method works on them and writes through to the store.
+
+KIND_EPIC = 0
+KIND_ISSUE = 1
+KINDS = {"epic": KIND_EPIC, "issue": KIND_ISSUE}
+
+# epic_ids value of an issue without an epic
+NO_EPIC = -1
+# Proposal references: no proposal yet ({}) and a resolved proposal (None)
+EMPTY = -1
+RESOLVED = -2
+# String table index of None
+NONE_STRING = 0
+# states value of a removed row (a tombstone: the row number stays taken, but the row is in no index)
+REMOVED = -1
+
+
+class TicketStore:
+    def __init__(self):
+        self.ids = array("q")
+        self.kinds = array("b")
+        self.states = array("b")
+        self.epic_ids = array("q")
+        # Content columns: string table indexes of the title and body (an epic's content is its title)
+        self.current_titles = array("q")
+        self.current_bodies = array("q")
+        self.proposed_titles = array("q")
+        self.proposed_bodies = array("q")
+        self.strings = [None]
+        # string -> index in strings, so repeated titles and bodies share one entry
+        self.string_indexes = {}
+        # id -> row
+        self.rows = {}
+        # (kind, state) -> rows, epic id -> issue rows
+        self._by_kind_state = {(kind, state): set() for kind in KINDS.values() for state in TicketState}
+        self._by_epic = {}
+        # row -> TicketHistory, for the rows whose content changed
+        self.histories = {}
+        # row -> state change observer of the row's views (see Ticket._transition)
+        self.observers = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _string(self, value) -> int:
+        if value is None:
+            return NONE_STRING
+        index = self.string_indexes.get(value)
+        if index is None:
+            index = self.string_indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def _append(self, ticket_id, kind, state, epic_id, current, proposed) -> int:
+        row = len(self.ids)
+        self.ids.append(ticket_id)
+        self.kinds.append(kind)
+        self.states.append(state)
+        self.epic_ids.append(NO_EPIC if epic_id is None else epic_id)
+        self.current_titles.append(NONE_STRING)
+        self.current_bodies.append(NONE_STRING)
+        self.proposed_titles.append(EMPTY)
+        self.proposed_bodies.append(EMPTY)
+        self._set_content(row, current, proposed=False)
+        self._set_content(row, proposed, proposed=True)
+        self.rows[ticket_id] = row
+        self._by_kind_state[kind, state].add(row)
+        if epic_id is not None:
+            self._by_epic.setdefault(epic_id, set()).add(row)
+        return row
+
+    def add_epic(self, epic_content, state="APPROVED") -> Epic:
+        """
+        Adds a new epic and returns its view.
+        """
+        row = self._append(allocate_ticket_id(), KIND_EPIC, to_state(state), None, (epic_content,), ())
+        return self.view(row)
+
+    def add_issue(self, current_title, current_body, state="APPROVED", epic_id=None) -> Issue:
+        """
+        Adds a new issue and returns its view.
+        """
+        row = self._append(allocate_ticket_id(), KIND_ISSUE, to_state(state), epic_id, (current_title, current_body), ())
+        return self.view(row)
+
+    def add(self, ticket) -> int:
+        """
+        Copies an existing Epic or Issue into the store, keeping its id, and returns its row.
+        """
+        if ticket.id in self.rows:
+            raise ValueError(f"Ticket with ID {ticket.id} already exists in the store")
+        kind = KIND_EPIC if isinstance(ticket, Epic) else KIND_ISSUE
+        epic_id = getattr(ticket, "epic_id", None)
+        return self._append(ticket.id, kind, ticket.state, epic_id, ticket._current, ticket._proposed)
+
+    @classmethod
+    def from_tickets(cls, tickets) -> "TicketStore":
+        store = cls()
+        for ticket in tickets:
+            store.add(ticket)
+        return store
+
+    # Row accessors used by the views
+
+    def _get_content(self, row, proposed):
+        titles, bodies = (self.proposed_titles, self.proposed_bodies) if proposed else (self.current_titles, self.current_bodies)
+        title = titles[row]
+        if title == RESOLVED:
+            return None
+        if title == EMPTY:
+            return ()
+        if self.kinds[row] == KIND_EPIC:
+            return (self.strings[title],)
+        return (self.strings[title], self.strings[bodies[row]])
+
+    def _set_content(self, row, values, proposed):
+        titles, bodies = (self.proposed_titles, self.proposed_bodies) if proposed else (self.current_titles, self.current_bodies)
+        if values is None:
+            titles[row] = bodies[row] = RESOLVED
+        elif not values:
+            titles[row] = bodies[row] = EMPTY
+        else:
+            titles[row] = self._string(values[0])
+            bodies[row] = self._string(values[1]) if len(values) > 1 else NONE_STRING
+
+    def _get_history(self, row) -> TicketHistory:
+        history = self.histories.get(row)
+        if history is None:
+            fields = Epic._fields if self.kinds[row] == KIND_EPIC else Issue._fields
+            history = self.histories[row] = TicketHistory(fields, self._get_content(row, proposed=False))
+        return history
+
+    def _set_state(self, row, state) -> None:
+        if self.states[row] == REMOVED:
+            # A view left over from before the removal must not put the row back into the indexes
+            return
+        kind = self.kinds[row]
+        self._by_kind_state[kind, self.states[row]].discard(row)
+        self._by_kind_state[kind, state].add(row)
+        self.states[row] = state
+
+    def _notify(self, row, previous_state) -> None:
+        # Bulk transitions bypass the views, so their observers are called here
+        observer = self.observers.get(row)
+        if observer is not None:
+            view = self.view(row)
+            observer(view, to_state(previous_state), view.epic_id if self.kinds[row] == KIND_ISSUE else None)
+
+    def _set_epic_id(self, row, epic_id) -> None:
+        if self.states[row] == REMOVED:
+            return
+        previous = self.epic_ids[row]
+        if previous != NO_EPIC:
+            self._by_epic[previous].discard(row)
+        self.epic_ids[row] = NO_EPIC if epic_id is None else epic_id
+        if epic_id is not None:
+            self._by_epic.setdefault(epic_id, set()).add(row)
+
+    # Queries
+
+    def select(self, kind=None, state=None, epic_id=None) -> set[int]:
+        """
+        Returns the rows matching every given filter.
+
+        Args:
+            kind (str): "epic" or "issue".
+            state (str | TicketState): The ticket state.
+            epic_id (int): The epic the issues belong to.
+
+        Returns:
+            set[int]: The matching rows.
+        """
+        kinds = tuple(KINDS.values()) if kind is None else (KINDS[kind],)
+        states = tuple(TicketState) if state is None else (to_state(state),)
+        if epic_id is not None:
+            # An epic's rows are usually the smallest set, so they are filtered through the columns
+            rows = self._by_epic.get(epic_id, ())
+            if kind is None and state is None:
+                return set(rows)
+            return {row for row in rows if self.states[row] in states and self.kinds[row] in kinds}
+        if kind is None and state is None:
+            return set(self.rows.values())
+        return set().union(*(self._by_kind_state[k, s] for k in kinds for s in states))
+
+    def count_by_state(self, kind=None) -> dict:
+        """
+        Returns the number of tickets in each state, optionally for one kind only.
+        """
+        kinds = KINDS.values() if kind is None else (KINDS[kind],)
+        return {state.name: sum(len(self._by_kind_state[k, state]) for k in kinds) for state in TicketState}
+
+    def view(self, row) -> Epic | Issue:
+        """
+        Returns an Epic or Issue view over row.
+        """
+        view_class = StoredEpic if self.kinds[row] == KIND_EPIC else StoredIssue
+        view = object.__new__(view_class)
+        view._store = self
+        view._row = row
+        return view
+
+    def get(self, ticket_id) -> Epic | Issue:
+        return self.view(self.rows[ticket_id])
+
+    def views(self, rows) -> list:
+        return [self.view(row) for row in sorted(rows)]
+
+    # Bulk transitions
+
+    def accept(self, rows) -> int:
+        """
+        Accepts the pending proposals of rows: UPDATE and ADD rows take their proposed content and
+        become APPROVED; DELETE rows are removed from the store. Approved and removed rows are left
+        unchanged, so accepting the same rows twice is harmless.
+
+        Returns:
+            int: The number of proposals accepted.
+        """
+        accepted = 0
+        for row in rows:
+            state = self.states[row]
+            if state == TicketState.UPDATE or state == TicketState.ADD:
+                self._get_history(row).append(self._get_content(row, proposed=True), "accept")
+                self.current_titles[row] = self.proposed_titles[row]
+                self.current_bodies[row] = self.proposed_bodies[row]
+                self.proposed_titles[row] = self.proposed_bodies[row] = RESOLVED
+                self._set_state(row, TicketState.APPROVED)
+                self._notify(row, state)
+            elif state == TicketState.DELETE:
+                self.remove(row)
+            else:
+                continue
+            accepted += 1
+        return accepted
+
+    def reject(self, rows) -> int:
+        """
+        Rejects the pending proposals of rows, which become APPROVED with their current content.
+        Approved and removed rows are left unchanged.
+
+        Returns:
+            int: The number of proposals rejected.
+        """
+        rejected = 0
+        for row in rows:
+            state = self.states[row]
+            if state != TicketState.APPROVED and state != REMOVED:
+                self.proposed_titles[row] = self.proposed_bodies[row] = RESOLVED
+                self._set_state(row, TicketState.APPROVED)
+                self._notify(row, state)
+                rejected += 1
+        return rejected
+
+    def remove(self, row) -> None:
+        """
+        Removes a row from the indexes and drops its history and observer. Its columns are kept, so
+        other row numbers stay valid, and its state becomes REMOVED; removing a row twice is a no-op.
+        """
+        state = self.states[row]
+        if state == REMOVED:
+            return
+        del self.rows[self.ids[row]]
+        self._by_kind_state[self.kinds[row], state].discard(row)
+        if self.epic_ids[row] != NO_EPIC:
+            self._by_epic[self.epic_ids[row]].discard(row)
+        self.states[row] = REMOVED
+        self.histories.pop(row, None)
+        self.observers.pop(row, None)
+
+
+class _StoredTicket:
+    """
+    Replaces the attributes of a Ticket with properties reading and writing a TicketStore row.
+    """
+    __slots__ = ()
+
+    @property
+    def id(self):
+        return self._store.ids[self._row]
+
+    @property
+    def _state(self):
+        state = self._store.states[self._row]
+        # A removed row was an accepted deletion, so its leftover views read as DELETE
+        return TicketState.DELETE if state == REMOVED else to_state(state)
+
+    @_state.setter
+    def _state(self, state):
+        self._store._set_state(self._row, state)
+
+    @property
+    def _current(self):
+        return self._store._get_content(self._row, proposed=False)
+
+    @_current.setter
+    def _current(self, values):
+        self._store._set_content(self._row, values, proposed=False)
+
+    @property
+    def _proposed(self):
+        return self._store._get_content(self._row, proposed=True)
+
+    @_proposed.setter
+    def _proposed(self, values):
+        self._store._set_content(self._row, values, proposed=True)
+
+    @property
+    def _history(self):
+        return self._store.histories.get(self._row)
+
+    @_history.setter
+    def _history(self, history):
+        if self._store.states[self._row] != REMOVED:
+            self._store.histories[self._row] = history
+
+    @property
+    def _observer(self):
+        return self._store.observers.get(self._row)
+
+    @_observer.setter
+    def _observer(self, observer):
+        if observer is None or self._store.states[self._row] == REMOVED:
+            self._store.observers.pop(self._row, None)
+        else:
+            self._store.observers[self._row] = observer
+
+
+class StoredEpic(_StoredTicket, Epic):
+    __slots__ = ("_store", "_row")
+
+
+class StoredIssue(_StoredTicket, Issue):
+    __slots__ = ("_store", "_row")
+
+    @property
+    def _epic_id(self):
+        epic_id = self._store.epic_ids[self._row]
+        return None if epic_id == NO_EPIC else epic_id
+
+    @_epic_id.setter
+    def _epic_id(self, epic_id):
+        self._store._set_epic_id(self._row, epic_id)
+
+
+if __name__ == "__main__":
+    import time
+    store = TicketStore()
+    started = time.perf_counter()
+    for index in range(1_000_000):
+        issue = store.add_issue(f"Issue {index}", f"Body {index}", epic_id=index % 1000)
+        if index % 3 == 0:
+            issue.propose_update(f"Updated {index}", f"Updated body {index}")
+    print(f"Loaded {len(store)} issues in {time.perf_counter() - started:.1f} s")
+
+    started = time.perf_counter()
+    counts = store.count_by_state("issue")
+    rows = store.select(kind="issue", state="UPDATE", epic_id=7)
+    print(f"Queried in {(time.perf_counter() - started) * 1000:.2f} ms: {counts}, {len(rows)} UPDATE issues under epic 7")
+
+    started = time.perf_counter()
+    accepted = store.accept(rows)
+    print(f"Accepted {accepted} proposals in {(time.perf_counter() - started) * 1000:.2f} ms")
+    print(store.view(min(rows)))
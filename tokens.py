@@ -0,0 +1,12 @@
+# Helpers for estimating how many tokens a piece of text will cost.
+# A character-based heuristic is used so no tokenizer dependency is required.
+
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text) -> int:
+    """
+    Estimates the number of tokens in text (roughly four characters per token for English).
+    """
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import functools
+from collections import deque
+
+# Lightweight tracing spans for the pipeline stages (prompting, repository reading, parsing,
+# approvals and GitHub calls). Each span records wall time, token counts and an estimated cost.
+# Tracing is off unless AGILITY_TRACING is set or tracer.enable() is called; when it is off,
+# span() hands back a shared no-op span and traced functions call straight through.
+
+# USD per one million tokens: (prompt, completion)
+MODEL_PRICING = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def estimate_cost(model_name, prompt_tokens, completion_tokens) -> float:
+    # The API reports dated snapshots (e.g. gpt-4o-2024-08-06), so match on the longest known prefix
+    prices = [(len(name), price) for name, price in MODEL_PRICING.items() if model_name and model_name.startswith(name)]
+    prompt_price, completion_price = max(prices)[1] if prices else (0.0, 0.0)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class Span:
+    """
+    A single timed operation.
+    """
+    __slots__ = ("name", "start", "duration", "prompt_tokens", "completion_tokens", "cost", "attributes", "_tracer")
+
+    def __init__(self, tracer, name, attributes):
+        self._tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.start = 0.0
+        self.duration = 0.0
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def record_usage(self, model_name, prompt_tokens, completion_tokens) -> None:
+        self.prompt_tokens += prompt_tokens or 0
+        self.completion_tokens += completion_tokens or 0
+        self.cost += estimate_cost(model_name, prompt_tokens or 0, completion_tokens or 0)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self._tracer._spans.append(self)
+        return False
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "duration_ms": self.duration * 1000.0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": self.cost,
+            **self.attributes,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def record_usage(self, model_name, prompt_tokens, completion_tokens) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Collects finished spans in a bounded buffer and exports them.
+    """
+    def __init__(self, enabled=False, max_spans=100_000):
+        self.enabled = enabled
+        self._spans = deque(maxlen=max_spans)
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def set_max_spans(self, max_spans) -> None:
+        self._spans = deque(self._spans, maxlen=max_spans)
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def spans(self) -> list[Span]:
+        return list(self._spans)
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+    def export_jsonl(self, file=None) -> None:
+        """
+        Writes one JSON object per finished span to file (a path or a writable file object).
+        """
+        if file is None:
+            file = sys.stdout
+        if isinstance(file, str):
+            with open(file, "a", encoding="utf-8") as f:
+                self.export_jsonl(f)
+            return
+        for span in list(self._spans):
+            file.write(json.dumps(span.as_dict(), default=str) + "\n")
+
+    def export_prometheus(self) -> str:
+        """
+        Returns the spans aggregated per span name in the Prometheus text exposition format.
+        """
+        totals = {}
+        for span in list(self._spans):
+            total = totals.setdefault(span.name, [0, 0.0, 0, 0, 0.0])
+            total[0] += 1
+            total[1] += span.duration
+            total[2] += span.prompt_tokens
+            total[3] += span.completion_tokens
+            total[4] += span.cost
+
+        metrics = [
+            ("agility_span_duration_seconds", "summary", "Wall time spent in each pipeline stage."),
+            ("agility_span_prompt_tokens_total", "counter", "Prompt tokens sent per pipeline stage."),
+            ("agility_span_completion_tokens_total", "counter", "Completion tokens received per pipeline stage."),
+            ("agility_span_cost_usd_total", "counter", "Estimated cost in USD per pipeline stage."),
+        ]
+        lines = []
+        for index, (metric, kind, help_text) in enumerate(metrics):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, total in sorted(totals.items()):
+                label = f'{{span="{name}"}}'
+                if index == 0:
+                    lines.append(f"{metric}_count{label} {total[0]}")
+                    lines.append(f"{metric}_sum{label} {total[1]:.6f}")
+                else:
+                    lines.append(f"{metric}{label} {total[index + 1]}")
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer(enabled=os.getenv("AGILITY_TRACING", "").lower() in ("1", "true", "yes"))
+
+
+def traced(name):
+    """
+    Decorator that wraps every call of the function in a span called name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if __name__ == "__main__":
+    tracer.enable()
+    with tracer.span("model.prompt", model="gpt-4o") as span:
+        span.record_usage("gpt-4o", 1200, 300)
+    print(tracer.export_prometheus())
+    tracer.export_jsonl()